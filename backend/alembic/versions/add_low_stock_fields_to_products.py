@@ -0,0 +1,42 @@
+"""Add per-product low stock threshold and alert state
+
+Revision ID: add_low_stock_fields
+Revises: add_version_field
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "add_low_stock_fields"
+down_revision: Union[str, Sequence[str], None] = "add_version_field"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NULL threshold means the global default
+    op.add_column(
+        "products",
+        sa.Column("low_stock_threshold", sa.Integer(), nullable=True),
+    )
+    # Existing products start armed, so the next crossing alerts once
+    op.add_column(
+        "products",
+        sa.Column(
+            "low_stock_armed",
+            sa.Boolean(),
+            nullable=False,
+            server_default=sa.true(),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("products", "low_stock_armed")
+    op.drop_column("products", "low_stock_threshold")
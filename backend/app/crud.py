@@ -12,8 +12,10 @@ import logging
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 logger = logging.getLogger(__name__)
 
-# ✅ Low stock threshold
+# ✅ Low stock threshold, unless a product sets its own
 LOW_STOCK_THRESHOLD = 5
+# Alerts re-arm once stock is back above this multiple of the threshold
+LOW_STOCK_REARM_FACTOR = 2
 
 
 # ---------- AUTH ----------
@@ -41,6 +43,7 @@ def create_product(db: Session, product: schemas.ProductCreate):
         price=product.price,
         image_url=product.image_url,
         stock=product.stock,
+        low_stock_threshold=product.low_stock_threshold,
     )
     db.add(db_product)
     db.commit()
@@ -56,32 +59,56 @@ def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
 
 
-# ✅ ENHANCED: Check for low stock after update
-def send_low_stock_alert_if_needed(db: Session, product: models.Product):
-    """Send low stock alert if product stock is below threshold"""
-    try:
-        if product.stock <= LOW_STOCK_THRESHOLD:
-            logger.info(
-                f"🚨 Low stock detected for {product.name}: {product.stock} units"
-            )
+# ✅ Edge-triggered low stock alerts
+def low_stock_threshold(product: models.Product) -> int:
+    if product.low_stock_threshold is None:
+        return LOW_STOCK_THRESHOLD
+    return product.low_stock_threshold
 
-            # Send product event for low stock alert
-            event_producer.send_product_event(
-                {
-                    "event": "low_stock_detected",
-                    "product_id": str(product.id),
-                    "name": product.name,
-                    "stock": product.stock,
-                    "threshold": LOW_STOCK_THRESHOLD,
-                    "description": product.description,
-                    "price": float(product.price),
-                    "timestamp": datetime.now().isoformat(),
-                }
-            )
-            logger.info(f"✅ Low stock alert sent for {product.name}")
 
-    except Exception as e:
-        logger.error(f"❌ Failed to send low stock alert for {product.name}: {e}")
+def low_stock_rearm_level(threshold: int) -> int:
+    """Stock a product must be restocked above before it can alert again"""
+    return max(threshold * LOW_STOCK_REARM_FACTOR, threshold + 1)
+
+
+def check_low_stock(product: models.Product, old_stock: int, new_stock: int):
+    """Returns (armed, alert) for a stock change from old_stock to new_stock.
+
+    An armed product alerts once when its stock crosses its threshold from
+    above and is disarmed; it re-arms only after a restock above the rearm
+    level, so stock hovering around the threshold does not alert on every
+    order. Changes that stay at or below the threshold (a small restock, a
+    product created low) do not alert. Running out completely alerts once
+    more.
+    """
+    threshold = low_stock_threshold(product)
+    armed = product.low_stock_armed is not False
+    if armed and old_stock > threshold >= new_stock:
+        return False, True
+    if not armed and new_stock > low_stock_rearm_level(threshold):
+        return True, False
+    return armed, new_stock <= 0 < old_stock
+
+
+def send_low_stock_alert(product: models.Product, stock: int):
+    """Publish a low stock event without blocking the request on Kafka"""
+    threshold = low_stock_threshold(product)
+    logger.info(f"🚨 Low stock detected for {product.name}: {stock} units")
+    # Built here: the product is detached once the session closes
+    event_producer.send_in_background(
+        "products",
+        {
+            "event": "low_stock_detected",
+            "product_id": str(product.id),
+            "name": product.name,
+            "stock": stock,
+            "threshold": threshold,
+            "rearm_above": low_stock_rearm_level(threshold),
+            "description": product.description,
+            "price": float(product.price),
+            "timestamp": datetime.now().isoformat(),
+        },
+    )
 
 
 # ✅ ENHANCED: Update product stock with low stock alerts
@@ -110,6 +137,9 @@ def update_product_stock(db: Session, product_id: int, quantity_change: int):
             if new_stock < 0:
                 raise HTTPException(status_code=400, detail="Insufficient stock")
 
+            # The version check makes exactly one writer see each crossing
+            armed, alert = check_low_stock(product, old_stock, new_stock)
+
             # Update with version check
             result = (
                 db.query(models.Product)
@@ -119,7 +149,13 @@ def update_product_stock(db: Session, product_id: int, quantity_change: int):
                         models.Product.version == product.version,
                     )
                 )
-                .update({"stock": new_stock, "version": product.version + 1})
+                .update(
+                    {
+                        "stock": new_stock,
+                        "version": product.version + 1,
+                        "low_stock_armed": armed,
+                    }
+                )
             )
 
             if result == 0:
@@ -134,13 +170,11 @@ def update_product_stock(db: Session, product_id: int, quantity_change: int):
             db.commit()
             db.refresh(product)
 
-            # ✅ NEW: Check for low stock after successful update
-            # Only alert if stock decreased (quantity_change < 0, i.e., order placed)
-            if quantity_change < 0 and product.stock <= LOW_STOCK_THRESHOLD:
+            if alert:
                 logger.info(
-                    f"📉 Stock decreased from {old_stock} to {product.stock} for {product.name}"
+                    f"📉 Stock went from {old_stock} to {new_stock} for {product.name}"
                 )
-                send_low_stock_alert_if_needed(db, product)
+                send_low_stock_alert(product, new_stock)
 
             return product
 
@@ -1,16 +1,38 @@
 from kafka import KafkaProducer, KafkaConsumer
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 
+def partition_key(event_data):
+    """Key events by user so all of a user's events land on the same partition
+    number in every topic, which keeps them on one analytics worker.
+
+    Every event about a user carries its user_id, which wins over the
+    email; the email is only the key of events with no user behind them.
+    """
+    if not isinstance(event_data, dict):
+        return None
+    for field in ("user_id", "customer_email", "email"):
+        value = event_data.get(field)
+        if value not in (None, ""):
+            return str(value).lower()
+    return None
+
+
 class EventProducer:
     def __init__(self):
         self.producer = None
         self.max_retries = 5
         self.retry_delay = 10
+        # One thread keeps background events in the order they were submitted
+        self._background = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="kafka-events"
+        )
         self._initialize_producer()
 
     def _initialize_producer(self):
@@ -20,6 +42,7 @@ class EventProducer:
                 self.producer = KafkaProducer(
                     bootstrap_servers=["kafka:9092"],
                     value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                    key_serializer=lambda k: k.encode("utf-8") if k else None,
                     request_timeout_ms=30000,
                     metadata_max_age_ms=30000,
                     api_version=(0, 10, 1),
@@ -47,8 +70,14 @@ class EventProducer:
             logger.warning(f"⚠️ Kafka producer not available, skipping {topic} event")
             return False
 
+        # A stable id lets consumers drop redeliveries and producer retries
+        if isinstance(event_data, dict) and not event_data.get("event_id"):
+            event_data = {**event_data, "event_id": uuid.uuid4().hex}
+
         try:
-            future = self.producer.send(topic, event_data)
+            future = self.producer.send(
+                topic, event_data, key=partition_key(event_data)
+            )
             # Get the result with shorter timeout
             record_metadata = future.get(timeout=30)
             logger.info(f"✅ Event sent to {topic}: {event_data}")
@@ -73,8 +102,20 @@ class EventProducer:
         """Send payment-related events"""
         return self._send_event("payments", payment_data)
 
+    def send_in_background(self, topic, event_data):
+        """Send an event from a worker thread so the request does not wait
+        for the broker's acknowledgement"""
+        try:
+            return self._background.submit(self._send_event, topic, event_data)
+        except RuntimeError as e:
+            # Executor already shut down
+            logger.error(f"❌ Failed to queue {topic} event: {e}")
+            return None
+
     def close(self):
         """Close the producer connection"""
+        # Let events queued in the background go out first
+        self._background.shutdown(wait=True)
         if self.producer:
             self.producer.close()
             logger.info("🔒 Kafka producer closed")
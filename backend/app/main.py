@@ -2,7 +2,7 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import Response
-from app.routers import auth, product, order, payment, cart, stripe_checkout
+from app.routers import auth, product, order, payment, cart, stripe_checkout, internal
 from dotenv import load_dotenv
 from datetime import datetime
 from prometheus_client import Counter, Histogram, generate_latest
@@ -66,6 +66,7 @@ app.include_router(product.router)
 app.include_router(order.router)
 app.include_router(payment.router)
 app.include_router(cart.router)
+app.include_router(internal.router)
 
 
 @app.get("/")
@@ -25,6 +25,10 @@ class Product(Base):
     stock = Column(Integer, default=0)
     version = Column(Integer, default=1)  # ✅ NEW: For optimistic locking
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())  # ✅ NEW
+    # Falls back to crud.LOW_STOCK_THRESHOLD when NULL
+    low_stock_threshold = Column(Integer, nullable=True)
+    # False once a low-stock alert fired, until the product is restocked
+    low_stock_armed = Column(Boolean, default=True, nullable=False)
 
 
 class CartItem(Base):
@@ -0,0 +1,77 @@
+# backend/app/routers/internal.py - service-to-service endpoints
+import hmac
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app import database, models, schemas
+
+router = APIRouter(prefix="/internal", tags=["Internal"])
+
+# Shared secret for other ShopSphere services; the endpoints are off without it
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+
+def get_db():
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def verify_internal_token(x_internal_token: Optional[str] = Header(None)):
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=503, detail="Internal API disabled")
+    if not x_internal_token or not hmac.compare_digest(
+        x_internal_token, INTERNAL_API_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="Invalid internal token")
+
+
+# ✅ Batched email lookup (notification service user directory misses)
+@router.post(
+    "/users/emails",
+    response_model=schemas.UserEmailsOut,
+    dependencies=[Depends(verify_internal_token)],
+)
+def lookup_user_emails(
+    lookup: schemas.UserEmailLookup, db: Session = Depends(get_db)
+):
+    wanted = set(lookup.user_ids)
+    rows = (
+        db.query(models.User.id, models.User.email)
+        .filter(models.User.id.in_(wanted))
+        .all()
+    )
+    found = {row.id for row in rows}
+    return {
+        "users": [{"id": row.id, "email": row.email} for row in rows],
+        "missing": sorted(wanted - found),
+    }
+
+
+# ✅ Keyset-paginated export of all user emails (bulk directory load)
+@router.get(
+    "/users/emails",
+    response_model=schemas.UserEmailsOut,
+    dependencies=[Depends(verify_internal_token)],
+)
+def export_user_emails(
+    after_id: int = 0,
+    limit: int = Query(5000, ge=1, le=20000),
+    db: Session = Depends(get_db),
+):
+    rows = (
+        db.query(models.User.id, models.User.email)
+        .filter(models.User.id > after_id)
+        .order_by(models.User.id)
+        .limit(limit)
+        .all()
+    )
+    return {
+        "users": [{"id": row.id, "email": row.email} for row in rows],
+        "next_after_id": rows[-1].id if len(rows) == limit else None,
+    }
@@ -84,10 +84,19 @@ def update_product(
     db_product.price = product.price
     db_product.image_url = product.image_url
     db_product.stock = product.stock
+    db_product.low_stock_threshold = product.low_stock_threshold
+
+    # A restock re-arms low stock alerts; setting stock to or below the
+    # threshold fires one like an order would
+    armed, alert = crud.check_low_stock(db_product, old_stock, product.stock)
+    db_product.low_stock_armed = armed
 
     db.commit()
     db.refresh(db_product)
 
+    if alert:
+        crud.send_low_stock_alert(db_product, db_product.stock)
+
     # 🔥 Send Kafka event for product update
     event_producer.send_product_event(
         {
@@ -1,11 +1,12 @@
 # app/routers/stripe_checkout.py
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, Request
 from pydantic import BaseModel
 from starlette.responses import JSONResponse
 import os
 from dotenv import load_dotenv
 import traceback
 from app.events import event_producer  # Add this import
+from app.routers.auth import get_current_user
 from datetime import datetime  # Add this import
 
 # Import stripe properly
@@ -49,7 +50,9 @@ class CheckoutRequest(BaseModel):
 
 
 @router.post("/create-checkout-session")
-def create_checkout_session(data: CheckoutRequest):
+def create_checkout_session(
+    data: CheckoutRequest, user_id: int = Depends(get_current_user)
+):
     try:
         if not stripe:
             return JSONResponse(
@@ -92,6 +95,7 @@ def create_checkout_session(data: CheckoutRequest):
             {
                 "event": "checkout_session_created",
                 "session_id": session.id,
+                "user_id": str(user_id),
                 "customer_email": data.email,
                 "total_amount": total_amount,
                 "currency": "inr",
@@ -119,6 +123,7 @@ def create_checkout_session(data: CheckoutRequest):
         event_producer.send_order_event(
             {
                 "event": "checkout_session_failed",
+                "user_id": str(user_id),
                 "customer_email": data.email,
                 "error": str(e),
                 "timestamp": datetime.now().isoformat(),
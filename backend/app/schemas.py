@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from pydantic import BaseModel
 from typing import List, Optional
@@ -33,6 +33,7 @@ class ProductCreate(BaseModel):
     price: float
     image_url: Optional[str] = None
     stock: int = 0  # ✅ NEW
+    low_stock_threshold: Optional[int] = Field(None, ge=0)
 
 class OrderItemCreate(BaseModel):
     product_id: int
@@ -52,6 +53,7 @@ class ProductOut(BaseModel):
     price: float
     image_url: Optional[str]
     stock: int  # ✅ NEW
+    low_stock_threshold: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -95,3 +97,18 @@ class CartItemOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class UserEmailLookup(BaseModel):
+    user_ids: List[int] = Field(..., max_length=1000)
+
+
+class UserEmail(BaseModel):
+    id: int
+    email: str
+
+
+class UserEmailsOut(BaseModel):
+    users: List[UserEmail]
+    missing: List[int] = []
+    next_after_id: Optional[int] = None
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from kafka.partitioner import DefaultPartitioner
+
+from app.events import partition_key
+from app.main import app
+from app.routers import stripe_checkout
+from app.routers.auth import get_current_user
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def checkout_events(monkeypatch):
+    sent = []
+    session = SimpleNamespace(id="cs_test_1", url="https://checkout.test/cs_test_1")
+    monkeypatch.setattr(
+        stripe_checkout.stripe.checkout.Session, "create", lambda **kw: session
+    )
+    monkeypatch.setattr(
+        stripe_checkout.event_producer, "send_order_event", sent.append
+    )
+    app.dependency_overrides[get_current_user] = lambda: 7
+    yield sent
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def partition(event, partitions=12):
+    key = partition_key(event).encode("utf-8")
+    ids = list(range(partitions))
+    return DefaultPartitioner()(key, ids, ids)
+
+
+def test_checkout_event_lands_on_the_users_partition(checkout_events):
+    response = client.post(
+        "/create-checkout-session",
+        json={
+            "email": "Shopper@Example.com",
+            "items": [{"id": 1, "name": "Widget", "price": 10.0, "quantity": 2}],
+        },
+    )
+    assert response.status_code == 200
+    [checkout] = checkout_events
+    user_events = [
+        {"event": "user_logged_in", "user_id": "7", "email": "shopper@example.com"},
+        {"event": "cart_item_added", "user_id": "7", "product_id": "3"},
+        {"event": "order_created", "user_id": "7", "user_email": "other@example.com"},
+    ]
+    assert {partition_key(e) for e in user_events + [checkout]} == {"7"}
+    assert {partition(e) for e in user_events + [checkout]} == {partition(checkout)}
+
+
+def test_checkout_requires_a_signed_in_user():
+    response = client.post(
+        "/create-checkout-session", json={"email": "a@b.c", "items": []}
+    )
+    assert response.status_code == 401
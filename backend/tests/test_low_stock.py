@@ -0,0 +1,55 @@
+from app import crud, models
+
+
+def make_product(threshold=5, armed=True):
+    return models.Product(
+        name="Widget", stock=20, low_stock_threshold=threshold, low_stock_armed=armed
+    )
+
+
+def test_alerts_when_stock_crosses_the_threshold():
+    product = make_product()
+    assert crud.check_low_stock(product, 6, 5) == (False, True)
+    assert crud.check_low_stock(product, 20, 1) == (False, True)
+
+
+def test_no_alert_above_the_threshold():
+    product = make_product()
+    assert crud.check_low_stock(product, 20, 6) == (True, False)
+
+
+def test_no_alert_without_crossing_the_threshold():
+    product = make_product()
+    # Restocked a little, still low
+    assert crud.check_low_stock(product, 2, 3) == (True, False)
+    # Created below the threshold, then sold
+    assert crud.check_low_stock(product, 3, 2) == (True, False)
+
+
+def test_disarmed_product_does_not_alert_again_until_restocked():
+    product = make_product(armed=False)
+    assert crud.check_low_stock(product, 5, 4) == (False, False)
+    # Back above the threshold but not above the rearm level (10)
+    assert crud.check_low_stock(product, 4, 10) == (False, False)
+    assert crud.check_low_stock(product, 10, 4) == (False, False)
+
+
+def test_restock_above_rearm_level_rearms():
+    product = make_product(armed=False)
+    assert crud.low_stock_rearm_level(5) == 10
+    assert crud.check_low_stock(product, 4, 11) == (True, False)
+    product.low_stock_armed = True
+    assert crud.check_low_stock(product, 11, 5) == (False, True)
+
+
+def test_selling_out_alerts_once_more():
+    product = make_product(armed=False)
+    assert crud.check_low_stock(product, 2, 0) == (False, True)
+    assert crud.check_low_stock(product, 0, 0) == (False, False)
+
+
+def test_default_threshold_applies_when_unset():
+    product = make_product(threshold=None)
+    threshold = crud.LOW_STOCK_THRESHOLD
+    assert crud.low_stock_threshold(product) == threshold
+    assert crud.check_low_stock(product, threshold + 1, threshold) == (False, True)
@@ -1,5 +1,12 @@
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
 from app.main import app
+from app.routers import internal
 
 client = TestClient(app)
 
@@ -46,3 +53,77 @@ def test_openapi_json():
     assert "components" in data
     assert "securitySchemes" in data["components"]
     assert "BearerAuth" in data["components"]["securitySchemes"]
+
+
+@pytest.fixture
+def internal_users(monkeypatch):
+    """Internal API on with a known token, over an in-memory users table"""
+    monkeypatch.setattr(internal, "INTERNAL_API_TOKEN", "secret")
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    models.User.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add_all(
+            models.User(id=i, email=f"user{i}@example.com", password="x")
+            for i in range(1, 6)
+        )
+        db.commit()
+
+    def get_test_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[internal.get_db] = get_test_db
+    yield
+    app.dependency_overrides.pop(internal.get_db, None)
+
+
+def test_internal_user_emails_disabled_without_token(monkeypatch):
+    monkeypatch.setattr(internal, "INTERNAL_API_TOKEN", "")
+    response = client.post(
+        "/internal/users/emails",
+        json={"user_ids": [1]},
+        headers={"X-Internal-Token": "secret"},
+    )
+    assert response.status_code == 503
+
+
+def test_internal_user_emails_requires_token(internal_users):
+    response = client.post("/internal/users/emails", json={"user_ids": [1]})
+    assert response.status_code == 403
+    response = client.post(
+        "/internal/users/emails",
+        json={"user_ids": [1]},
+        headers={"X-Internal-Token": "wrong"},
+    )
+    assert response.status_code == 403
+    response = client.post(
+        "/internal/users/emails",
+        json={"user_ids": [1, 99]},
+        headers={"X-Internal-Token": "secret"},
+    )
+    assert response.status_code == 200
+    assert response.json()["users"] == [{"id": 1, "email": "user1@example.com"}]
+    assert response.json()["missing"] == [99]
+
+
+def test_internal_user_emails_export_pages(internal_users):
+    headers = {"X-Internal-Token": "secret"}
+    pages, after_id = [], 0
+    while after_id is not None:
+        response = client.get(
+            f"/internal/users/emails?after_id={after_id}&limit=2", headers=headers
+        )
+        assert response.status_code == 200
+        page = response.json()
+        pages.append([user["id"] for user in page["users"]])
+        after_id = page["next_after_id"]
+    assert pages == [[1, 2], [3, 4], [5]]
+
+    response = client.get("/internal/users/emails?limit=2")
+    assert response.status_code == 403
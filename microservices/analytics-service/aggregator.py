@@ -0,0 +1,362 @@
+# microservices/analytics-service/aggregator.py
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Set, Tuple
+
+from tdigest import TDigest
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaBuffer:
+    """One generation of buffered deltas, swapped out wholesale on flush"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.float_sums: Dict[str, float] = defaultdict(float)
+        self.hash_counters: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.hash_float_sums: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.sorted_set_increments: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.hyperloglog_members: Dict[str, Set[str]] = defaultdict(set)
+        self.digests: Dict[str, TDigest] = {}
+        self.hash_sets: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self.hash_deletes: Dict[str, Set[str]] = defaultdict(set)
+        self.expirations: Dict[str, int] = {}
+        self.offsets: Dict[Tuple[str, int], int] = {}
+        self.event_ids: Set[str] = set()
+        self.pending_events = 0
+
+    def is_empty(self) -> bool:
+        return not (
+            self.pending_events
+            or self.counters
+            or self.float_sums
+            or self.hash_counters
+            or self.hash_float_sums
+            or self.sorted_set_increments
+            or self.hyperloglog_members
+            or self.digests
+            or self.hash_sets
+            or self.hash_deletes
+        )
+
+    def queue_commands(self, pipe, offsets_key: str, deduplicator=None) -> int:
+        """Queue buffered deltas on `pipe` and return the number of commands"""
+        commands = 0
+        for key, amount in self.counters.items():
+            if amount:
+                pipe.incrby(key, amount)
+                commands += 1
+        for key, amount in self.float_sums.items():
+            if amount:
+                pipe.incrbyfloat(key, amount)
+                commands += 1
+        for (key, field), amount in self.hash_counters.items():
+            if amount:
+                pipe.hincrby(key, field, amount)
+                commands += 1
+        for (key, field), amount in self.hash_float_sums.items():
+            if amount:
+                pipe.hincrbyfloat(key, field, amount)
+                commands += 1
+        for (key, member), amount in self.sorted_set_increments.items():
+            if amount:
+                pipe.zincrby(key, amount, member)
+                commands += 1
+        for key, members in self.hyperloglog_members.items():
+            if members:
+                pipe.pfadd(key, *members)
+                commands += 1
+        # Each flush appends one partial digest; readers merge the parts
+        for key, digest in self.digests.items():
+            pipe.rpush(key, digest.serialize())
+            commands += 1
+        for key, fields in self.hash_deletes.items():
+            if fields:
+                pipe.hdel(key, *fields)
+                commands += 1
+        for key, mapping in self.hash_sets.items():
+            if mapping:
+                pipe.hset(key, mapping=mapping)
+                commands += 1
+        # TTLs go last so they apply to keys created by this flush
+        for key, ttl in self.expirations.items():
+            pipe.expire(key, ttl)
+            commands += 1
+        if self.offsets:
+            pipe.hset(
+                offsets_key,
+                mapping={
+                    f"{topic}:{partition}": offset
+                    for (topic, partition), offset in self.offsets.items()
+                },
+            )
+            commands += 1
+        # Processed event ids become visible together with their deltas
+        if deduplicator is not None and self.event_ids:
+            commands += deduplicator.queue_marks(pipe, self.event_ids)
+        return commands
+
+    def merge(self, older: "DeltaBuffer"):
+        """Fold the deltas of a failed flush back into this (newer) buffer"""
+        for key, amount in older.counters.items():
+            self.counters[key] += amount
+        for key, amount in older.float_sums.items():
+            self.float_sums[key] += amount
+        for key, amount in older.hash_counters.items():
+            self.hash_counters[key] += amount
+        for key, amount in older.hash_float_sums.items():
+            self.hash_float_sums[key] += amount
+        for key, amount in older.sorted_set_increments.items():
+            self.sorted_set_increments[key] += amount
+        for key, members in older.hyperloglog_members.items():
+            self.hyperloglog_members[key] |= members
+        for key, digest in older.digests.items():
+            if key in self.digests:
+                self.digests[key].merge(digest)
+            else:
+                self.digests[key] = digest
+        # Field writes recorded after the failed flush are newer and win
+        for key, mapping in older.hash_sets.items():
+            for field, value in mapping.items():
+                if field not in self.hash_sets[key] and field not in self.hash_deletes[key]:
+                    self.hash_sets[key][field] = value
+        for key, fields in older.hash_deletes.items():
+            for field in fields:
+                if field not in self.hash_sets[key]:
+                    self.hash_deletes[key].add(field)
+        for key, ttl in older.expirations.items():
+            self.expirations.setdefault(key, ttl)
+        for tp, offset in older.offsets.items():
+            self.offsets[tp] = max(offset, self.offsets.get(tp, offset))
+        self.event_ids |= older.event_ids
+        self.pending_events += older.pending_events
+
+    def absorb(self, newer: "DeltaBuffer"):
+        """Fold the deltas of a completed event transaction into this buffer"""
+        for key, amount in newer.counters.items():
+            self.counters[key] += amount
+        for key, amount in newer.float_sums.items():
+            self.float_sums[key] += amount
+        for key, amount in newer.hash_counters.items():
+            self.hash_counters[key] += amount
+        for key, amount in newer.hash_float_sums.items():
+            self.hash_float_sums[key] += amount
+        for key, amount in newer.sorted_set_increments.items():
+            self.sorted_set_increments[key] += amount
+        for key, members in newer.hyperloglog_members.items():
+            self.hyperloglog_members[key] |= members
+        for key, digest in newer.digests.items():
+            if key in self.digests:
+                self.digests[key].merge(digest)
+            else:
+                self.digests[key] = digest
+        for key, fields in newer.hash_deletes.items():
+            for field in fields:
+                self.hash_sets[key].pop(field, None)
+                self.hash_deletes[key].add(field)
+        for key, mapping in newer.hash_sets.items():
+            for field, value in mapping.items():
+                self.hash_deletes[key].discard(field)
+                self.hash_sets[key][field] = value
+        self.expirations.update(newer.expirations)
+        for tp, offset in newer.offsets.items():
+            self.offsets[tp] = max(offset, self.offsets.get(tp, offset))
+        self.event_ids |= newer.event_ids
+        self.pending_events += newer.pending_events
+
+
+class MetricsAggregator:
+    """Accumulates metric deltas in process and writes them to Redis in one pipeline.
+
+    Event handlers record deltas here instead of talking to Redis directly. A
+    flush applies every buffered delta together with the consumed Kafka offsets
+    in a single MULTI/EXEC, so Redis never holds counters for events whose
+    offsets were not recorded (and vice versa).
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        flush_interval_ms: int = 1000,
+        flush_max_events: int = 500,
+        offsets_key: str = "analytics:consumer:offsets",
+        digest_compression: float = 200.0,
+        deduplicator=None,
+    ):
+        self.redis_client = redis_client
+        self.deduplicator = deduplicator
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_max_events = flush_max_events
+        self.offsets_key = offsets_key
+        self.digest_compression = digest_compression
+        self.last_flushed_digests: Set[str] = set()
+        self._lock = threading.RLock()
+        self.buffer = DeltaBuffer()
+        self.last_flush = time.monotonic()
+        self.stats = {"flushes": 0, "events": 0, "redis_commands": 0}
+
+    def atomic(self) -> threading.RLock:
+        """Hold while recording one event's deltas and offset, so no flush
+        from another thread can split them"""
+        return self._lock
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Record one event's deltas all-or-nothing.
+
+        Deltas go to a scratch buffer that is folded in on success and dropped
+        if the block raises, so a handler failing halfway leaves no partial
+        counts behind - and replaying it later does not double count.
+        """
+        with self._lock:
+            outer, self.buffer = self.buffer, DeltaBuffer()
+            try:
+                yield
+            except BaseException:
+                self.buffer = outer
+                raise
+            scratch, self.buffer = self.buffer, outer
+            outer.absorb(scratch)
+
+    # ----- recording -----
+    def incr(self, key: str, amount: int = 1):
+        with self._lock:
+            self.buffer.counters[key] += amount
+
+    def incrbyfloat(self, key: str, amount: float):
+        with self._lock:
+            self.buffer.float_sums[key] += amount
+
+    def hincrby(self, key: str, field: str, amount: int = 1):
+        with self._lock:
+            self.buffer.hash_counters[(key, field)] += amount
+
+    def hincrbyfloat(self, key: str, field: str, amount: float):
+        with self._lock:
+            self.buffer.hash_float_sums[(key, field)] += amount
+
+    def zincrby(self, key: str, member: str, amount: float = 1):
+        with self._lock:
+            self.buffer.sorted_set_increments[(key, member)] += amount
+
+    def pfadd(self, key: str, member: str):
+        with self._lock:
+            self.buffer.hyperloglog_members[key].add(member)
+
+    def add_to_digest(self, key: str, value: float):
+        with self._lock:
+            digest = self.buffer.digests.get(key)
+            if digest is None:
+                digest = self.buffer.digests[key] = TDigest(self.digest_compression)
+            digest.add(value)
+
+    def hset(self, key: str, mapping: Dict[str, str]):
+        with self._lock:
+            for field, value in mapping.items():
+                self.buffer.hash_deletes[key].discard(field)
+                self.buffer.hash_sets[key][field] = value
+
+    def hdel(self, key: str, fields: Set[str]):
+        with self._lock:
+            for field in fields:
+                self.buffer.hash_sets[key].pop(field, None)
+                self.buffer.hash_deletes[key].add(field)
+
+    def expire(self, key: str, ttl_seconds: int):
+        """Refresh the TTL of `key` after the next flush writes to it"""
+        with self._lock:
+            self.buffer.expirations[key] = ttl_seconds
+
+    def record_event_id(self, event_id: str):
+        """Remember a processed event id; it is written with the next flush"""
+        with self._lock:
+            self.buffer.event_ids.add(event_id)
+
+    def is_pending(self, event_id: str) -> bool:
+        """Whether `event_id` was processed but not flushed yet"""
+        with self._lock:
+            return event_id in self.buffer.event_ids
+
+    def mark_offset(self, topic: str, partition: int, next_offset: int):
+        """Record that everything before `next_offset` has been aggregated"""
+        with self._lock:
+            self.buffer.offsets[(topic, partition)] = next_offset
+            self.buffer.pending_events += 1
+
+    # ----- flushing -----
+    def should_flush(self) -> bool:
+        with self._lock:
+            pending = self.buffer.pending_events
+            if not pending:
+                return False
+            if pending >= self.flush_max_events:
+                return True
+            return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def flush(self) -> bool:
+        """Write all buffered deltas to Redis. Returns True if nothing is left pending."""
+        with self._lock:
+            if self.buffer.is_empty():
+                self.last_flush = time.monotonic()
+                return True
+
+            flushing, self.buffer = self.buffer, DeltaBuffer()
+            pipe = self.redis_client.pipeline(transaction=True)
+            commands = flushing.queue_commands(
+                pipe, self.offsets_key, self.deduplicator
+            )
+
+            try:
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"❌ Aggregator flush failed, keeping deltas: {e}")
+                self.buffer.merge(flushing)
+                return False
+
+            self.last_flush = time.monotonic()
+            self.last_flushed_digests = set(flushing.digests)
+            self.stats["flushes"] += 1
+            self.stats["events"] += flushing.pending_events
+            self.stats["redis_commands"] += commands
+            logger.debug(
+                f"💾 Flushed {flushing.pending_events} events as {commands} Redis commands"
+            )
+            return True
+
+    def discard(self) -> int:
+        """Drop every buffered delta; returns the number of events dropped.
+
+        Used when partitions move to another consumer before their deltas could
+        be flushed: the new owner replays them from the offsets in Redis.
+        """
+        with self._lock:
+            dropped = self.buffer.pending_events
+            self.buffer = DeltaBuffer()
+            self.last_flush = time.monotonic()
+            return dropped
+
+    def get_committed_offsets(self) -> Dict[Tuple[str, int], int]:
+        """Offsets recorded by the last successful flush, keyed by (topic, partition)"""
+        offsets = {}
+        for field, value in (self.redis_client.hgetall(self.offsets_key) or {}).items():
+            topic, _, partition = field.rpartition(":")
+            try:
+                offsets[(topic, int(partition))] = int(value)
+            except ValueError:
+                continue
+        return offsets
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending_events"] = self.buffer.pending_events
+            stats["events_per_command"] = (
+                round(stats["events"] / stats["redis_commands"], 2)
+                if stats["redis_commands"]
+                else 0
+            )
+            return stats
@@ -0,0 +1,528 @@
+# microservices/analytics-service/archive.py
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from rollups import parse_timestamp
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# One row per consumed event; the full event is kept as JSON for ad-hoc fields
+EVENTS_SCHEMA = pa.schema(
+    [
+        ("ts", pa.timestamp("ms")),
+        ("event_type", pa.string()),
+        ("event_id", pa.string()),
+        ("user_id", pa.string()),
+        ("order_id", pa.string()),
+        ("product_id", pa.string()),
+        ("quantity", pa.int64()),
+        ("price", pa.float64()),
+        ("total", pa.float64()),
+        ("kafka_partition", pa.int32()),
+        ("kafka_offset", pa.int64()),
+        ("payload", pa.string()),
+    ]
+)
+# One row per order line, for product-level questions
+ITEMS_SCHEMA = pa.schema(
+    [
+        ("ts", pa.timestamp("ms")),
+        ("event_type", pa.string()),
+        ("order_id", pa.string()),
+        ("user_id", pa.string()),
+        ("product_id", pa.string()),
+        ("quantity", pa.int64()),
+        ("price", pa.float64()),
+        ("revenue", pa.float64()),
+    ]
+)
+SCHEMAS = {"events": EVENTS_SCHEMA, "items": ITEMS_SCHEMA}
+
+# <root>/<dataset>/topic=<topic>/hour=<YYYYMMDDHH>/<file>.parquet
+PARTITIONING = ds.partitioning(
+    pa.schema([("topic", pa.string()), ("hour", pa.string())]), flavor="hive"
+)
+HOUR_FORMAT = "%Y%m%d%H"
+STAGING_DIR = "_staging"
+STAGING_SUFFIX = ".arrows"
+
+BUCKETS = ("hour", "day", "week", "month")
+AGGREGATIONS = ("sum", "count", "min", "max", "mean")
+
+
+def _number(value: Any, kind=float) -> Optional[Any]:
+    try:
+        return kind(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value: Any) -> Optional[str]:
+    return None if value in (None, "") else str(value)
+
+
+def _dumps(event: Dict[str, Any]) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(event, default=str).decode()
+        except TypeError:
+            pass
+    return json.dumps(event, separators=(",", ":"), default=str)
+
+
+def event_rows(
+    event: Dict[str, Any],
+    kafka_ts_ms: Optional[int] = None,
+    partition: Optional[int] = None,
+    offset: Optional[int] = None,
+) -> Tuple[datetime, Dict[str, Any], List[Dict[str, Any]]]:
+    """(event time, events row, items rows) for one decoded event"""
+    when = parse_timestamp(event.get("timestamp"))
+    if when is None:
+        when = (
+            datetime.fromtimestamp(kafka_ts_ms / 1000.0)
+            if kafka_ts_ms and kafka_ts_ms > 0
+            else datetime.now()
+        )
+    event_type = _text(event.get("event")) or "unknown"
+    order_id = _text(event.get("order_id"))
+    user_id = _text(event.get("user_id"))
+    row = {
+        "ts": when,
+        "event_type": event_type,
+        "event_id": _text(event.get("event_id")),
+        "user_id": user_id,
+        "order_id": order_id,
+        "product_id": _text(event.get("product_id")),
+        "quantity": _number(event.get("quantity"), int),
+        "price": _number(event.get("price")),
+        "total": _number(event.get("total")),
+        "kafka_partition": partition,
+        "kafka_offset": offset,
+        "payload": _dumps(event),
+    }
+    items = []
+    for item in event.get("items") or []:
+        if not isinstance(item, dict):
+            continue
+        quantity = _number(item.get("quantity"), int)
+        price = _number(item.get("price"))
+        items.append(
+            {
+                "ts": when,
+                "event_type": event_type,
+                "order_id": order_id,
+                "user_id": user_id,
+                "product_id": _text(item.get("product_id")) or "unknown",
+                "quantity": quantity,
+                "price": price,
+                "revenue": (quantity or 0) * price if price is not None else None,
+            }
+        )
+    return when, row, items
+
+
+class _StagedHour:
+    """Arrow IPC stream of one (dataset, topic, hour), appended on every flush.
+
+    The file stays flock()ed while open, so a file nobody holds a lock on
+    belongs to a writer that died and can be recovered.
+    """
+
+    def __init__(self, path: str, schema: pa.Schema):
+        self.path = path
+        self.sink = open(path, "wb")
+        fcntl.flock(self.sink.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.writer = pa.ipc.new_stream(self.sink, schema)
+        self.rows = 0
+        self.last_write = time.monotonic()
+
+    def write(self, batch: pa.RecordBatch):
+        self.writer.write_batch(batch)
+        self.sink.flush()
+        self.rows += batch.num_rows
+        self.last_write = time.monotonic()
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+
+
+class EventArchiver:
+    """Archives consumed events into hour/topic partitioned Parquet files.
+
+    Events are buffered as columns in memory and appended to an Arrow IPC
+    staging file on every `flush()` (called before offsets are committed,
+    so a committed event is on disk). Once an hour is over, or a staging
+    file grows past `max_staged_rows`, it is rewritten as a sorted,
+    zstd-compressed Parquet file in its partition directory.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        roll_grace_s: float = 120.0,
+        max_staged_rows: int = 1_000_000,
+        compression: str = "zstd",
+        row_group_rows: int = 128 * 1024,
+    ):
+        self.root = root
+        self.roll_grace_s = roll_grace_s
+        self.max_staged_rows = max_staged_rows
+        self.compression = compression
+        self.row_group_rows = row_group_rows
+        self.staging_dir = os.path.join(root, STAGING_DIR)
+        self.writer_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.buffers: Dict[Tuple[str, str, str], Dict[str, list]] = {}
+        self.staged: Dict[Tuple[str, str, str], _StagedHour] = {}
+        self.stats = defaultdict(int)
+        self._lock = threading.RLock()
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    # ----- recording -----
+    def _buffer(self, dataset: str, topic: str, hour: str) -> Dict[str, list]:
+        key = (dataset, topic, hour)
+        columns = self.buffers.get(key)
+        if columns is None:
+            columns = self.buffers[key] = {name: [] for name in SCHEMAS[dataset].names}
+        return columns
+
+    def record(self, topic: str, event: Dict[str, Any], message=None) -> datetime:
+        """Queue one processed event (and its order lines) for the next flush"""
+        when, row, items = event_rows(
+            event,
+            getattr(message, "timestamp", None),
+            getattr(message, "partition", None),
+            getattr(message, "offset", None),
+        )
+        hour = when.strftime(HOUR_FORMAT)
+        with self._lock:
+            columns = self._buffer("events", topic, hour)
+            for name, value in row.items():
+                columns[name].append(value)
+            if items:
+                columns = self._buffer("items", topic, hour)
+                for item in items:
+                    for name, value in item.items():
+                        columns[name].append(value)
+            self.stats["events"] += 1
+            self.stats["items"] += len(items)
+        return when
+
+    # ----- persistence -----
+    def flush(self) -> bool:
+        """Append buffered rows to their staging files, then roll finished hours"""
+        with self._lock:
+            try:
+                for key, columns in self.buffers.items():
+                    batch = pa.RecordBatch.from_pydict(columns, schema=SCHEMAS[key[0]])
+                    staged = self.staged.get(key)
+                    if staged is None:
+                        staged = self.staged[key] = self._open_staging(*key)
+                    staged.write(batch)
+                self.buffers.clear()
+            except Exception as e:
+                logger.error(f"❌ Archive flush failed: {e}")
+                return False
+            self._roll_due()
+            return True
+
+    def _open_staging(self, dataset: str, topic: str, hour: str) -> _StagedHour:
+        name = (
+            f"{dataset}~{topic}~{hour}~{self.writer_id}~{uuid.uuid4().hex[:8]}"
+            f"{STAGING_SUFFIX}"
+        )
+        return _StagedHour(os.path.join(self.staging_dir, name), SCHEMAS[dataset])
+
+    def _roll_due(self, force: bool = False):
+        now = time.monotonic()
+        current_hour = datetime.now().strftime(HOUR_FORMAT)
+        for key, staged in list(self.staged.items()):
+            idle = now - staged.last_write > self.roll_grace_s
+            hour_over = key[2] < current_hour and idle
+            if force or hour_over or staged.rows >= self.max_staged_rows:
+                staged.close()
+                del self.staged[key]
+                self._publish(staged.path, *key)
+
+    def _publish(self, staging_path: str, dataset: str, topic: str, hour: str) -> bool:
+        """Rewrite a staging file as a Parquet file in its partition"""
+        try:
+            table = read_staging(staging_path)
+            if table.num_rows:
+                write_partition(
+                    table,
+                    self.root,
+                    dataset,
+                    topic,
+                    hour,
+                    self.compression,
+                    self.row_group_rows,
+                )
+                self.stats["files"] += 1
+                self.stats["rows_published"] += table.num_rows
+            os.remove(staging_path)
+            return True
+        except Exception as e:
+            # The staging file stays behind and is retried by recover()
+            logger.error(f"❌ Could not publish {staging_path}: {e}")
+            return False
+
+    def recover(self) -> int:
+        """Publish staging files left behind by writers that died"""
+        recovered = 0
+        for name in sorted(os.listdir(self.staging_dir)):
+            if not name.endswith(STAGING_SUFFIX):
+                continue
+            path = os.path.join(self.staging_dir, name)
+            try:
+                dataset, topic, hour = name.split("~")[:3]
+                with open(path, "rb") as handle:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    recovered += self._publish(path, dataset, topic, hour)
+            except (BlockingIOError, ValueError):
+                continue  # still being written, or not ours to parse
+        if recovered:
+            logger.info(f"♻️ Recovered {recovered} archive staging files")
+        return recovered
+
+    def close(self):
+        """Flush and publish everything, e.g. on shutdown"""
+        with self._lock:
+            self.flush()
+            self._roll_due(force=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "buffered_partitions": len(self.buffers),
+                "staged_partitions": len(self.staged),
+                "staged_rows": sum(staged.rows for staged in self.staged.values()),
+            }
+
+
+def read_staging(path: str) -> pa.Table:
+    """Every complete batch of a staging file; a torn last batch is dropped"""
+    batches = []
+    with pa.memory_map(path) as source:
+        try:
+            reader = pa.ipc.open_stream(source)
+            for batch in reader:
+                batches.append(batch)
+            schema = reader.schema
+        except (pa.ArrowInvalid, OSError):
+            if not batches:
+                return pa.table({})
+            schema = batches[0].schema
+        return pa.Table.from_batches(batches, schema=schema)
+
+
+def write_partition(
+    table: pa.Table,
+    root: str,
+    dataset: str,
+    topic: str,
+    hour: str,
+    compression: str = "zstd",
+    row_group_rows: int = 128 * 1024,
+) -> str:
+    """Write one sorted Parquet file into <root>/<dataset>/topic=/hour=/"""
+    directory = os.path.join(root, dataset, f"topic={topic}", f"hour={hour}")
+    os.makedirs(directory, exist_ok=True)
+    name = f"part-{int(time.time())}-{uuid.uuid4().hex[:12]}.parquet"
+    # Dot-prefixed files are ignored by dataset discovery until renamed
+    temporary = os.path.join(directory, f".{name}.tmp")
+    pq.write_table(
+        table.sort_by("ts"),
+        temporary,
+        compression=compression,
+        row_group_size=row_group_rows,
+    )
+    path = os.path.join(directory, name)
+    os.replace(temporary, path)
+    return path
+
+
+# ----- queries -----
+def hour_bounds(start: datetime, end: datetime) -> Tuple[str, str]:
+    return start.strftime(HOUR_FORMAT), end.strftime(HOUR_FORMAT)
+
+
+def open_dataset(root: str, dataset: str, memory_map: bool = True) -> ds.Dataset:
+    """The archived dataset, read through memory-mapped local files"""
+    return ds.dataset(
+        os.path.join(root, dataset),
+        schema=SCHEMAS[dataset].append(pa.field("topic", pa.string())).append(
+            pa.field("hour", pa.string())
+        ),
+        format="parquet",
+        partitioning=PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=memory_map),
+    )
+
+
+def build_filter(
+    start: datetime,
+    end: datetime,
+    topics: Optional[Iterable[str]] = None,
+    where: Optional[Dict[str, List[str]]] = None,
+    schema: Optional[pa.Schema] = None,
+) -> ds.Expression:
+    """Partition predicates (topic, hour) prune directories; the `ts` range
+    and column predicates prune row groups by their Parquet statistics."""
+    low, high = hour_bounds(start, end)
+    expression = (ds.field("hour") >= low) & (ds.field("hour") <= high)
+    expression &= (ds.field("ts") >= pa.scalar(start, pa.timestamp("ms"))) & (
+        ds.field("ts") < pa.scalar(end, pa.timestamp("ms"))
+    )
+    if topics:
+        expression &= ds.field("topic").isin(list(topics))
+    for column, values in (where or {}).items():
+        field_type = schema.field(column).type if schema is not None else pa.string()
+        typed = pa.array(values).cast(field_type)
+        expression &= ds.field(column).isin(typed)
+    return expression
+
+
+def _bucket(table: pa.Table, bucket: str) -> pa.Array:
+    if bucket == "week":
+        return pc.floor_temporal(table["ts"], unit="week", week_starts_monday=True)
+    return pc.floor_temporal(table["ts"], unit=bucket)
+
+
+def query_archive(
+    root: str,
+    dataset: str,
+    start: datetime,
+    end: datetime,
+    topics: Optional[List[str]] = None,
+    where: Optional[Dict[str, List[str]]] = None,
+    columns: Optional[List[str]] = None,
+    group_by: Optional[List[str]] = None,
+    metrics: Optional[List[Tuple[str, str]]] = None,
+    bucket: Optional[str] = None,
+    limit: int = 1000,
+    memory_map: bool = True,
+) -> Dict[str, Any]:
+    """Scan the archive between `start` and `end`.
+
+    With `group_by`/`metrics`/`bucket`, returns aggregated rows, computed
+    batch by batch and combined, so memory depends on the number of groups
+    rather than the number of events. Otherwise returns up to `limit` raw
+    rows. Only the referenced columns are read.
+    """
+    if dataset not in SCHEMAS:
+        raise ValueError(f"dataset must be one of: {', '.join(SCHEMAS)}")
+    if bucket is not None and bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    metrics = list(metrics or [])
+    for column, aggregation in metrics:
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"aggregation must be one of: {', '.join(AGGREGATIONS)}")
+
+    started = time.perf_counter()
+    if not os.path.isdir(os.path.join(root, dataset)):
+        return {"dataset": dataset, "rows": [], "returned": 0, "scanned_rows": 0}
+    source = open_dataset(root, dataset, memory_map)
+    known = set(source.schema.names)
+    group_by = list(group_by or [])
+    for column in (
+        (columns or []) + group_by + [c for c, _ in metrics] + list(where or {})
+    ):
+        if column not in known:
+            raise ValueError(f"Unknown column: {column}")
+
+    expression = build_filter(start, end, topics, where, source.schema)
+    aggregate = bool(group_by or metrics or bucket)
+    scanned = 0
+
+    if not aggregate:
+        table = source.head(
+            limit, columns=columns or None, filter=expression, batch_size=64 * 1024
+        )
+        rows = table.to_pylist()
+        scanned = table.num_rows
+    else:
+        keys = group_by + (["bucket"] if bucket else [])
+        needed = set(group_by) | {c for c, _ in metrics} | ({"ts"} if bucket else set())
+        # Partial aggregations that can be combined across batches
+        partial_specs = []
+        for column, aggregation in metrics:
+            if aggregation in ("sum", "mean"):
+                partial_specs.append((column, "sum"))
+            if aggregation in ("count", "mean"):
+                partial_specs.append((column, "count"))
+            if aggregation in ("min", "max"):
+                partial_specs.append((column, aggregation))
+        partial_specs = list(dict.fromkeys(partial_specs))
+        if not partial_specs:
+            # No metric asked for: count the rows of each group
+            partial_specs = [(keys[0], "count", pc.CountOptions(mode="all"))]
+        partials = []
+        scanner = source.scanner(
+            columns=sorted(needed), filter=expression, batch_size=256 * 1024
+        )
+        for batch in scanner.to_batches():
+            if not batch.num_rows:
+                continue
+            scanned += batch.num_rows
+            table = pa.Table.from_batches([batch])
+            if bucket:
+                table = table.append_column("bucket", _bucket(table, bucket))
+            partials.append(table.group_by(keys).aggregate(partial_specs))
+
+        rows = []
+        if partials:
+            combined = pa.concat_tables(partials)
+            merge = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+            merged = combined.group_by(keys).aggregate(
+                [(f"{spec[0]}_{spec[1]}", merge[spec[1]]) for spec in partial_specs]
+            )
+            for record in merged.to_pylist():
+                row = {key: record[key] for key in keys}
+                for column, aggregation in metrics:
+                    if aggregation == "mean":
+                        count = record[f"{column}_count_sum"]
+                        total = record[f"{column}_sum_sum"]
+                        row[f"{column}_mean"] = total / count if count else None
+                    else:
+                        merged_name = f"{column}_{aggregation}_{merge[aggregation]}"
+                        row[f"{column}_{aggregation}"] = record[merged_name]
+                if not metrics:
+                    row["rows"] = record[f"{partial_specs[0][0]}_count_sum"]
+                rows.append(row)
+            # Largest first (within each time bucket, oldest bucket first)
+            measure = "_".join(metrics[0]) if metrics else "rows"
+            rows.sort(key=lambda row: -(row[measure] or 0))
+            if bucket:
+                rows.sort(key=lambda row: row["bucket"])
+            rows = rows[:limit]
+
+    return {
+        "dataset": dataset,
+        "rows": rows,
+        "returned": len(rows),
+        "scanned_rows": scanned,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
@@ -0,0 +1,484 @@
+# microservices/analytics-service/backfill.py
+import argparse
+import itertools
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+
+# Product ids are shifted by one so a missing id (-1) packs as 0
+PRODUCT_BITS = 32
+PRODUCT_MASK = (1 << PRODUCT_BITS) - 1
+UNKNOWN_PRODUCT = -1
+
+# Dates are taken from the naive created_at column, matching the local-time
+# buckets the live consumer derives from event timestamps. Every column is
+# cast to a fixed-width, non-null type so binary COPY rows have one layout.
+ORDERS_QUERY = """
+    SELECT (o.created_at::date - DATE '1970-01-01')::int4,
+           COALESCE(o.total, 0)::float8
+    FROM orders o
+    WHERE o.id BETWEEN %(low)s AND %(high)s AND o.created_at IS NOT NULL {filters}
+"""
+ITEMS_QUERY = """
+    SELECT (o.created_at::date - DATE '1970-01-01')::int4,
+           COALESCE(oi.product_id, -1)::int8, COALESCE(oi.quantity, 1)::int4
+    FROM order_items oi JOIN orders o ON o.id = oi.order_id
+    WHERE oi.id BETWEEN %(low)s AND %(high)s AND o.created_at IS NOT NULL {filters}
+"""
+
+# Binary COPY rows: an int16 field count, then a big-endian int32 length
+# before each value
+ORDERS_ROW = np.dtype(
+    [
+        ("fields", ">i2"),
+        ("_l0", ">i4"),
+        ("day", ">i4"),
+        ("_l1", ">i4"),
+        ("total", ">f8"),
+    ]
+)
+ITEMS_ROW = np.dtype(
+    [
+        ("fields", ">i2"),
+        ("_l0", ">i4"),
+        ("day", ">i4"),
+        ("_l1", ">i4"),
+        ("product_id", ">i8"),
+        ("_l2", ">i4"),
+        ("quantity", ">i4"),
+    ]
+)
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_HEADER_BYTES = len(COPY_SIGNATURE) + 8
+COPY_TRAILER = b"\xff\xff"
+
+
+def day_of(when: datetime) -> int:
+    return (when.date() - EPOCH).days
+
+
+def date_of(day: int) -> datetime:
+    return datetime.combine(EPOCH + timedelta(days=int(day)), datetime.min.time())
+
+
+def whole_day(when: Optional[datetime]) -> Optional[datetime]:
+    """Check a date-range bound is a midnight; backfills overwrite whole days"""
+    if when is not None and when.time() != datetime.min.time():
+        raise ValueError(
+            f"{when.isoformat()} is not midnight; backfill ranges cover whole days"
+        )
+    return when
+
+
+def _day_arg(value: str) -> datetime:
+    try:
+        return whole_day(datetime.fromisoformat(value))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def group_sum(keys: np.ndarray, weights: Optional[np.ndarray] = None):
+    """Sum `weights` (or count rows) per distinct key: (keys, sums)"""
+    if len(keys) == 0:
+        return keys[:0].astype(np.int64), np.zeros(0)
+    low, high = int(keys.min()), int(keys.max())
+    if high - low <= max(4 * len(keys), 1 << 16):
+        # Dense keys (days, serial product ids): a single bincount pass
+        sums = np.bincount(keys - low, weights=weights, minlength=high - low + 1)
+        present = np.flatnonzero(
+            sums if weights is None else np.bincount(keys - low, minlength=len(sums))
+        )
+        return present.astype(np.int64) + low, sums[present].astype(np.float64)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights, minlength=len(unique)).astype(
+        np.float64
+    )
+
+
+class GroupedSum:
+    """Running per-key sums built from chunk-sized partial results"""
+
+    def __init__(self, compact_at: int = 2_000_000):
+        self.compact_at = compact_at
+        self.parts: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.pending = 0
+
+    def add(self, keys: np.ndarray, weights: Optional[np.ndarray] = None):
+        self._append(*group_sum(keys, weights))
+
+    def merge(self, other: "GroupedSum"):
+        for keys, sums in other.parts:
+            self._append(keys, sums)
+
+    def _append(self, keys: np.ndarray, sums: np.ndarray):
+        if len(keys):
+            self.parts.append((keys, sums))
+            self.pending += len(keys)
+        if self.pending > self.compact_at and len(self.parts) > 1:
+            self.compact()
+
+    def compact(self):
+        if len(self.parts) > 1:
+            keys = np.concatenate([keys for keys, _ in self.parts])
+            sums = np.concatenate([sums for _, sums in self.parts])
+            self.parts = [group_sum(keys, sums)]
+        self.pending = len(self.parts[0][0]) if self.parts else 0
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        self.compact()
+        if not self.parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return self.parts[0]
+
+
+class BackfillTotals:
+    """Everything the backfill writes, reduced from orders and order items.
+
+    Per-day product sums are only kept for days from `recent_from` on, as
+    older daily leaderboards have expired anyway; that keeps them bounded
+    by retention x catalogue size however long the history is.
+    """
+
+    def __init__(self, recent_from: int):
+        self.recent_from = recent_from
+        self.order_counts = GroupedSum()
+        self.order_revenue = GroupedSum()
+        self.item_counts = GroupedSum()
+        self.products = GroupedSum()
+        self.recent_products = GroupedSum()
+        self.rows = 0
+
+    def add_orders(self, days: np.ndarray, totals: np.ndarray):
+        self.order_counts.add(days)
+        self.order_revenue.add(days, totals)
+        self.rows += len(days)
+
+    def add_items(self, days: np.ndarray, product_ids: np.ndarray, quantities):
+        self.item_counts.add(days)
+        self.products.add(product_ids, quantities)
+        recent = days >= self.recent_from
+        if recent.any():
+            packed = (days[recent] << PRODUCT_BITS) | (
+                (product_ids[recent] + 1) & PRODUCT_MASK
+            )
+            self.recent_products.add(packed, quantities[recent])
+        self.rows += len(days)
+
+    def add_rows(self, table: str, rows: np.ndarray):
+        """Binary COPY rows laid out as ORDERS_ROW / ITEMS_ROW"""
+        days = rows["day"].astype(np.int64)
+        if table == "orders":
+            self.add_orders(days, rows["total"].astype(np.float64))
+        else:
+            self.add_items(
+                days,
+                rows["product_id"].astype(np.int64),
+                rows["quantity"].astype(np.float64),
+            )
+
+    def merge(self, other: "BackfillTotals"):
+        for name in (
+            "order_counts",
+            "order_revenue",
+            "item_counts",
+            "products",
+            "recent_products",
+        ):
+            getattr(self, name).merge(getattr(other, name))
+        self.rows += other.rows
+
+    def daily(self) -> Dict[int, Dict[str, float]]:
+        """{day: {"orders", "revenue", "items"}} for every day with orders or items"""
+        rows: Dict[int, Dict[str, float]] = {}
+        for field, grouped in (
+            ("orders", self.order_counts),
+            ("revenue", self.order_revenue),
+            ("items", self.item_counts),
+        ):
+            days, amounts = grouped.result()
+            for day, amount in zip(days.tolist(), amounts.tolist()):
+                rows.setdefault(day, {"orders": 0, "revenue": 0.0, "items": 0})[
+                    field
+                ] = amount
+        return rows
+
+    def product_ranking(self) -> Dict[str, int]:
+        return dict(_product_scores(*self.products.result()))
+
+    def daily_rankings(self) -> Dict[int, Dict[str, int]]:
+        packed, sums = self.recent_products.result()
+        days = packed >> PRODUCT_BITS
+        product_ids = (packed & PRODUCT_MASK) - 1
+        if not len(days):
+            return {}
+        # Packed keys come back sorted, so each day is one contiguous run
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [len(days)]
+        return {
+            int(days[start]): dict(
+                _product_scores(product_ids[start:end], sums[start:end])
+            )
+            for start, end in zip(starts, ends)
+        }
+
+
+def _product_scores(product_ids: np.ndarray, sums: np.ndarray):
+    for product_id, quantity in zip(product_ids.tolist(), sums.tolist()):
+        if quantity > 0:
+            name = "unknown" if product_id == UNKNOWN_PRODUCT else str(product_id)
+            yield name, int(quantity)
+
+
+def chunked(items, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class BatchedPipeline:
+    """Queues Redis commands and sends them every `batch` commands"""
+
+    def __init__(self, redis_client, batch: int = 1000):
+        self.pipe = redis_client.pipeline(transaction=False)
+        self.batch = batch
+        self.queued = 0
+        self.sent = 0
+
+    def queue(self, command: str, *args, **kwargs):
+        getattr(self.pipe, command)(*args, **kwargs)
+        self.queued += 1
+        if self.queued >= self.batch:
+            self.execute()
+
+    def execute(self):
+        if self.queued:
+            self.pipe.execute()
+            self.sent += self.queued
+            self.queued = 0
+
+
+class CopyRowReader:
+    """File-like sink for `COPY ... TO STDOUT (FORMAT binary)` of fixed-width rows.
+
+    psycopg2 hands the stream over `read_size` bytes at a time; the whole
+    rows in each piece are decoded in place with one np.frombuffer, so no
+    Python object is created per row and nothing is copied but the odd row
+    split across two pieces.
+    """
+
+    def __init__(
+        self,
+        dtype: np.dtype,
+        on_rows: Callable[[np.ndarray], None],
+        chunk_rows: int = 100_000,
+    ):
+        self.dtype = dtype
+        self.on_rows = on_rows
+        self.read_size = chunk_rows * dtype.itemsize
+        self.columns = (len(dtype.names) - 1) // 2
+        self.pending = bytearray()
+        self.header_read = False
+        self.rows = 0
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        if not self.header_read:
+            self.pending += view
+            if not self._read_header():
+                return len(view)
+            view, self.pending = memoryview(bytes(self.pending)), bytearray()
+
+        itemsize = self.dtype.itemsize
+        if self.pending:
+            # Complete the row split across the previous piece
+            take = min(itemsize - len(self.pending), len(view))
+            self.pending += view[:take]
+            view = view[take:]
+            if len(self.pending) < itemsize:
+                return len(data)
+            self._emit(bytes(self.pending), 1)
+            self.pending = bytearray()
+
+        count = len(view) // itemsize
+        self._emit(view, count)
+        self.pending += view[count * itemsize :]
+        return len(data)
+
+    def _read_header(self) -> bool:
+        if len(self.pending) < COPY_HEADER_BYTES:
+            return False
+        if not self.pending.startswith(COPY_SIGNATURE):
+            raise ValueError("Not a binary COPY stream")
+        extension = int.from_bytes(
+            self.pending[COPY_HEADER_BYTES - 4 : COPY_HEADER_BYTES], "big"
+        )
+        if len(self.pending) < COPY_HEADER_BYTES + extension:
+            return False
+        del self.pending[: COPY_HEADER_BYTES + extension]
+        self.header_read = True
+        return True
+
+    def _emit(self, buffer, count: int):
+        if count <= 0:
+            return
+        rows = np.frombuffer(buffer, dtype=self.dtype, count=count)
+        if (rows["fields"] != self.columns).any():
+            raise ValueError("Unexpected row layout in COPY stream")
+        self.rows += count
+        self.on_rows(rows)
+
+    def close(self):
+        """Check that nothing but the end-of-data trailer is left over"""
+        if self.pending and bytes(self.pending) != COPY_TRAILER:
+            raise ValueError("Truncated COPY stream")
+
+
+def _filters(since: Optional[datetime], until: Optional[datetime]) -> str:
+    clauses = []
+    if since:
+        clauses.append("AND o.created_at >= %(since)s")
+    if until:
+        clauses.append("AND o.created_at < %(until)s")
+    return " ".join(clauses)
+
+
+def scan_slice(
+    database_url: str,
+    table: str,
+    low: int,
+    high: int,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    recent_from: int,
+    chunk_rows: int,
+) -> BackfillTotals:
+    """Reduce one id range of `orders` or `order_items` (runs in a worker process)"""
+    import psycopg2
+
+    totals = BackfillTotals(recent_from)
+    query = (ORDERS_QUERY if table == "orders" else ITEMS_QUERY).format(
+        filters=_filters(since, until)
+    )
+    params = {"low": low, "high": high, "since": since, "until": until}
+    reader = CopyRowReader(
+        ORDERS_ROW if table == "orders" else ITEMS_ROW,
+        lambda rows: totals.add_rows(table, rows),
+        chunk_rows,
+    )
+    conn = psycopg2.connect(database_url)
+    try:
+        conn.set_session(readonly=True)
+        with conn.cursor() as cursor:
+            statement = cursor.mogrify(query, params).decode()
+            # COPY streams the result from the server without materialising it
+            # client-side, like a named cursor, but as raw binary rows
+            cursor.copy_expert(
+                f"COPY ({statement}) TO STDOUT WITH (FORMAT binary)",
+                reader,
+                size=reader.read_size,
+            )
+        reader.close()
+    finally:
+        conn.close()
+    return totals
+
+
+def id_slices(low: Optional[int], high: Optional[int], slices: int):
+    """Split [low, high] into about `slices` contiguous id ranges"""
+    if low is None or high is None:
+        return []
+    step = max((high - low + 1) // max(slices, 1), 1)
+    return [
+        (start, min(start + step - 1, high)) for start in range(low, high + 1, step)
+    ]
+
+
+def run_backfill(
+    database_url: str,
+    recent_from: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    jobs: int = 4,
+    chunk_rows: int = 100_000,
+) -> Tuple[BackfillTotals, int]:
+    """Scan orders and order items in parallel; returns the totals and user count"""
+    import psycopg2
+
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT min(id), max(id) FROM orders")
+            order_ids = cursor.fetchone()
+            cursor.execute("SELECT min(id), max(id) FROM order_items")
+            item_ids = cursor.fetchone()
+            cursor.execute("SELECT count(*) FROM users")
+            users = cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+    # More slices than processes, so one dense id range does not hold up the rest
+    tasks = [("orders", *ids) for ids in id_slices(*order_ids, jobs * 4)] + [
+        ("order_items", *ids) for ids in id_slices(*item_ids, jobs * 4)
+    ]
+    totals = BackfillTotals(recent_from)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(
+                scan_slice,
+                database_url,
+                table,
+                low,
+                high,
+                since,
+                until,
+                recent_from,
+                chunk_rows,
+            )
+            for table, low, high in tasks
+        ]
+        for future in futures:
+            totals.merge(future.result())
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"✅ Scanned {totals.rows:,} rows in {elapsed:.1f}s "
+        f"({totals.rows / max(elapsed, 1e-9):,.0f} rows/s)"
+    )
+    return totals, users
+
+
+def parse_backfill_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Rebuild analytics totals, daily rollups and product "
+        "popularity from the orders database"
+    )
+    parser.add_argument("--database-url")
+    parser.add_argument("--since", type=_day_arg, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--until", type=_day_arg, help="end day, exclusive (YYYY-MM-DD)")
+    parser.add_argument("--jobs", type=int, help="scanner processes")
+    parser.add_argument("--chunk-rows", type=int, help="rows decoded per block")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="scan and report, write nothing"
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # python backfill.py --jobs 8 (after POST /metrics/reset)
+    args = {k: v for k, v in vars(parse_backfill_args()).items() if v is not None}
+    import main
+
+    print(json.dumps(main.backfill_from_postgres(**args), indent=2))
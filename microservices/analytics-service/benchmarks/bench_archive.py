@@ -0,0 +1,204 @@
+# microservices/analytics-service/benchmarks/bench_archive.py
+"""Scan speed of the Parquet event archive.
+
+Writes a synthetic archive (hour/topic partitions, zstd Parquet, about two
+order lines per order) with the archiver's own writer, then times typical
+queries through query_archive: a full-history aggregation over order
+lines (with and without memory-mapped reads), the same query pruned to one
+day, a one-topic count that reads no value columns, and a raw read of
+every column for comparison. The defaults keep about 28k events per hourly
+file, close to 300M events a year; run the full year with
+--events 300000000 --days 365 on a disk with room for the archive
+(roughly 40 bytes per event).
+
+Usage: python benchmarks/bench_archive.py [--events 20000000] [--days 30]
+       [--root /tmp/archive-bench] [--keep]
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import (  # noqa: E402
+    EVENTS_SCHEMA,
+    HOUR_FORMAT,
+    ITEMS_SCHEMA,
+    open_dataset,
+    query_archive,
+    write_partition,
+)
+
+TOPICS = {
+    "orders": "order_created",
+    "users": "item_added_to_cart",
+    "products": "product_viewed",
+}
+SHARES = {"orders": 0.3, "users": 0.4, "products": 0.3}
+
+
+def strings(values: np.ndarray) -> pa.Array:
+    return pa.array(values).cast(pa.string())
+
+
+def hour_tables(rng, hour: datetime, events: int, topic: str, products: int):
+    start_ms = int(hour.timestamp() * 1000)
+    ts = pa.array(start_ms + rng.integers(0, 3_600_000, events), pa.timestamp("ms"))
+    user_ids = strings(rng.integers(1, 1_000_000, events))
+    product_ids = strings(rng.zipf(1.3, events) % products)
+    ids = strings(np.arange(events) + start_ms)
+    total = rng.gamma(2.0, 40.0, events).round(2)
+    event_type = TOPICS[topic]
+    payload = pc.binary_join_element_wise(
+        f'{{"event":"{event_type}","user_id":"', user_ids, '"}', ""
+    )
+    columns = {
+        "ts": ts,
+        "event_type": pa.array([event_type] * events, pa.string()),
+        "event_id": ids,
+        "user_id": user_ids,
+        "order_id": ids if topic == "orders" else pa.nulls(events, pa.string()),
+        "product_id": (
+            product_ids if topic != "orders" else pa.nulls(events, pa.string())
+        ),
+        "quantity": pa.nulls(events, pa.int64()),
+        "price": pa.nulls(events, pa.float64()),
+        "total": (
+            pa.array(total) if topic == "orders" else pa.nulls(events, pa.float64())
+        ),
+        "kafka_partition": pa.array(rng.integers(0, 12, events), pa.int32()),
+        "kafka_offset": pa.array(np.arange(events), pa.int64()),
+        "payload": payload,
+    }
+    events_table = pa.table(columns, schema=EVENTS_SCHEMA)
+    if topic != "orders":
+        return events_table, None
+
+    lines = rng.integers(1, 4, events)
+    order = np.repeat(np.arange(events), lines)
+    quantity = rng.integers(1, 4, len(order))
+    price = rng.gamma(2.0, 15.0, len(order)).round(2)
+    items_table = pa.table(
+        {
+            "ts": ts.take(pa.array(order)),
+            "event_type": pa.array([event_type] * len(order), pa.string()),
+            "order_id": ids.take(pa.array(order)),
+            "user_id": user_ids.take(pa.array(order)),
+            "product_id": strings(rng.zipf(1.3, len(order)) % products),
+            "quantity": pa.array(quantity, pa.int64()),
+            "price": pa.array(price),
+            "revenue": pa.array(quantity * price),
+        },
+        schema=ITEMS_SCHEMA,
+    )
+    return events_table, items_table
+
+
+def build(root: str, events: int, days: int, products: int) -> datetime:
+    rng = np.random.default_rng(11)
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    hours = days * 24
+    per_hour = max(events // hours, 1)
+    began = time.perf_counter()
+    for index in range(hours):
+        hour = end - timedelta(hours=hours - index)
+        label = hour.strftime(HOUR_FORMAT)
+        for topic, share in SHARES.items():
+            events_table, items_table = hour_tables(
+                rng, hour, int(per_hour * share), topic, products
+            )
+            write_partition(events_table, root, "events", topic, label)
+            if items_table is not None:
+                write_partition(items_table, root, "items", topic, label)
+    size = sum(
+        os.path.getsize(os.path.join(path, name))
+        for path, _, names in os.walk(root)
+        for name in names
+    )
+    print(
+        f"wrote {per_hour * hours:,} events over {hours:,} hours in "
+        f"{time.perf_counter() - began:.0f}s ({size / 1e9:.2f} GB, "
+        f"{size / (per_hour * hours):.1f} B/event)"
+    )
+    return end
+
+
+def timed(label: str, **query):
+    result = query_archive(**query)
+    seconds = result["seconds"]
+    scanned = result["scanned_rows"]
+    rate = scanned / seconds / 1e6 if seconds else float("inf")
+    print(
+        f"{label}: {seconds:.2f}s, {scanned:,} rows matched "
+        f"({rate:.1f}M rows/s), {result['returned']} result rows"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=20_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--root", default="/tmp/archive-bench")
+    parser.add_argument("--keep", action="store_true", help="reuse/keep the archive")
+    args = parser.parse_args()
+
+    if not (args.keep and os.path.isdir(args.root)):
+        shutil.rmtree(args.root, ignore_errors=True)
+        build(args.root, args.events, args.days, args.products)
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=args.days + 1)
+    base = {"root": args.root, "start": start, "end": end}
+
+    for memory_map in (False, True):
+        timed(
+            f"revenue by product by week, all history (mmap={memory_map})",
+            dataset="items",
+            group_by=["product_id"],
+            metrics=[("revenue", "sum")],
+            bucket="week",
+            limit=100,
+            memory_map=memory_map,
+            **base,
+        )
+    day = end - timedelta(days=2)
+    timed(
+        "revenue by product, one day (partition pruning)",
+        dataset="items",
+        group_by=["product_id"],
+        metrics=[("revenue", "sum")],
+        limit=100,
+        root=args.root,
+        start=day,
+        end=day + timedelta(days=1),
+    )
+    timed(
+        "cart adds per day, one topic (partition + column pruning)",
+        dataset="events",
+        topics=["users"],
+        bucket="day",
+        limit=1000,
+        **base,
+    )
+    began = time.perf_counter()
+    table = open_dataset(args.root, "events").to_table()
+    elapsed = time.perf_counter() - began
+    print(
+        f"read every column of every event: {elapsed:.2f}s "
+        f"({table.num_rows / elapsed / 1e6:.1f}M rows/s, "
+        f"{table.nbytes / 1e9:.2f} GB in memory)"
+    )
+    if not args.keep:
+        shutil.rmtree(args.root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
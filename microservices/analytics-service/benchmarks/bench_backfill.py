@@ -0,0 +1,147 @@
+# microservices/analytics-service/benchmarks/bench_backfill.py
+"""Throughput of the Postgres backfill reduction on synthetic order items.
+
+Builds a binary COPY stream of (day, product_id, quantity) rows, as
+`COPY ... TO STDOUT (FORMAT binary)` would send it (untimed), then times
+feeding it through CopyRowReader into BackfillTotals in the pieces
+psycopg2 would pass on. The baseline is a plain Python loop over the same
+rows as cursor tuples, not counting the cost of creating the tuples.
+Finally times writing the resulting ranking and daily rollups to Redis one
+command at a time and pipelined (REDIS_URL, or an in-process fakeredis).
+
+Usage: python benchmarks/bench_backfill.py [--rows 10000000] [--products 20000]
+       [--days 730] [--loop-rows 1000000] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backfill import (  # noqa: E402
+    COPY_SIGNATURE,
+    COPY_TRAILER,
+    ITEMS_ROW,
+    BackfillTotals,
+    BatchedPipeline,
+    CopyRowReader,
+    chunked,
+)
+
+FIRST_DAY = 19_000
+
+
+def connect(url):
+    if url:
+        import redis
+
+        return redis.from_url(url, decode_responses=True)
+    import fakeredis
+
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def synthetic_items(rows: int, products: int, days: int) -> np.ndarray:
+    """Order items with a Zipf-like product mix"""
+    rng = np.random.default_rng(7)
+    items = np.zeros(rows, dtype=ITEMS_ROW)
+    items["fields"] = 3
+    items["_l0"], items["_l1"], items["_l2"] = 4, 8, 4
+    items["day"] = FIRST_DAY + rng.integers(0, days, rows)
+    weights = 1 / np.arange(1, products + 1)
+    items["product_id"] = rng.choice(
+        np.arange(1, products + 1), rows, p=weights / weights.sum()
+    )
+    items["quantity"] = rng.integers(1, 5, rows)
+    return items
+
+
+def copy_stream(items: np.ndarray) -> bytes:
+    header = COPY_SIGNATURE + (0).to_bytes(4, "big") + (0).to_bytes(4, "big")
+    return header + items.tobytes() + COPY_TRAILER
+
+
+def python_loop(rows):
+    daily_items = defaultdict(int)
+    popularity = defaultdict(int)
+    for day, product_id, quantity in rows:
+        daily_items[day] += 1
+        popularity[product_id] += quantity
+    return daily_items, popularity
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--loop-rows", type=int, default=1_000_000)
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL"))
+    args = parser.parse_args()
+
+    items = synthetic_items(args.rows, args.products, args.days)
+    stream = memoryview(copy_stream(items))
+
+    totals = BackfillTotals(FIRST_DAY + args.days - 31)
+    began = time.perf_counter()
+    reader = CopyRowReader(
+        ITEMS_ROW, lambda rows: totals.add_rows("order_items", rows), args.chunk_rows
+    )
+    piece = reader.read_size
+    for start in range(0, len(stream), piece):
+        reader.write(stream[start : start + piece])
+    reader.close()
+    daily, ranking = totals.daily(), totals.product_ranking()
+    rankings = totals.daily_rankings()
+    elapsed = time.perf_counter() - began
+    rate = args.rows / elapsed
+    print(f"binary COPY + NumPy: {args.rows:,} order items in {elapsed:.2f}s")
+    print(
+        f"  {rate / 1e6:.1f}M rows/s per process "
+        f"({len(stream) / elapsed / 1e6:.0f} MB/s)"
+    )
+    print(f"  100M rows: ~{1e8 / rate:.0f}s of reduction per process")
+    print(
+        f"  {len(daily)} days, {len(ranking):,} products, "
+        f"{len(rankings)} daily leaderboards"
+    )
+
+    sample = items[: args.loop_rows]
+    tuples = list(
+        zip(
+            sample["day"].tolist(),
+            sample["product_id"].tolist(),
+            sample["quantity"].tolist(),
+        )
+    )
+    began = time.perf_counter()
+    python_loop(tuples)
+    loop_rate = len(tuples) / (time.perf_counter() - began)
+    print(f"python loop over cursor tuples: {loop_rate / 1e6:.2f}M rows/s")
+    print(f"  speedup: {rate / loop_rate:.1f}x (before counting tuple creation)")
+
+    client = connect(args.redis_url)
+    for batch in (1, 1000):
+        client.delete("bench:backfill:ranking")
+        began = time.perf_counter()
+        pipe = BatchedPipeline(client, batch)
+        for chunk in chunked(ranking.items(), 1 if batch == 1 else 1000):
+            pipe.queue("zadd", "bench:backfill:ranking", dict(chunk))
+        for day, row in daily.items():
+            pipe.queue("hset", f"bench:backfill:day:{day}", mapping=row)
+        pipe.execute()
+        elapsed = time.perf_counter() - began
+        label = "pipelined" if batch > 1 else "one command per write"
+        print(f"redis ({label}): {pipe.sent:,} commands in {elapsed:.2f}s")
+    client.delete(
+        "bench:backfill:ranking", *[f"bench:backfill:day:{day}" for day in daily]
+    )
+
+
+if __name__ == "__main__":
+    main()
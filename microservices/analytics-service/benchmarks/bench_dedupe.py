@@ -0,0 +1,108 @@
+# microservices/analytics-service/benchmarks/bench_dedupe.py
+"""Cost per event and false-positive rate of the SET and Bloom dedupe stores.
+
+Streams batches of fresh event ids with a share of redeliveries mixed in,
+checking each batch in bulk and marking the new ids, as the consumer does.
+Runs against REDIS_URL when given, otherwise an in-process fakeredis (whose
+latencies are not representative of a network hop, but the ratios are).
+
+Usage: python benchmarks/bench_dedupe.py [--events 200000] [--batch 500]
+       [--duplicates 0.05] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedupe import EventDeduplicator  # noqa: E402
+
+
+def connect(url):
+    if url:
+        import redis
+
+        return redis.from_url(url, decode_responses=True)
+    import fakeredis
+
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def memory_usage(client, key):
+    try:
+        return client.memory_usage(key) or 0
+    except Exception:
+        return None
+
+
+def run(client, backend: str, args) -> None:
+    dedupe = EventDeduplicator(
+        client,
+        "bench:dedupe",
+        window_s=3600,
+        backend=backend,
+        bloom_capacity=args.events,
+        bloom_error_rate=args.error_rate,
+    )
+    client.delete(*client.keys("bench:dedupe:*") or ["bench:dedupe:none"])
+    rng = random.Random(1)
+    now = time.time()
+    marked = []
+    missed = false_positives = 0
+    elapsed = 0.0
+
+    for start in range(0, args.events, args.batch):
+        fresh = [uuid.uuid4().hex for _ in range(min(args.batch, args.events - start))]
+        replays = (
+            rng.sample(marked, min(len(marked), int(len(fresh) * args.duplicates)))
+            if marked
+            else []
+        )
+        batch = fresh + replays
+
+        began = time.perf_counter()
+        seen = dedupe.seen(batch, now)
+        pipe = client.pipeline(transaction=False)
+        dedupe.queue_marks(pipe, [e for e, s in zip(batch, seen) if not s], now)
+        pipe.execute()
+        elapsed += time.perf_counter() - began
+
+        false_positives += sum(seen[: len(fresh)])
+        missed += len(replays) - sum(seen[len(fresh):])
+        marked.extend(fresh)
+
+    checked = dedupe.stats["checked"]
+    key = dedupe.key(dedupe.bucket(now))
+    usage = memory_usage(client, key)
+    print(f"\n{backend}: {checked:,} ids checked in batches of {args.batch}")
+    print(f"  cost: {elapsed / checked * 1e6:.1f} us/event (check + mark)")
+    print(
+        f"  false positives: {false_positives:,} of {args.events:,} fresh ids "
+        f"({false_positives / args.events:.4%})"
+    )
+    print(f"  missed redeliveries: {missed}")
+    if usage is not None:
+        print(f"  memory: {usage / 1024:,.0f} KiB ({usage / args.events:.1f} B/id)")
+    elif backend == "bloom":
+        print(f"  memory: {dedupe.bloom_bits / 8 / 1024:,.0f} KiB (bitmap size)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--duplicates", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL"))
+    args = parser.parse_args()
+
+    client = connect(args.redis_url)
+    for backend in ("set", "bloom"):
+        run(client, backend, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# microservices/analytics-service/benchmarks/bench_live_fanout.py
+"""Fan-out cost of live metrics pushes to many simulated SSE clients.
+
+A publisher thread plays the consumer, publishing summaries at a fixed rate.
+Clients read through LiveMetricsBroadcaster.sse_stream; a fraction of them
+are slow and get coalesced onto the latest snapshot instead of queueing.
+
+Usage: python benchmarks/bench_live_fanout.py [--clients 1000] [--updates 200]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import resource
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from live import LiveMetricsBroadcaster  # noqa: E402
+
+
+def make_summary(i: int) -> dict:
+    return {
+        "timestamp": time.time(),
+        "orders": {"total": 10_000 + i, "today": 100 + i},
+        "revenue": {"total": 1_000_000.0 + i * 37.5, "today": 5000.0 + i * 37.5},
+        "products": {
+            "top_selling": [
+                {"product_id": str(p), "quantity_sold": 1000 - p + i} for p in range(5)
+            ]
+        },
+        "events": {"processed": {"orders:order_created": 10_000 + i}},
+    }
+
+
+async def client(broadcaster, slow_delay, published_at, latencies, received, stop):
+    subscriber = broadcaster.subscribe()
+    try:
+        async for chunk in broadcaster.sse_stream(subscriber):
+            if chunk.startswith(b":"):
+                continue
+            latencies.append(time.perf_counter() - published_at[subscriber.sent_version])
+            received[0] += 1
+            if slow_delay:
+                await asyncio.sleep(slow_delay)
+            if stop.is_set():
+                break
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+async def run(args):
+    broadcaster = LiveMetricsBroadcaster(max_subscribers=args.clients, heartbeat_s=5)
+    broadcaster.bind_loop(asyncio.get_running_loop())
+    published_at = {}
+    latencies, received = [], [0]
+    stop = asyncio.Event()
+
+    broadcaster.publish(make_summary(0))
+    published_at[broadcaster.version] = time.perf_counter()
+
+    rng = random.Random(7)
+    tasks = [
+        asyncio.create_task(
+            client(
+                broadcaster,
+                args.slow_delay if rng.random() < args.slow_fraction else 0,
+                published_at,
+                latencies,
+                received,
+                stop,
+            )
+        )
+        for _ in range(args.clients)
+    ]
+    await asyncio.sleep(0.2)
+
+    publish_costs = []
+
+    def publisher():
+        for i in range(1, args.updates + 1):
+            summary = make_summary(i)
+            start = time.perf_counter()
+            published_at[broadcaster.version + 1] = start
+            broadcaster.publish(summary)
+            publish_costs.append(time.perf_counter() - start)
+            time.sleep(1 / args.rate)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    await asyncio.to_thread(publisher)
+    await asyncio.sleep(0.5)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    stop.set()
+    broadcaster.publish(make_summary(args.updates + 1))
+    await asyncio.sleep(0.1)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies.sort()
+    stats = broadcaster.get_stats()
+    print(f"clients={args.clients} updates={args.updates} rate={args.rate}/s")
+    print(f"messages delivered: {received[0]:,} ({received[0] / wall:,.0f}/s)")
+    print(f"  deltas: {stats['deltas_sent']:,}  snapshots (incl. coalesced): {stats['snapshots_sent']:,}")
+    print(
+        f"delivery latency: p50={statistics.median(latencies) * 1000:.2f}ms "
+        f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms "
+        f"max={latencies[-1] * 1000:.2f}ms"
+    )
+    print(f"publish cost: {statistics.mean(publish_costs) * 1e6:.0f}us per update (serialize once)")
+    print(f"CPU: {cpu / wall:.0%} of one core, peak RSS {peak_rss / 1024:.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20.0, help="publishes per second")
+    parser.add_argument("--slow-fraction", type=float, default=0.1)
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="seconds per message")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# microservices/analytics-service/benchmarks/bench_tdigest.py
+"""Update cost and accuracy of the order-value t-digest against exact quantiles.
+
+Usage: python benchmarks/bench_tdigest.py [--orders 1000000] [--compression 200]
+"""
+import argparse
+import bisect
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tdigest import TDigest  # noqa: E402
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def synthetic_orders(count: int, seed: int = 42):
+    """Log-normal basket values with a 0.5% tail of Pareto-distributed whale orders"""
+    rng = random.Random(seed)
+    values, items = [], []
+    for _ in range(count):
+        if rng.random() < 0.005:
+            values.append(round(500 * rng.paretovariate(1.5), 2))
+            items.append(rng.randint(10, 60))
+        else:
+            values.append(round(rng.lognormvariate(3.5, 0.8), 2))
+            items.append(min(1 + int(rng.expovariate(0.6)), 30))
+    return values, items
+
+
+def report(name: str, digest: TDigest, exact_sorted):
+    print(f"\n{name}: {len(digest.means)} centroids, {len(digest.to_bytes())} bytes")
+    print(f"  {'q':>6} {'exact':>12} {'t-digest':>12} {'value err':>10} {'rank err':>10}")
+    for q in QUANTILES:
+        exact = exact_sorted[min(int(q * len(exact_sorted)), len(exact_sorted) - 1)]
+        estimate = digest.quantile(q)
+        rank = bisect.bisect_right(exact_sorted, estimate) / len(exact_sorted)
+        value_err = abs(estimate - exact) / exact if exact else 0.0
+        print(
+            f"  {q:>6} {exact:>12.2f} {estimate:>12.2f} "
+            f"{value_err:>9.3%} {rank - q:>+10.5f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--compression", type=float, default=200.0)
+    parser.add_argument("--partitions", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"Generating {args.orders:,} synthetic orders...")
+    values, items = synthetic_orders(args.orders)
+
+    digest = TDigest(args.compression)
+    start = time.perf_counter()
+    for value in values:
+        digest.add(value)
+    digest.quantile(0.5)  # include the final compression
+    elapsed = time.perf_counter() - start
+    print(
+        f"Update cost: {elapsed / args.orders * 1e9:,.0f} ns/order "
+        f"({args.orders / elapsed:,.0f} orders/s on one core)"
+    )
+
+    start = time.perf_counter()
+    exact_values = sorted(values)
+    print(f"Exact sort for comparison: {time.perf_counter() - start:.2f}s")
+    report("order_value", digest, exact_values)
+
+    items_digest = TDigest(args.compression)
+    items_digest.update(items)
+    report("items_per_order", items_digest, sorted(items))
+
+    # Per-flush partial digests merged on read, as stored in Redis
+    parts = [TDigest(args.compression) for _ in range(args.partitions)]
+    for i, value in enumerate(values):
+        parts[i % args.partitions].add(value)
+    start = time.perf_counter()
+    merged = TDigest(args.compression)
+    for part in parts:
+        merged.merge(TDigest.deserialize(part.serialize()))
+    merge_ms = (time.perf_counter() - start) * 1000
+    report(f"order_value merged from {args.partitions} serialized parts", merged, exact_values)
+    print(f"  merge + decode time: {merge_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
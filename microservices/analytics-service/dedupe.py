@@ -0,0 +1,149 @@
+# microservices/analytics-service/dedupe.py
+# Shared with the other consumer service; keep both copies identical
+# (checked by analytics-service/tests/test_shared_modules.py)
+import hashlib
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+def event_identity(event: Any, topic: str, partition: int, offset: int) -> str:
+    """The producer's event_id, or the message coordinates for legacy events"""
+    if isinstance(event, dict):
+        event_id = event.get("event_id")
+        if event_id:
+            return str(event_id)
+    return f"{topic}:{partition}:{offset}"
+
+
+class EventDeduplicator:
+    """Remembers processed event ids in time-partitioned Redis keys.
+
+    Ids are written to the bucket of the current window and looked up in the
+    current and previous buckets, so an id is remembered for between one and
+    two windows; each bucket expires on its own, with no cleanup pass.
+
+    Two stores are supported:
+      * "set"   - one SET per bucket, checked with SMISMEMBER. Exact, but
+                  costs tens of bytes per id.
+      * "bloom" - a Bloom filter over a Redis bitmap per bucket, checked with
+                  one BITFIELD per id. ~1.8 bytes per id at a 0.1% false
+                  positive rate; a false positive drops a genuine event.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        prefix: str,
+        window_s: int = 3600,
+        backend: str = "set",
+        bloom_capacity: int = 1_000_000,
+        bloom_error_rate: float = 0.001,
+    ):
+        if backend not in ("set", "bloom"):
+            raise ValueError(f"Unknown dedupe backend: {backend}")
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.window_s = window_s
+        self.backend = backend
+        # Standard sizing: m = -n ln p / (ln 2)^2 bits, k = m/n ln 2 hashes
+        self.bloom_bits = math.ceil(
+            -bloom_capacity * math.log(bloom_error_rate) / math.log(2) ** 2
+        )
+        self.bloom_hashes = max(
+            1, round(self.bloom_bits / bloom_capacity * math.log(2))
+        )
+        self.stats = {"checked": 0, "duplicates": 0, "marked": 0, "check_errors": 0}
+
+    # ----- keys -----
+    def bucket(self, now: Optional[float] = None) -> int:
+        return int((now or time.time()) // self.window_s)
+
+    def key(self, bucket: int) -> str:
+        return f"{self.prefix}:{self.backend}:{bucket}"
+
+    def _positions(self, event_id: str) -> List[int]:
+        # Kirsch-Mitzenmacher double hashing from one 128-bit digest
+        digest = hashlib.blake2b(event_id.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bloom_bits for i in range(self.bloom_hashes)]
+
+    # ----- checking -----
+    def seen(
+        self, event_ids: Sequence[str], now: Optional[float] = None
+    ) -> List[bool]:
+        """Which ids were already marked, in one pipeline round trip.
+
+        Fails open: if Redis is unavailable every id counts as new.
+        """
+        if not event_ids:
+            return []
+        current = self.bucket(now)
+        keys = [self.key(current), self.key(current - 1)]
+        pipe = self.redis_client.pipeline(transaction=False)
+        if self.backend == "set":
+            for key in keys:
+                pipe.smismember(key, list(event_ids))
+        else:
+            for key in keys:
+                for event_id in event_ids:
+                    args = []
+                    for position in self._positions(event_id):
+                        args.extend(("GET", "u1", position))
+                    pipe.execute_command("BITFIELD", key, *args)
+
+        try:
+            results = pipe.execute()
+        except Exception:
+            self.stats["check_errors"] += 1
+            return [False] * len(event_ids)
+
+        if self.backend == "set":
+            found = [any(flags) for flags in zip(*results)]
+        else:
+            count = len(event_ids)
+            found = [
+                all(results[i]) or all(results[count + i]) for i in range(count)
+            ]
+        self.stats["checked"] += len(event_ids)
+        self.stats["duplicates"] += sum(found)
+        return found
+
+    # ----- marking -----
+    def queue_marks(
+        self, pipe, event_ids: Iterable[str], now: Optional[float] = None
+    ) -> int:
+        """Queue the writes that remember `event_ids` on `pipe`; returns command count"""
+        event_ids = list(event_ids)
+        if not event_ids:
+            return 0
+        key = self.key(self.bucket(now))
+        if self.backend == "set":
+            pipe.sadd(key, *event_ids)
+            commands = 1
+        else:
+            for event_id in event_ids:
+                args = []
+                for position in self._positions(event_id):
+                    args.extend(("SET", "u1", position, 1))
+                pipe.execute_command("BITFIELD", key, *args)
+            commands = len(event_ids)
+        # Live through the whole next window, in which this bucket is "previous"
+        pipe.expire(key, self.window_s * 2)
+        self.stats["marked"] += len(event_ids)
+        return commands + 1
+
+    def mark(self, event_ids: Iterable[str], now: Optional[float] = None):
+        pipe = self.redis_client.pipeline(transaction=False)
+        self.queue_marks(pipe, event_ids, now)
+        pipe.execute()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["backend"] = self.backend
+        stats["window_s"] = self.window_s
+        if self.backend == "bloom":
+            stats["bloom_bits"] = self.bloom_bits
+            stats["bloom_hashes"] = self.bloom_hashes
+        return stats
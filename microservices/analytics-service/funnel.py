@@ -0,0 +1,257 @@
+# microservices/analytics-service/funnel.py
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+# Funnel stages in display order; each is credited at most once per session
+STAGES = ("view", "cart", "checkout", "order")
+STAGE_BITS = {stage: 1 << i for i, stage in enumerate(STAGES)}
+
+STAGE_EVENTS = {
+    "cart_viewed": "view",
+    "products_viewed": "view",
+    "item_added_to_cart": "cart",
+    "checkout_session_created": "checkout",
+    "order_created": "order",
+}
+
+# Events that change session state without crediting a stage
+SESSION_EVENTS = set(STAGE_EVENTS) | {"item_removed_from_cart"}
+
+# Per-product outcomes emitted alongside the stage counts
+PRODUCT_OUTCOMES = ("added", "removed", "ordered", "abandoned")
+
+MAX_CART_PRODUCTS = 20
+
+# emit(kind, name, when, product_id): kind is "stage" or "product"
+EmitFn = Callable[[str, str, datetime, Optional[str]], None]
+
+
+class Session:
+    """Compact per-user funnel state: a stage bitmask, timestamps and cart products"""
+
+    __slots__ = ("shard", "stages", "started", "last_seen", "cart_products")
+
+    def __init__(self, started: float, shard: int = 0):
+        self.shard = shard
+        self.stages = 0
+        self.started = started
+        self.last_seen = started
+        self.cart_products: Tuple[str, ...] = ()
+
+    def encode(self) -> str:
+        return (
+            f"{self.stages}|{int(self.started)}|{int(self.last_seen)}|"
+            f"{','.join(self.cart_products)}"
+        )
+
+    @classmethod
+    def decode(cls, data: str, shard: int = 0) -> "Session":
+        stages, started, last_seen, products = data.split("|", 3)
+        session = cls(float(started), shard)
+        session.stages = int(stages)
+        session.last_seen = float(last_seen)
+        session.cart_products = tuple(p for p in products.split(",") if p)
+        return session
+
+
+class FunnelEngine:
+    """Streaming view -> cart -> checkout -> order funnel over per-user sessions.
+
+    Sessions live in an LRU keyed by user id and are closed after
+    `idle_timeout_s` of event time without activity, or when `max_sessions`
+    is exceeded. Checkout events only carry an email address, so they are
+    joined to a session through a bounded email -> user id index fed by
+    login, registration and order events.
+
+    Each session belongs to a shard - the Kafka partition its user's events
+    are keyed to - and is checkpointed per shard, so a worker only restores
+    and releases the sessions of the partitions it owns.
+    """
+
+    def __init__(
+        self,
+        emit: EmitFn,
+        max_sessions: int = 100_000,
+        idle_timeout_s: int = 1800,
+        max_emails: int = 50_000,
+    ):
+        self.emit = emit
+        self.max_sessions = max_sessions
+        self.idle_timeout_s = idle_timeout_s
+        self.max_emails = max_emails
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.email_index: "OrderedDict[str, str]" = OrderedDict()
+        self.watermark = 0.0
+        self._dirty: Set[str] = set()
+        self._deleted: Dict[str, int] = {}
+        self.stats = {"sessions_closed": 0, "sessions_converted": 0, "unmatched": 0}
+
+    # ----- ingestion -----
+    def _remember_email(self, email: Optional[str], user_id: str):
+        if not email:
+            return
+        email = email.lower()
+        self.email_index[email] = user_id
+        self.email_index.move_to_end(email)
+        while len(self.email_index) > self.max_emails:
+            self.email_index.popitem(last=False)
+
+    def _resolve_user(self, event: Dict[str, Any]) -> Optional[str]:
+        user_id = event.get("user_id")
+        if user_id not in (None, ""):
+            user_id = str(user_id)
+            self._remember_email(event.get("email") or event.get("user_email"), user_id)
+            return user_id
+        email = event.get("customer_email") or event.get("user_email")
+        if email:
+            return self.email_index.get(email.lower())
+        return None
+
+    def _touch(self, user_id: str, ts: float, shard: int) -> Session:
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = self.sessions[user_id] = Session(ts, shard)
+            self._deleted.pop(user_id, None)
+        session.last_seen = max(session.last_seen, ts)
+        self.sessions.move_to_end(user_id)
+        self._dirty.add(user_id)
+        return session
+
+    def _credit(self, session: Session, stage: str, when: datetime):
+        bit = STAGE_BITS[stage]
+        if not session.stages & bit:
+            session.stages |= bit
+            self.emit("stage", stage, when, None)
+
+    def process(self, event: Dict[str, Any], when: datetime, shard: int = 0):
+        event_type = event.get("event", "")
+        user_id = self._resolve_user(event)
+        stage = STAGE_EVENTS.get(event_type)
+        ts = when.timestamp()
+        self.watermark = max(self.watermark, ts)
+
+        if event_type not in SESSION_EVENTS or user_id is None:
+            if stage is not None:
+                self.stats["unmatched"] += 1
+            self.evict_idle()
+            return
+
+        session = self._touch(user_id, ts, shard)
+        if stage is not None:
+            self._credit(session, stage, when)
+
+        if event_type == "item_added_to_cart":
+            product_id = str(event.get("product_id", "unknown"))
+            if product_id not in session.cart_products:
+                session.cart_products = (session.cart_products + (product_id,))[
+                    -MAX_CART_PRODUCTS:
+                ]
+                self.emit("product", "added", when, product_id)
+
+        elif event_type == "item_removed_from_cart":
+            product_id = str(event.get("product_id", "unknown"))
+            if product_id in session.cart_products:
+                session.cart_products = tuple(
+                    p for p in session.cart_products if p != product_id
+                )
+                self.emit("product", "removed", when, product_id)
+
+        elif event_type == "order_created":
+            ordered = {
+                str(item.get("product_id"))
+                for item in event.get("items") or []
+                if isinstance(item, dict)
+            }
+            for product_id in ordered:
+                self.emit("product", "ordered", when, product_id)
+            # Whatever stayed in the cart but was not bought is a drop-off
+            for product_id in session.cart_products:
+                if product_id not in ordered:
+                    self.emit("product", "abandoned", when, product_id)
+            self.stats["sessions_converted"] += 1
+            self._close(user_id, when, abandoned=False)
+
+        self.evict_idle()
+
+    # ----- eviction -----
+    def _close(self, user_id: str, when: datetime, abandoned: bool = True):
+        session = self.sessions.pop(user_id, None)
+        if session is None:
+            return
+        if abandoned:
+            for product_id in session.cart_products:
+                self.emit("product", "abandoned", when, product_id)
+        self.stats["sessions_closed"] += 1
+        self._dirty.discard(user_id)
+        self._deleted[user_id] = session.shard
+
+    def evict_idle(self):
+        """Close sessions idle past the timeout (by event time) or beyond capacity"""
+        cutoff = self.watermark - self.idle_timeout_s
+        while self.sessions:
+            user_id, session = next(iter(self.sessions.items()))
+            if session.last_seen >= cutoff and len(self.sessions) <= self.max_sessions:
+                break
+            self._close(user_id, datetime.fromtimestamp(max(session.last_seen, 0)))
+
+    # ----- checkpointing -----
+    def drain_checkpoint(
+        self,
+    ) -> Tuple[Dict[int, Dict[str, str]], Dict[int, Set[str]]]:
+        """Sessions changed and closed since the last checkpoint, per shard"""
+        upserts: Dict[int, Dict[str, str]] = {}
+        for user_id in self._dirty:
+            session = self.sessions.get(user_id)
+            if session is not None:
+                upserts.setdefault(session.shard, {})[user_id] = session.encode()
+        deletes: Dict[int, Set[str]] = {}
+        for user_id, shard in self._deleted.items():
+            if user_id not in upserts.get(shard, ()):
+                deletes.setdefault(shard, set()).add(user_id)
+        self._dirty = set()
+        self._deleted = {}
+        return upserts, deletes
+
+    def restore(self, entries: Iterable[Tuple[str, str]], shard: int = 0) -> int:
+        """Load checkpointed sessions of one shard, oldest activity first"""
+        loaded = []
+        for user_id, data in entries:
+            try:
+                loaded.append((user_id, Session.decode(data, shard)))
+            except (ValueError, AttributeError):
+                continue
+        for user_id, session in sorted(loaded, key=lambda item: item[1].last_seen):
+            self.sessions[user_id] = session
+            self.watermark = max(self.watermark, session.last_seen)
+        return len(loaded)
+
+    def shards(self) -> Set[int]:
+        return {session.shard for session in self.sessions.values()}
+
+    def release(self, shards: Set[int]) -> int:
+        """Forget the sessions of shards handed to another worker.
+
+        Nothing is emitted: their checkpoint is the new owner's starting point.
+        """
+        released = [
+            user_id
+            for user_id, session in self.sessions.items()
+            if session.shard in shards
+        ]
+        for user_id in released:
+            del self.sessions[user_id]
+            self._dirty.discard(user_id)
+        self._deleted = {
+            user_id: shard
+            for user_id, shard in self._deleted.items()
+            if shard not in shards
+        }
+        return len(released)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            **self.stats,
+            "active_sessions": len(self.sessions),
+            "known_emails": len(self.email_index),
+        }
@@ -0,0 +1,180 @@
+# microservices/analytics-service/instrumentation.py
+# Shared with the other consumer service; keep both copies identical
+# (checked by analytics-service/tests/test_shared_modules.py)
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Set for multi-process consumers: every process writes its samples to files
+# in this directory and the API process merges them on scrape. The directory
+# must be empty when the service starts.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Distinct event types kept as label values; the rest are reported as "other"
+MAX_EVENT_TYPES = 50
+
+CONSUMER_LAG = Gauge(
+    "kafka_consumer_lag_messages",
+    "Messages between the consumer position and the partition high watermark",
+    ["topic", "partition"],
+    multiprocess_mode="livesum",
+)
+BATCH_SIZE = Histogram(
+    "kafka_consumer_batch_size",
+    "Messages returned by one consumer poll",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+EVENTS_CONSUMED = Counter(
+    "events_consumed_total",
+    "Consumed events by outcome (processed, failed, duplicate)",
+    ["topic", "outcome"],
+)
+HANDLER_LATENCY = Histogram(
+    "event_handler_duration_seconds",
+    "Time spent handling one event",
+    ["topic", "event_type"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+END_TO_END_LATENCY = Histogram(
+    "event_end_to_end_latency_seconds",
+    "Time from the producer timestamp on the event to its consumption",
+    ["topic", "event_type"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+
+_event_types = set()
+_event_types_lock = threading.Lock()
+
+
+def event_type_label(event: Dict[str, Any]) -> str:
+    """Bound the label cardinality a misbehaving producer could create"""
+    event_type = str(event.get("event") or "unknown")[:64]
+    if event_type in _event_types:
+        return event_type
+    with _event_types_lock:
+        if len(_event_types) >= MAX_EVENT_TYPES:
+            return "other"
+        _event_types.add(event_type)
+    return event_type
+
+
+def produced_at(event: Dict[str, Any], message=None) -> Optional[float]:
+    """Producer time of an event as a UNIX timestamp.
+
+    Uses the event's `timestamp` field (ISO 8601; naive values are local
+    time, as the backend writes them) and falls back to the Kafka record
+    timestamp.
+    """
+    value = event.get("timestamp")
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    record_ms = getattr(message, "timestamp", None)
+    if isinstance(record_ms, int) and record_ms > 0:
+        return record_ms / 1000.0
+    return None
+
+
+def observe_event(
+    topic: str,
+    event: Dict[str, Any],
+    handler_s: float,
+    success: bool,
+    message=None,
+    now: Optional[float] = None,
+):
+    """Record handling time, end-to-end latency and outcome for one event"""
+    event_type = event_type_label(event)
+    HANDLER_LATENCY.labels(topic, event_type).observe(handler_s)
+    EVENTS_CONSUMED.labels(topic, "processed" if success else "failed").inc()
+    if not success:
+        return
+    started = produced_at(event, message)
+    if started is not None:
+        # Producer clocks may run slightly ahead of ours
+        latency = (now if now is not None else time.time()) - started
+        END_TO_END_LATENCY.labels(topic, event_type).observe(max(latency, 0.0))
+
+
+def observe_failure(topic: str):
+    """Count a message that failed before it could be routed (e.g. undecodable)"""
+    EVENTS_CONSUMED.labels(topic, "failed").inc()
+
+
+def observe_duplicates(topic: str, count: int = 1):
+    EVENTS_CONSUMED.labels(topic, "duplicate").inc(count)
+
+
+class LagTracker:
+    """Exports per-partition consumer lag from the consumer's own fetch metadata.
+
+    High watermarks arrive with every fetch response, so updating costs no
+    broker round trips. Partitions handed to another consumer are zeroed
+    rather than left at their last value, which keeps the summed gauge right
+    after a rebalance in multi-process mode.
+    """
+
+    def __init__(self, interval_s: float = 5.0):
+        self.interval_s = interval_s
+        self.last_update = 0.0
+        self.partitions = set()
+
+    def maybe_update(self, consumer) -> bool:
+        now = time.monotonic()
+        if now - self.last_update < self.interval_s:
+            return False
+        self.last_update = now
+
+        assigned = set()
+        for tp in consumer.assignment():
+            highwater = consumer.highwater(tp)
+            try:
+                position = consumer.position(tp)
+            except Exception:
+                continue
+            if highwater is None or position is None:
+                continue
+            labels = (tp.topic, str(tp.partition))
+            CONSUMER_LAG.labels(*labels).set(max(highwater - position, 0))
+            assigned.add(labels)
+
+        for labels in self.partitions - assigned:
+            CONSUMER_LAG.labels(*labels).set(0)
+        self.partitions = assigned
+        return True
+
+    def clear(self):
+        for labels in self.partitions:
+            CONSUMER_LAG.labels(*labels).set(0)
+        self.partitions = set()
+
+
+def mark_process_dead(pid: int):
+    """Drop a dead worker's live gauges from the multi-process files"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+
+
+def render() -> Tuple[bytes, str]:
+    """Prometheus text exposition of this service (all processes when pooled)"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
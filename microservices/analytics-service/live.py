@@ -0,0 +1,156 @@
+# microservices/analytics-service/live.py
+import asyncio
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+def diff_summary(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Changed leaves of `new` relative to `old`; removed keys map to None"""
+    delta = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff_summary(previous, value)
+            if nested:
+                delta[key] = nested
+        elif value != previous or key not in old:
+            delta[key] = value
+    for key in old:
+        if key not in new:
+            delta[key] = None
+    return delta
+
+
+class Subscriber:
+    __slots__ = ("wakeup", "sent_version", "heartbeat_due")
+
+    def __init__(self):
+        self.wakeup = asyncio.Event()
+        self.sent_version = 0
+        self.heartbeat_due = False
+
+
+class LiveMetricsBroadcaster:
+    """Pushes metrics summary updates to SSE / WebSocket subscribers.
+
+    Each published summary is serialized once, as a full snapshot and as a
+    delta against the previous version, and shared by every client. A
+    subscriber only holds a wake-up flag and the last version it was sent, so
+    a slow client never queues anything: when it catches up it gets a delta
+    if it is exactly one version behind, otherwise the latest full snapshot.
+    """
+
+    def __init__(self, max_subscribers: int = 200, heartbeat_s: float = 15.0):
+        self.max_subscribers = max_subscribers
+        self.heartbeat_s = heartbeat_s
+        self.subscribers: Set[Subscriber] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.version = 0
+        self.summary: Optional[Dict[str, Any]] = None
+        self.snapshot_body: Optional[bytes] = None
+        self.delta_body: Optional[bytes] = None
+        self.stats = {"published": 0, "snapshots_sent": 0, "deltas_sent": 0}
+        self._lock = threading.Lock()
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        # One shared timer instead of a timeout per waiting client
+        loop.call_later(self.heartbeat_s, self._heartbeat)
+
+    def _heartbeat(self):
+        for subscriber in self.subscribers:
+            subscriber.heartbeat_due = True
+            subscriber.wakeup.set()
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_later(self.heartbeat_s, self._heartbeat)
+
+    # ----- publishing (any thread) -----
+    def publish(self, summary: Dict[str, Any]):
+        with self._lock:
+            delta = diff_summary(self.summary, summary) if self.summary else None
+            if self.summary is not None and not delta:
+                return
+            self.version += 1
+            self.summary = summary
+            self.snapshot_body = json.dumps(summary, separators=(",", ":"), default=str).encode()
+            self.delta_body = (
+                json.dumps(delta, separators=(",", ":"), default=str).encode()
+                if delta is not None
+                else None
+            )
+            self.stats["published"] += 1
+
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wake_all)
+
+    def _wake_all(self):
+        for subscriber in self.subscribers:
+            subscriber.wakeup.set()
+
+    # ----- subscribing (event loop) -----
+    def check_capacity(self):
+        if len(self.subscribers) >= self.max_subscribers:
+            raise TooManySubscribers(
+                f"Live metrics limited to {self.max_subscribers} subscribers"
+            )
+
+    def subscribe(self) -> Subscriber:
+        self.check_capacity()
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        if self.summary is not None:
+            subscriber.wakeup.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def next_message(self, subscriber: Subscriber) -> Optional[Tuple[str, bytes]]:
+        """("delta" | "snapshot", body) for the subscriber, or None if up to date"""
+        with self._lock:
+            if subscriber.sent_version == self.version or self.snapshot_body is None:
+                return None
+            if subscriber.sent_version == self.version - 1 and self.delta_body:
+                message = ("delta", self.delta_body)
+                self.stats["deltas_sent"] += 1
+            else:
+                message = ("snapshot", self.snapshot_body)
+                self.stats["snapshots_sent"] += 1
+            subscriber.sent_version = self.version
+            return message
+
+    async def messages(
+        self, subscriber: Subscriber
+    ) -> AsyncIterator[Optional[Tuple[str, bytes]]]:
+        """Yield messages as they become available, and None as a heartbeat"""
+        while True:
+            await subscriber.wakeup.wait()
+            subscriber.wakeup.clear()
+            message = self.next_message(subscriber)
+            if message is not None:
+                subscriber.heartbeat_due = False
+                yield message
+            elif subscriber.heartbeat_due:
+                subscriber.heartbeat_due = False
+                yield None
+
+    async def sse_stream(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        async for message in self.messages(subscriber):
+            if message is None:
+                yield b": keepalive\n\n"
+            else:
+                event, body = message
+                yield b"event: " + event.encode() + b"\ndata: " + body + b"\n\n"
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            **self.stats,
+            "subscribers": len(self.subscribers),
+            "max_subscribers": self.max_subscribers,
+            "version": self.version,
+        }
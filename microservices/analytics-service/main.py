@@ -3,16 +3,59 @@ import asyncio
 import json
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.websockets import WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import redis
-from kafka import KafkaConsumer
+from kafka import KafkaConsumer, ConsumerRebalanceListener
+from kafka.coordinator.assignors.range import RangePartitionAssignor
 import threading
+import time
 import os
 from contextlib import asynccontextmanager
 
+from aggregator import MetricsAggregator
+from archive import EventArchiver, query_archive
+from backfill import (
+    BackfillTotals,
+    BatchedPipeline,
+    chunked,
+    date_of,
+    day_of,
+    run_backfill,
+    whole_day,
+)
+from dedupe import EventDeduplicator, event_identity
+from dlq import (
+    DeadLetterQueue,
+    ReplayJob,
+    envelope_identity,
+    get_replay_status,
+    read_dead_letters,
+)
+from config import settings
+from rollups import (
+    ROLLUP_STEPS,
+    bucket_id,
+    count_buckets,
+    event_time,
+    iter_buckets,
+    parse_timestamp,
+    rollup_key,
+)
+from funnel import PRODUCT_OUTCOMES, STAGES, FunnelEngine
+import instrumentation
+import json_codec
+from json_codec import UndecodableMessage, safe_json_deserializer
+from live import LiveMetricsBroadcaster, TooManySubscribers
+from snapshot import SummarySnapshot
+from tdigest import TDigest
+from workers import ConsumerPool, ConsumerStatusReporter, summarize_consumers
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -27,55 +70,36 @@ CONSUMER_GROUP = "analytics-service"
 # Topics to consume
 KAFKA_TOPICS = ["orders", "users", "products", "payments"]
 
-# Global variables
-redis_client: Optional[redis.Redis] = None
-kafka_consumer: Optional[KafkaConsumer] = None
-consumer_thread: Optional[threading.Thread] = None
-
-
-def safe_json_deserializer(data):
-    """Safe JSON deserializer that handles various formats"""
-    try:
-        if data is None:
-            return None
-
-        # If it's already a dict, return it
-        if isinstance(data, dict):
-            return data
-
-        # Convert bytes to string
-        if isinstance(data, bytes):
-            data = data.decode("utf-8")
+# Popularity used to live in a hash that had to be sorted in Python on every
+# read; it is migrated once into the products_popular sorted set
+LEGACY_POPULAR_HASH = "analytics:products:popular"
+POPULAR_MIGRATION_MARKER = "analytics:products:ranking:migrated"
+LEADERBOARD_WINDOWS = ("hour", "day")
 
-        # Handle empty or whitespace strings
-        if not data or not data.strip():
-            logger.warning("⚠️ Received empty message")
-            return None
+# Distinct users per bucket, kept as HyperLogLogs (at most ~12KB per key)
+UNIQUE_KINDS = ("viewers", "cart_users", "buyers")
+UNIQUE_WINDOWS = ("hour", "day")
 
-        # Try to parse as JSON
-        try:
-            return json.loads(data)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON decode error: {e}")
-            logger.error(f"❌ Raw data: {repr(data)}")
+# Streaming quantile sketches, one list of partial t-digests per bucket
+DIGEST_METRICS = ("order_value", "items_per_order")
+DIGEST_WINDOWS = ("hour", "day")
 
-            # Try to fix common JSON issues
-            data = data.strip()
+# Conversion funnel counts per window, plus per-product outcomes per day
+FUNNEL_WINDOWS = ("hour", "day")
+FUNNEL_SESSIONS_KEY = "analytics:funnel:sessions"
 
-            # Remove any leading/trailing non-JSON characters
-            if data.startswith("'") and data.endswith("'"):
-                data = data[1:-1]
+# Consumer processes announce flushes here so the API process can refresh
+# the summary snapshot, and report lag/throughput into the status hash
+FLUSH_CHANNEL = "analytics:consumer:flushes"
+CONSUMER_STATUS_KEY = "analytics:consumer:workers"
 
-            # Try parsing again
-            try:
-                return json.loads(data)
-            except json.JSONDecodeError:
-                logger.error(f"❌ Failed to parse after cleanup: {repr(data)}")
-                return None
-
-    except Exception as e:
-        logger.error(f"❌ Unexpected error in JSON deserializer: {e}")
-        return None
+# Global variables
+redis_client: Optional[redis.Redis] = None
+kafka_consumer: Optional[KafkaConsumer] = None
+consumer_thread: Optional[threading.Thread] = None
+consumer_pool: Optional[ConsumerPool] = None
+consumer_stop = threading.Event()
+replay_job: Optional[ReplayJob] = None
 
 
 def safe_int(value: Any, default: int = 0) -> int:
@@ -124,16 +148,70 @@ class AnalyticsService:
             "revenue_total": "analytics:revenue:total",
             "revenue_today": "analytics:revenue:today",
             "users_total": "analytics:users:total",
-            "products_popular": "analytics:products:popular",
+            "products_popular": "analytics:products:ranking",
             "cart_actions": "analytics:cart:actions",
             "events_processed": "analytics:events:processed",
             "events_failed": "analytics:events:failed",
         }
 
+        self.dedupe = EventDeduplicator(
+            self.redis_client,
+            "analytics:dedupe",
+            window_s=settings.DEDUPE_WINDOW_MINUTES * 60,
+            backend=settings.DEDUPE_BACKEND,
+            bloom_capacity=settings.DEDUPE_BLOOM_CAPACITY,
+            bloom_error_rate=settings.DEDUPE_BLOOM_ERROR_RATE,
+        )
+        self.aggregator = MetricsAggregator(
+            self.redis_client,
+            flush_interval_ms=settings.AGGREGATION_FLUSH_INTERVAL_MS,
+            flush_max_events=settings.AGGREGATION_FLUSH_MAX_EVENTS,
+            digest_compression=settings.DIGEST_COMPRESSION,
+            deduplicator=self.dedupe,
+        )
+        self.dlq = DeadLetterQueue(KAFKA_SERVERS, CONSUMER_GROUP)
+        # Columnar event history for ad-hoc queries; off unless ARCHIVE_DIR is set
+        self.archive: Optional[EventArchiver] = None
+        if settings.ARCHIVE_DIR:
+            self.archive = EventArchiver(
+                settings.ARCHIVE_DIR,
+                roll_grace_s=settings.ARCHIVE_ROLL_GRACE_SECONDS,
+                max_staged_rows=settings.ARCHIVE_MAX_STAGED_ROWS,
+                compression=settings.ARCHIVE_COMPRESSION,
+            )
+        self.snapshot = SummarySnapshot(settings.SNAPSHOT_MAX_AGE_MS)
+        self.live = LiveMetricsBroadcaster(
+            settings.LIVE_MAX_SUBSCRIBERS, settings.LIVE_HEARTBEAT_SECONDS
+        )
+
+        # Partial digests pushed per key since its last compaction
+        self.digest_parts: Dict[str, int] = {}
+
+        # Set in consumer worker processes, which leave the snapshot to the API
+        self.publish_flushes = False
+        # A flush whose snapshot refresh was rate limited (single-worker mode)
+        self.snapshot_pending = False
+
+        self.funnel = FunnelEngine(
+            self._emit_funnel,
+            max_sessions=settings.FUNNEL_MAX_SESSIONS,
+            idle_timeout_s=settings.FUNNEL_SESSION_IDLE_MINUTES * 60,
+        )
+
+        # Retention per rollup granularity, in seconds
+        self.rollup_ttls = {
+            "minute": settings.ROLLUP_MINUTE_RETENTION_HOURS * 3600,
+            "hour": settings.ROLLUP_HOUR_RETENTION_DAYS * 86400,
+            "day": settings.METRICS_RETENTION_DAYS * 86400,
+        }
+
     def initialize_metrics(self):
         """Initialize metrics with default values"""
         try:
             for key in self.metrics_keys.values():
+                # Sorted sets start out empty rather than with a placeholder
+                if key == self.metrics_keys["products_popular"]:
+                    continue
                 if not self.redis_client.exists(key):
                     if any(
                         word in key
@@ -146,6 +224,56 @@ class AnalyticsService:
         except Exception as e:
             logger.error(f"❌ Failed to initialize metrics: {e}")
 
+    def migrate_popular_products(self, chunk_size: int = 1000) -> int:
+        """Copy the legacy popularity hash into the sorted set, once"""
+        ranking_key = self.metrics_keys["products_popular"]
+        if self.redis_client.exists(POPULAR_MIGRATION_MARKER):
+            return 0
+
+        migrated = 0
+        cursor = 0
+        while True:
+            cursor, chunk = self.redis_client.hscan(
+                LEGACY_POPULAR_HASH, cursor, count=chunk_size
+            )
+            scores = {
+                pid: safe_int(qty)
+                for pid, qty in chunk.items()
+                if pid != "initialized" and safe_int(qty) > 0
+            }
+            if scores:
+                # GT keeps the migration idempotent if it is interrupted and rerun
+                self.redis_client.zadd(ranking_key, scores, gt=True)
+                migrated += len(scores)
+            if cursor == 0:
+                break
+
+        self.redis_client.set(POPULAR_MIGRATION_MARKER, datetime.now().isoformat())
+        if migrated:
+            logger.info(f"✅ Migrated {migrated} products into {ranking_key}")
+        return migrated
+
+    def leaderboard_key(self, window: str, when: datetime) -> str:
+        return (
+            f"{self.metrics_keys['products_popular']}:{window}:"
+            f"{bucket_id(when, window)}"
+        )
+
+    def get_top_products(
+        self, window: str = "all", limit: int = 5, when: Optional[datetime] = None
+    ):
+        """Best sellers as (product_id, quantity) pairs, highest first"""
+        if window == "all":
+            key = self.metrics_keys["products_popular"]
+        else:
+            key = self.leaderboard_key(window, when or datetime.now())
+        return [
+            (pid, int(score))
+            for pid, score in self.redis_client.zrevrange(
+                key, 0, limit - 1, withscores=True
+            )
+        ]
+
     def log_event_received(self, topic: str, event_type: str, success: bool = True):
         """Log event processing"""
         try:
@@ -154,10 +282,172 @@ class AnalyticsService:
                 if success
                 else self.metrics_keys["events_failed"]
             )
-            self.redis_client.hincrby(key, f"{topic}:{event_type}", 1)
+            self.aggregator.hincrby(key, f"{topic}:{event_type}", 1)
         except Exception as e:
             logger.error(f"❌ Error logging event: {e}")
 
+    def record_rollup(self, when: datetime, fields: Dict[str, Union[int, float]]):
+        """Add `fields` to the minute, hour and day buckets containing `when`"""
+        for step, ttl in self.rollup_ttls.items():
+            key = rollup_key(step, bucket_id(when, step))
+            for field, amount in fields.items():
+                if isinstance(amount, float):
+                    self.aggregator.hincrbyfloat(key, field, amount)
+                else:
+                    self.aggregator.hincrby(key, field, amount)
+            self.aggregator.expire(key, ttl)
+
+    def unique_key(self, kind: str, step: str, when: datetime) -> str:
+        return f"analytics:uniques:{kind}:{step}:{bucket_id(when, step)}"
+
+    def record_unique(self, kind: str, user_id: Any, when: datetime):
+        """Add `user_id` to the hourly and daily distinct counters for `kind`"""
+        if user_id in (None, ""):
+            return
+        for step in UNIQUE_WINDOWS:
+            key = self.unique_key(kind, step, when)
+            self.aggregator.pfadd(key, str(user_id))
+            self.aggregator.expire(key, self.rollup_ttls[step])
+
+    def digest_key(self, metric: str, step: str, when: datetime) -> str:
+        return f"analytics:digest:{metric}:{step}:{bucket_id(when, step)}"
+
+    def record_digest(self, metric: str, value: float, when: datetime):
+        for step in DIGEST_WINDOWS:
+            key = self.digest_key(metric, step, when)
+            self.aggregator.add_to_digest(key, value)
+            self.aggregator.expire(key, self.rollup_ttls[step])
+
+    def compact_digest(self, key: str) -> bool:
+        """Replace the partial digests stored at `key` with their merge"""
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                parts = pipe.lrange(key, 0, -1)
+                if len(parts) <= 1:
+                    return True
+                merged = TDigest(settings.DIGEST_COMPRESSION)
+                for part in parts:
+                    merged.merge(TDigest.deserialize(part))
+                ttl = pipe.ttl(key)
+                pipe.multi()
+                pipe.delete(key)
+                pipe.rpush(key, merged.serialize())
+                if ttl and ttl > 0:
+                    pipe.expire(key, ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                # Another writer appended meanwhile; try again after the next flush
+                return False
+
+    def compact_digests(self):
+        """Compact digest lists that grew long or whose bucket stopped receiving data"""
+        flushed = self.aggregator.last_flushed_digests
+        for key in flushed:
+            self.digest_parts[key] = self.digest_parts.get(key, 0) + 1
+        for key, parts in list(self.digest_parts.items()):
+            if parts >= settings.DIGEST_COMPACT_PARTS or key not in flushed:
+                try:
+                    if self.compact_digest(key):
+                        del self.digest_parts[key]
+                except Exception as e:
+                    logger.error(f"❌ Error compacting digest {key}: {e}")
+
+    def funnel_key(self, step: str, when: datetime) -> str:
+        return f"analytics:funnel:{step}:{bucket_id(when, step)}"
+
+    def funnel_products_key(self, when: datetime) -> str:
+        return f"analytics:funnel:products:day:{bucket_id(when, 'day')}"
+
+    def _emit_funnel(
+        self, kind: str, name: str, when: datetime, product_id: Optional[str]
+    ):
+        """Sink for FunnelEngine output: buffer stage and product counts"""
+        if kind == "stage":
+            for step in FUNNEL_WINDOWS:
+                key = self.funnel_key(step, when)
+                self.aggregator.hincrby(key, name, 1)
+                self.aggregator.expire(key, self.rollup_ttls[step])
+        else:
+            key = self.funnel_products_key(when)
+            self.aggregator.hincrby(key, f"{product_id}:{name}", 1)
+            self.aggregator.expire(key, self.rollup_ttls["day"])
+
+    def funnel_sessions_key(self, shard: int) -> str:
+        return f"{FUNNEL_SESSIONS_KEY}:{shard}"
+
+    def track_funnel(self, event: Dict[str, Any], shard: int = 0):
+        try:
+            self.funnel.process(event, event_time(event), shard)
+        except Exception as e:
+            logger.error(f"❌ Error updating funnel: {e}")
+
+    def restore_funnel(self, shards: Set[int]) -> int:
+        """Reload the checkpointed funnel sessions of newly owned partitions"""
+        restored = 0
+        for shard in shards:
+            restored += self.funnel.restore(
+                self.redis_client.hscan_iter(self.funnel_sessions_key(shard), count=1000),
+                shard,
+            )
+        if restored:
+            logger.info(f"✅ Restored {restored} funnel sessions")
+        return restored
+
+    def assign_funnel_shards(self, shards: Set[int]):
+        """Keep sessions of partitions this consumer still owns, swap the rest"""
+        held = self.funnel.shards()
+        released = self.funnel.release(held - shards)
+        if released:
+            logger.info(f"↪️ Released {released} funnel sessions")
+        self.restore_funnel(shards - held)
+
+    def discard_pending(self):
+        """Forget unflushed work after partitions moved away mid-flight.
+
+        The new owner resumes from the offsets and session checkpoints in
+        Redis, so dropping our copy is what keeps the counts exact.
+        """
+        dropped = self.aggregator.discard()
+        self.funnel.drain_checkpoint()
+        self.funnel.release(self.funnel.shards())
+        logger.warning(f"⚠️ Discarded {dropped} unflushed events after a rebalance")
+
+    def flush(self) -> bool:
+        """Checkpoint funnel sessions and flush every buffered delta to Redis"""
+        # Handlers update the funnel under this lock; replays flush from
+        # another thread
+        with self.aggregator.atomic():
+            upserts, deletes = self.funnel.drain_checkpoint()
+            for shard, user_ids in deletes.items():
+                self.aggregator.hdel(self.funnel_sessions_key(shard), user_ids)
+            for shard, sessions in upserts.items():
+                self.aggregator.hset(self.funnel_sessions_key(shard), sessions)
+        if not self.aggregator.flush():
+            return False
+        self.compact_digests()
+        try:
+            if self.publish_flushes:
+                self.redis_client.publish(FLUSH_CHANNEL, os.getpid())
+            elif self.refresh_snapshot() is None:
+                self.snapshot_pending = True
+        except Exception as e:
+            logger.error(f"❌ Error refreshing summary snapshot: {e}")
+        return True
+
+    def get_consumer_status(self) -> Dict[str, Any]:
+        """Lag and scaling hints reported by every consumer in the group"""
+        entries = self.redis_client.hgetall(CONSUMER_STATUS_KEY) or {}
+        status = summarize_consumers(
+            entries,
+            stale_after_s=settings.CONSUMER_STATUS_INTERVAL_SECONDS * 3,
+            lag_target_s=settings.CONSUMER_LAG_TARGET_SECONDS,
+        )
+        if status["stale_workers"]:
+            self.redis_client.hdel(CONSUMER_STATUS_KEY, *status["stale_workers"])
+        return status
+
     def process_order_event(self, event: Dict[str, Any], topic: str):
         """Process order-related events"""
         try:
@@ -174,27 +464,45 @@ class AnalyticsService:
                 logger.info(f"📊 Order: ${order_total}, {items_count} items")
 
                 # Update metrics
-                self.redis_client.incr(self.metrics_keys["orders_total"])
-                self.redis_client.incr(f"{self.metrics_keys['orders_today']}:{today}")
-                self.redis_client.incrbyfloat(
+                orders_today_key = f"{self.metrics_keys['orders_today']}:{today}"
+                revenue_today_key = f"{self.metrics_keys['revenue_today']}:{today}"
+                self.aggregator.incr(self.metrics_keys["orders_total"])
+                self.aggregator.incr(orders_today_key)
+                self.aggregator.incrbyfloat(
                     self.metrics_keys["revenue_total"], order_total
                 )
-                self.redis_client.incrbyfloat(
-                    f"{self.metrics_keys['revenue_today']}:{today}", order_total
+                self.aggregator.incrbyfloat(revenue_today_key, order_total)
+                self.aggregator.expire(orders_today_key, self.rollup_ttls["day"])
+                self.aggregator.expire(revenue_today_key, self.rollup_ttls["day"])
+                self.record_rollup(
+                    event_time(event),
+                    {"orders": 1, "revenue": order_total, "items": items_count},
                 )
 
                 # Process items
+                ordered_at = event_time(event)
+                self.record_unique("buyers", event.get("user_id"), ordered_at)
+                self.record_digest("order_value", order_total, ordered_at)
+                self.record_digest("items_per_order", items_count, ordered_at)
+                leaderboards = [
+                    (self.leaderboard_key(window, ordered_at), self.rollup_ttls[window])
+                    for window in LEADERBOARD_WINDOWS
+                ]
                 items = event.get("items", [])
                 if isinstance(items, list):
                     for item in items:
                         if isinstance(item, dict):
                             product_id = str(item.get("product_id", "unknown"))
                             quantity = safe_int(item.get("quantity", 1))
-                            self.redis_client.hincrby(
+                            self.aggregator.zincrby(
                                 self.metrics_keys["products_popular"],
                                 product_id,
                                 quantity,
                             )
+                            for key, _ in leaderboards:
+                                self.aggregator.zincrby(key, product_id, quantity)
+                for key, ttl in leaderboards:
+                    self.aggregator.expire(key, ttl)
 
                 logger.info(f"✅ Order processed successfully: ${order_total:.2f}")
                 return True
@@ -202,7 +510,7 @@ class AnalyticsService:
         except Exception as e:
             logger.error(f"❌ Error processing order event: {e}")
             self.log_event_received(topic, event.get("event", "unknown"), False)
-            return False
+            raise
 
     def process_user_event(self, event: Dict[str, Any], topic: str):
         """Process user-related events"""
@@ -213,7 +521,8 @@ class AnalyticsService:
             logger.info(f"🔄 Processing user event: {event_type}")
 
             if event_type == "user_registered":
-                self.redis_client.incr(self.metrics_keys["users_total"])
+                self.aggregator.incr(self.metrics_keys["users_total"])
+                self.record_rollup(event_time(event), {"registrations": 1})
                 logger.info("✅ User registered")
                 return True
 
@@ -222,16 +531,27 @@ class AnalyticsService:
                 "item_removed_from_cart",
                 "cart_cleared",
             ]:
-                self.redis_client.hincrby(
+                self.aggregator.hincrby(
                     self.metrics_keys["cart_actions"], event_type, 1
                 )
+                self.record_rollup(
+                    event_time(event), {"cart_actions": 1, f"cart:{event_type}": 1}
+                )
+                if event_type == "item_added_to_cart":
+                    self.record_unique(
+                        "cart_users", event.get("user_id"), event_time(event)
+                    )
                 logger.info(f"✅ Cart action: {event_type}")
                 return True
 
+            elif event_type == "cart_viewed":
+                self.record_unique("viewers", event.get("user_id"), event_time(event))
+                return True
+
         except Exception as e:
             logger.error(f"❌ Error processing user event: {e}")
             self.log_event_received(topic, event.get("event", "unknown"), False)
-            return False
+            raise
 
     def get_safe_redis_value(
         self, key: str, default_type: str = "int"
@@ -250,85 +570,252 @@ class AnalyticsService:
             logger.error(f"❌ Error getting Redis value for {key}: {e}")
             return 0 if default_type == "int" else 0.0
 
-    def get_metrics_summary(self) -> Dict[str, Any]:
-        """Get comprehensive analytics summary"""
-        try:
-            today = datetime.now().strftime("%Y-%m-%d")
+    def choose_rollup_step(self, start: datetime, end: datetime) -> str:
+        """Finest granularity that is still retained for `start` and fits the bucket cap"""
+        now = datetime.now()
+        for step, ttl in self.rollup_ttls.items():
+            if start >= now - timedelta(seconds=ttl) and (
+                count_buckets(start, end, step) <= settings.MAX_RANGE_BUCKETS
+            ):
+                return step
+        return "day"
+
+    @staticmethod
+    def _rollup_points(buckets, rows):
+        """Decode rollup hashes into per-bucket points and their totals"""
+        points = []
+        totals = {"orders": 0, "revenue": 0.0, "registrations": 0, "cart_actions": 0}
+        for bucket, row in zip(buckets, rows):
+            row = row or {}
+            point = {
+                "bucket": bucket.isoformat(),
+                "orders": safe_int(row.get("orders", 0)),
+                "revenue": round(safe_float(row.get("revenue", 0)), 2),
+                "items": safe_int(row.get("items", 0)),
+                "registrations": safe_int(row.get("registrations", 0)),
+                "cart_actions": safe_int(row.get("cart_actions", 0)),
+                "cart_breakdown": {
+                    field.split(":", 1)[1]: safe_int(value)
+                    for field, value in row.items()
+                    if field.startswith("cart:")
+                },
+            }
+            for field in totals:
+                totals[field] += point[field]
+            points.append(point)
+
+        totals["revenue"] = round(totals["revenue"], 2)
+        return points, totals
+
+    def get_metrics_range(
+        self, start: datetime, end: datetime, step: str
+    ) -> Dict[str, Any]:
+        """Time series for [start, end] read straight from the rollup buckets"""
+        buckets = iter_buckets(start, end, step)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hgetall(rollup_key(step, bucket_id(bucket, step)))
+        rows = pipe.execute()
+
+        points, totals = self._rollup_points(buckets, rows)
+        return {
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "step": step,
+            "points": points,
+            "totals": totals,
+        }
 
-            # Basic metrics
-            orders_total = self.get_safe_redis_value(
-                self.metrics_keys["orders_total"], "int"
-            )
-            orders_today = self.get_safe_redis_value(
-                f"{self.metrics_keys['orders_today']}:{today}", "int"
-            )
-            revenue_total = self.get_safe_redis_value(
-                self.metrics_keys["revenue_total"], "float"
-            )
-            revenue_today = self.get_safe_redis_value(
-                f"{self.metrics_keys['revenue_today']}:{today}", "float"
-            )
-            users_total = self.get_safe_redis_value(
-                self.metrics_keys["users_total"], "int"
-            )
+    def get_unique_counts(
+        self, start: datetime, end: datetime, step: str
+    ) -> Dict[str, Any]:
+        """Approximate distinct users per bucket plus the union over the range"""
+        buckets = iter_buckets(start, end, step)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for bucket in buckets:
+            for kind in UNIQUE_KINDS:
+                pipe.pfcount(self.unique_key(kind, step, bucket))
+        for kind in UNIQUE_KINDS:
+            # PFCOUNT over several keys counts the union without merging them
+            pipe.pfcount(*[self.unique_key(kind, step, bucket) for bucket in buckets])
+        counts = pipe.execute()
+
+        points = []
+        for i, bucket in enumerate(buckets):
+            row = counts[i * len(UNIQUE_KINDS) : (i + 1) * len(UNIQUE_KINDS)]
+            points.append({"bucket": bucket.isoformat(), **dict(zip(UNIQUE_KINDS, row))})
+        return {
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "step": step,
+            "points": points,
+            "distinct_over_range": dict(zip(UNIQUE_KINDS, counts[-len(UNIQUE_KINDS) :])),
+            "approximate": True,
+        }
 
-            # Events processed
-            events_processed = (
-                self.redis_client.hgetall(self.metrics_keys["events_processed"]) or {}
-            )
-            events_failed = (
-                self.redis_client.hgetall(self.metrics_keys["events_failed"]) or {}
-            )
+    def get_quantiles(
+        self, metric: str, start: datetime, end: datetime, step: str
+    ) -> Dict[str, Any]:
+        """Merge the digests of every bucket in [start, end] and read p50/p90/p99"""
+        buckets = iter_buckets(start, end, step)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.lrange(self.digest_key(metric, step, bucket), 0, -1)
+
+        return self._quantile_summary(pipe.execute())
+
+    @staticmethod
+    def _quantile_summary(part_lists) -> Dict[str, Any]:
+        """Merge lists of serialized partial digests and read count/min/max/p50/p90/p99"""
+        merged = TDigest(settings.DIGEST_COMPRESSION)
+        for parts in part_lists:
+            for part in parts or []:
+                merged.merge(TDigest.deserialize(part))
+
+        if not merged.total_weight:
+            empty = ("count", "min", "max", "p50", "p90", "p99")
+            return {name: (0 if name == "count" else None) for name in empty}
+        return {
+            "count": len(merged),
+            "min": round(merged.min, 2),
+            "max": round(merged.max, 2),
+            **{
+                name: round(value, 2)
+                for name, value in merged.percentiles(50, 90, 99).items()
+            },
+        }
 
-            # Popular products
-            try:
-                popular_products = (
-                    self.redis_client.hgetall(self.metrics_keys["products_popular"])
-                    or {}
-                )
-                top_products = []
-                for pid, qty in popular_products.items():
-                    if pid != "initialized":
-                        try:
-                            quantity = safe_int(qty)
-                            if quantity > 0:
-                                top_products.append((pid, quantity))
-                        except:
-                            continue
-                top_products = sorted(top_products, key=lambda x: x[1], reverse=True)[
-                    :5
-                ]
-            except Exception as e:
-                logger.error(f"❌ Error processing popular products: {e}")
-                top_products = []
+    def get_funnel(self, step: str, when: datetime, limit: int = 10) -> Dict[str, Any]:
+        """Stage counts, conversion rates and the products with the worst drop-off"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hgetall(self.funnel_key(step, when))
+        pipe.hgetall(self.funnel_products_key(when))
+        stage_row, product_row = pipe.execute()
+
+        stages = {stage: safe_int((stage_row or {}).get(stage, 0)) for stage in STAGES}
+
+        def rate(numerator: int, denominator: int) -> float:
+            return round(numerator / denominator, 4) if denominator else 0.0
+
+        products: Dict[str, Dict[str, int]] = {}
+        for field, value in (product_row or {}).items():
+            product_id, _, outcome = field.rpartition(":")
+            if outcome in PRODUCT_OUTCOMES:
+                products.setdefault(
+                    product_id, {name: 0 for name in PRODUCT_OUTCOMES}
+                )[outcome] = safe_int(value)
+        drop_off = sorted(
+            (
+                {
+                    "product_id": product_id,
+                    **counts,
+                    "drop_off_rate": rate(counts["abandoned"], counts["added"]),
+                }
+                for product_id, counts in products.items()
+            ),
+            key=lambda row: row["abandoned"],
+            reverse=True,
+        )[:limit]
+
+        return {
+            "step": step,
+            "bucket": bucket_id(when, step),
+            "stages": stages,
+            "conversion": {
+                "view_to_cart": rate(stages["cart"], stages["view"]),
+                "cart_to_checkout": rate(stages["checkout"], stages["cart"]),
+                "checkout_to_order": rate(stages["order"], stages["checkout"]),
+                "cart_to_order": rate(stages["order"], stages["cart"]),
+            },
+            "product_drop_off": drop_off,
+            "engine": self.funnel.get_stats(),
+        }
+
+    def get_metrics_summary(self) -> Dict[str, Any]:
+        """Get comprehensive analytics summary with a single pipelined read"""
+        try:
+            now = datetime.now()
+            today = now.strftime("%Y-%m-%d")
+            window_start = now - timedelta(minutes=settings.REAL_TIME_WINDOW_MINUTES - 1)
+            window_buckets = iter_buckets(window_start, now, "minute")
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.get(self.metrics_keys["orders_total"])
+            pipe.get(f"{self.metrics_keys['orders_today']}:{today}")
+            pipe.get(self.metrics_keys["revenue_total"])
+            pipe.get(f"{self.metrics_keys['revenue_today']}:{today}")
+            pipe.get(self.metrics_keys["users_total"])
+            pipe.hgetall(self.metrics_keys["events_processed"])
+            pipe.hgetall(self.metrics_keys["events_failed"])
+            pipe.zrevrange(
+                self.metrics_keys["products_popular"],
+                0,
+                settings.TOP_PRODUCTS_LIMIT - 1,
+                withscores=True,
+            )
+            pipe.lrange(self.digest_key("order_value", "day", now), 0, -1)
+            pipe.lrange(self.digest_key("items_per_order", "day", now), 0, -1)
+            for kind in UNIQUE_KINDS:
+                pipe.pfcount(self.unique_key(kind, "day", now))
+            for bucket in window_buckets:
+                pipe.hgetall(rollup_key("minute", bucket_id(bucket, "minute")))
+            results = pipe.execute()
+
+            (
+                orders_total,
+                orders_today,
+                revenue_total,
+                revenue_today,
+                users_total,
+                events_processed,
+                events_failed,
+                top_products,
+                order_value_parts,
+                items_per_order_parts,
+            ) = results[:10]
+            unique_counts = results[10 : 10 + len(UNIQUE_KINDS)]
+            window_rows = results[10 + len(UNIQUE_KINDS) :]
+
+            orders_total = safe_int(orders_total or 0)
+            revenue_total = safe_float(revenue_total or 0)
+            _, window_totals = self._rollup_points(window_buckets, window_rows)
 
             return {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now.isoformat(),
                 "orders": {
                     "total": orders_total,
-                    "today": orders_today,
+                    "today": safe_int(orders_today or 0),
+                    "items_per_order_today": self._quantile_summary(
+                        [items_per_order_parts]
+                    ),
                 },
                 "revenue": {
                     "total": round(revenue_total, 2),
-                    "today": round(revenue_today, 2),
+                    "today": round(safe_float(revenue_today or 0), 2),
                     "average_order_value": (
                         round(revenue_total / orders_total, 2)
                         if orders_total > 0
                         else 0
                     ),
+                    "order_value_today": self._quantile_summary([order_value_parts]),
                 },
                 "users": {
-                    "total": users_total,
+                    "total": safe_int(users_total or 0),
+                    "unique_today": dict(zip(UNIQUE_KINDS, unique_counts)),
+                },
+                "real_time": {
+                    "window_minutes": settings.REAL_TIME_WINDOW_MINUTES,
+                    **window_totals,
                 },
                 "products": {
                     "top_selling": [
-                        {"product_id": pid, "quantity_sold": qty}
+                        {"product_id": pid, "quantity_sold": int(qty)}
                         for pid, qty in top_products
                     ]
                 },
                 "events": {
-                    "processed": dict(events_processed),
-                    "failed": dict(events_failed),
+                    "processed": dict(events_processed or {}),
+                    "failed": dict(events_failed or {}),
                 },
                 "debug_info": {
                     "kafka_topics": KAFKA_TOPICS,
@@ -340,88 +827,433 @@ class AnalyticsService:
             logger.error(f"❌ Error getting metrics summary: {e}")
             return {"error": str(e), "timestamp": datetime.now().isoformat()}
 
+    def write_backfill(
+        self, totals: BackfillTotals, users: Optional[int] = None, batch: int = 1000
+    ) -> Dict[str, int]:
+        """Overwrite order metrics with values rebuilt from Postgres.
+
+        Daily rollups and leaderboards are only written for days still within
+        retention, expiring when the live keys for that day would have. The
+        all-time totals and ranking are skipped for a partial backfill
+        (`users` is None), since a date range cannot rebuild them.
+        """
+        pipe = BatchedPipeline(self.redis_client, batch)
+        day_ttl = self.rollup_ttls["day"]
+        now = time.time()
+        written = {"rollup_days": 0, "ranked_products": 0, "daily_leaderboards": 0}
+
+        for day, row in sorted(totals.daily().items()):
+            expires_at = int(date_of(day + 1).timestamp()) + day_ttl
+            if expires_at <= now:
+                continue
+            when = date_of(day)
+            key = rollup_key("day", bucket_id(when, "day"))
+            pipe.queue(
+                "hset",
+                key,
+                mapping={
+                    "orders": int(row["orders"]),
+                    "revenue": float(row["revenue"]),
+                    "items": int(row["items"]),
+                },
+            )
+            pipe.queue("expireat", key, expires_at)
+            today = when.strftime("%Y-%m-%d")
+            for name, value in (
+                ("orders_today", int(row["orders"])),
+                ("revenue_today", float(row["revenue"])),
+            ):
+                pipe.queue(
+                    "set", f"{self.metrics_keys[name]}:{today}", value, exat=expires_at
+                )
+            written["rollup_days"] += 1
+
+        for day, scores in totals.daily_rankings().items():
+            expires_at = int(date_of(day + 1).timestamp()) + day_ttl
+            if expires_at <= now or not scores:
+                continue
+            key = self.leaderboard_key("day", date_of(day))
+            pipe.queue("delete", key)
+            for chunk in chunked(scores.items(), batch):
+                pipe.queue("zadd", key, dict(chunk))
+            pipe.queue("expireat", key, expires_at)
+            written["daily_leaderboards"] += 1
+
+        if users is not None:
+            orders = int(totals.order_counts.result()[1].sum())
+            revenue = float(totals.order_revenue.result()[1].sum())
+            pipe.queue("set", self.metrics_keys["orders_total"], orders)
+            pipe.queue("set", self.metrics_keys["revenue_total"], revenue)
+            pipe.queue("set", self.metrics_keys["users_total"], users)
+
+            # Built aside and renamed into place, so readers never see half a ranking
+            ranking_key = self.metrics_keys["products_popular"]
+            staging_key = f"{ranking_key}:backfill"
+            ranking = totals.product_ranking()
+            pipe.queue("delete", staging_key)
+            for chunk in chunked(ranking.items(), batch):
+                pipe.queue("zadd", staging_key, dict(chunk))
+            if ranking:
+                pipe.queue("rename", staging_key, ranking_key)
+            else:
+                pipe.queue("delete", ranking_key)
+            written["ranked_products"] = len(ranking)
+
+        pipe.execute()
+        written["commands"] = pipe.sent
+        return written
+
+    def refresh_snapshot(self, force: bool = False) -> Optional[Tuple[bytes, str]]:
+        """Rebuild the cached summary (rate limited unless `force`)"""
+        if not force:
+            age = self.snapshot.age_ms()
+            if age is not None and age < settings.SNAPSHOT_MIN_INTERVAL_MS:
+                return None
+        summary = self.get_metrics_summary()
+        if "error" in summary:
+            return None
+        version = self.snapshot.version
+        refreshed = self.snapshot.update(summary)
+        if self.snapshot.version != version:
+            self.live.publish(summary)
+        return refreshed
+
+    def refresh_pending_snapshot(self):
+        """Catch up on a snapshot refresh a recent flush was rate limited out of"""
+        if self.snapshot_pending:
+            # Cleared first, so a flush landing during the rebuild sets it again
+            self.snapshot_pending = False
+            if self.refresh_snapshot() is None:
+                self.snapshot_pending = True
+
+    def get_summary_snapshot(self) -> Tuple[bytes, Optional[str]]:
+        """Serve the cached summary, rebuilding it once if it went stale"""
+        cached = self.snapshot.get()
+        if cached:
+            return cached
+        with self.snapshot.rebuild_lock:
+            cached = self.snapshot.get()
+            if cached:
+                return cached
+            refreshed = self.refresh_snapshot(force=True)
+            if refreshed:
+                return refreshed
+        # Redis failed: return the error without caching it
+        return json.dumps(self.get_metrics_summary()).encode(), None
+
 
 # Global analytics service instance
 analytics = AnalyticsService()
 
 
-def kafka_consumer_worker():
+class OffsetRecoveryListener(ConsumerRebalanceListener):
+    """Keeps Kafka offsets in step with the aggregates stored in Redis"""
+
+    def __init__(self, consumer: KafkaConsumer):
+        self.consumer = consumer
+
+    def on_partitions_revoked(self, revoked):
+        # Flush before the partitions move so the next owner starts clean; if
+        # that fails, the next owner replays from Redis, so drop our copy
+        if revoked and not flush_and_commit(self.consumer):
+            analytics.discard_pending()
+
+    def on_partitions_assigned(self, assigned):
+        # Resume from the offsets recorded alongside the Redis aggregates, so a
+        # crash between a flush and the Kafka commit never double counts
+        committed = analytics.aggregator.get_committed_offsets()
+        for tp in assigned:
+            offset = committed.get((tp.topic, tp.partition))
+            if offset is not None:
+                logger.info(f"⏩ Resuming {tp.topic}[{tp.partition}] at offset {offset}")
+                self.consumer.seek(tp, offset)
+        # Topics are keyed by user, so a partition number is a funnel shard
+        analytics.assign_funnel_shards({tp.partition for tp in assigned})
+
+
+def flush_and_commit(consumer: Optional[KafkaConsumer]) -> bool:
+    """Flush aggregated deltas to Redis, then commit the consumed offsets to Kafka"""
+    # Dead letters and archived events must be durable before their offsets
+    # are recorded
+    if not analytics.dlq.flush():
+        return False
+    if analytics.archive is not None and not analytics.archive.flush():
+        return False
+    if not analytics.flush():
+        return False
+    if consumer is not None:
+        try:
+            consumer.commit()
+        except Exception as e:
+            # Redis already holds the offsets, so recovery stays exact
+            logger.warning(f"⚠️ Kafka offset commit failed: {e}")
+    return True
+
+
+def route_event(topic: str, event: Dict[str, Any]) -> bool:
+    """Dispatch a decoded event to the matching handler; handler errors propagate"""
+    event_type = event.get("event", "unknown")
+    logger.info(f"📨 {topic} -> {event_type}")
+
+    success = False
+    if any(word in topic.lower() for word in ["order"]) or any(
+        word in event_type.lower() for word in ["order", "checkout"]
+    ):
+        success = analytics.process_order_event(event, topic)
+    elif any(word in topic.lower() for word in ["user"]) or any(
+        word in event_type.lower() for word in ["user", "cart", "login", "register"]
+    ):
+        success = analytics.process_user_event(event, topic)
+    else:
+        logger.warning(f"⚠️ Unknown event: {event_type}")
+        analytics.log_event_received(topic, event_type, False)
+
+    if success:
+        logger.info(f"✅ Event processed successfully")
+    return success
+
+
+def handle_message(message) -> bool:
+    """Process one Kafka message, never raising.
+
+    Returns False if the message failed and was sent to the dead-letter topic.
+    """
+    try:
+        topic = message.topic
+        event = message.value
+
+        # Skip invalid events
+        if event is None:
+            logger.warning(f"⚠️ Skipping null event from {topic}")
+            return True
+
+        if isinstance(event, UndecodableMessage):
+            instrumentation.observe_failure(topic)
+            analytics.log_event_received(topic, "undecodable", False)
+            analytics.dlq.publish(message, ValueError(event.error))
+            return False
+
+        if not isinstance(event, dict):
+            logger.warning(f"⚠️ Skipping non-dict event from {topic}: {type(event)}")
+            return True
+
+        analytics.track_funnel(event, message.partition)
+        started = time.perf_counter()
+        try:
+            with analytics.aggregator.transaction():
+                route_event(topic, event)
+        except Exception:
+            instrumentation.observe_event(
+                topic, event, time.perf_counter() - started, False, message
+            )
+            raise
+        instrumentation.observe_event(
+            topic, event, time.perf_counter() - started, True, message
+        )
+        if analytics.archive is not None:
+            analytics.archive.record(topic, event, message)
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Error processing message: {e}")
+        try:
+            analytics.log_event_received(message.topic, "processing_error", False)
+            analytics.dlq.publish(message, e)
+        except Exception as dlq_error:
+            logger.error(f"❌ Could not dead-letter message: {dlq_error}")
+        return False
+
+
+def process_batch(messages) -> int:
+    """Handle one poll's messages, skipping events that were already counted.
+
+    Ids are checked against Redis in one round trip per batch; ids handled
+    since the last flush are checked in memory. Returns the number skipped.
+    """
+    event_ids = [
+        event_identity(m.value, m.topic, m.partition, m.offset) for m in messages
+    ]
+    duplicates = 0
+    for message, event_id, seen in zip(
+        messages, event_ids, analytics.dedupe.seen(event_ids)
+    ):
+        with analytics.aggregator.atomic():
+            if seen or analytics.aggregator.is_pending(event_id):
+                duplicates += 1
+                instrumentation.observe_duplicates(message.topic)
+                logger.info(f"♻️ Skipping duplicate event {event_id}")
+            elif handle_message(message):
+                analytics.aggregator.record_event_id(event_id)
+            analytics.aggregator.mark_offset(
+                message.topic, message.partition, message.offset + 1
+            )
+    return duplicates
+
+
+def replay_envelope(envelope: Dict[str, Any]):
+    """Run a dead-lettered event through the live handlers again.
+
+    The funnel is skipped: its sessions belong to the consumer owning the
+    partition, and a late replay would reopen sessions that already closed.
+    The event id goes into the same transaction as its deltas, so any flush
+    that writes them also marks the event as processed.
+    """
+    with analytics.aggregator.transaction():
+        route_event(envelope["source"]["topic"], envelope["event"])
+        analytics.aggregator.record_event_id(envelope_identity(envelope))
+    if analytics.archive is not None:
+        analytics.archive.record(envelope["source"]["topic"], envelope["event"])
+
+
+def flush_replayed(event_ids):
+    """Write a replayed chunk's deltas and event ids before the next chunk.
+
+    Goes through the consumer's ordered flush, so the dead letters,
+    archived events and funnel sessions buffered alongside are durable
+    before the offsets written with the same deltas.
+    """
+    if not flush_and_commit(None):
+        raise RuntimeError("Flush failed; replayed events will be retried")
+
+
+def create_replay_job(rate: float, concurrency: int) -> ReplayJob:
+    return ReplayJob(
+        analytics.redis_client,
+        "analytics:dlq",
+        analytics.dlq,
+        analytics.dedupe,
+        handler=replay_envelope,
+        on_chunk=flush_replayed,
+        rate=rate,
+        concurrency=concurrency,
+        max_attempts=settings.DLQ_MAX_ATTEMPTS,
+    )
+
+
+def replay_dead_letters(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    partitions: Optional[list] = None,
+    rate: float = settings.DLQ_REPLAY_RATE,
+    concurrency: int = settings.DLQ_REPLAY_CONCURRENCY,
+    job: Optional[ReplayJob] = None,
+) -> Dict[str, Any]:
+    """Replay a range of the analytics dead-letter topic (used by CLI and API)"""
+    job = job or create_replay_job(rate, concurrency)
+    if not job.acquire():
+        raise RuntimeError("Another dead-letter replay is already running")
+    try:
+        return job.run(
+            read_dead_letters(
+                KAFKA_SERVERS,
+                analytics.dlq.topic,
+                since=since,
+                until=until,
+                start_offset=start_offset,
+                end_offset=end_offset,
+                partitions=partitions,
+            )
+        )
+    finally:
+        job.release()
+
+
+def backfill_from_postgres(
+    database_url: str = settings.DATABASE_URL,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    jobs: int = settings.BACKFILL_JOBS,
+    chunk_rows: int = settings.BACKFILL_CHUNK_ROWS,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Rebuild order metrics from the orders database (used by `python backfill.py`)"""
+    # Each day touched is overwritten, so a range must not cut a day short
+    since, until = whole_day(since), whole_day(until)
+    started = time.perf_counter()
+    recent_from = day_of(datetime.now()) - settings.METRICS_RETENTION_DAYS - 1
+    totals, users = run_backfill(
+        database_url, recent_from, since, until, jobs=jobs, chunk_rows=chunk_rows
+    )
+    result: Dict[str, Any] = {
+        "rows": totals.rows,
+        "days": len(totals.daily()),
+        "scan_seconds": round(time.perf_counter() - started, 2),
+    }
+    if not dry_run:
+        partial = since is not None or until is not None
+        result.update(analytics.write_backfill(totals, None if partial else users))
+        analytics.refresh_snapshot(force=True)
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"✅ Backfill finished: {result}")
+    return result
+
+
+def kafka_consumer_worker(worker_id: str = "main"):
     """Background worker to consume Kafka messages with robust error handling"""
     global kafka_consumer
 
     retry_count = 0
     max_retries = 5
+    reporter: Optional[ConsumerStatusReporter] = None
+    lag = instrumentation.LagTracker(settings.CONSUMER_STATUS_INTERVAL_SECONDS)
 
-    while retry_count < max_retries:
+    while retry_count < max_retries and not consumer_stop.is_set():
         try:
             logger.info(f"🔄 Starting Kafka consumer (attempt {retry_count + 1})")
             logger.info(f"📡 Servers: {KAFKA_SERVERS}")
             logger.info(f"📋 Topics: {KAFKA_TOPICS}")
 
+            # Offsets are committed manually after each aggregator flush. The
+            # range assignor gives partition N of every topic to the same
+            # member, so all of a user's events (keyed by user id) meet in
+            # one worker; members are ordered by client id, which keeps the
+            # assignment stable across rebalances.
             kafka_consumer = KafkaConsumer(
-                *KAFKA_TOPICS,
                 bootstrap_servers=KAFKA_SERVERS,
                 group_id=CONSUMER_GROUP,
+                client_id=f"analytics-{worker_id}",
                 value_deserializer=safe_json_deserializer,  # Use our safe deserializer
                 auto_offset_reset="earliest",
-                enable_auto_commit=True,
-                auto_commit_interval_ms=1000,
-                consumer_timeout_ms=10000,
+                enable_auto_commit=False,
                 fetch_min_bytes=1,
                 fetch_max_wait_ms=500,
+                partition_assignment_strategy=[RangePartitionAssignor],
+            )
+            kafka_consumer.subscribe(
+                topics=KAFKA_TOPICS, listener=OffsetRecoveryListener(kafka_consumer)
+            )
+            reporter = ConsumerStatusReporter(
+                analytics.redis_client,
+                CONSUMER_STATUS_KEY,
+                worker_id,
+                settings.CONSUMER_STATUS_INTERVAL_SECONDS,
             )
 
-            logger.info("✅ Kafka consumer connected!")
+            logger.info(f"✅ Kafka consumer {worker_id} connected!")
+            if analytics.archive is not None:
+                # Staging files of a worker that died before publishing them
+                analytics.archive.recover()
             retry_count = 0  # Reset on successful connection
 
-            for message in kafka_consumer:
-                try:
-                    topic = message.topic
-                    event = message.value
-
-                    # Skip invalid events
-                    if event is None:
-                        logger.warning(f"⚠️ Skipping null event from {topic}")
-                        continue
-
-                    if not isinstance(event, dict):
-                        logger.warning(
-                            f"⚠️ Skipping non-dict event from {topic}: {type(event)}"
-                        )
-                        continue
-
-                    event_type = event.get("event", "unknown")
-                    logger.info(f"📨 {topic} -> {event_type}")
-
-                    # Route events
-                    success = False
-                    if any(word in topic.lower() for word in ["order"]) or any(
-                        word in event_type.lower() for word in ["order", "checkout"]
-                    ):
-                        success = analytics.process_order_event(event, topic)
-                    elif any(word in topic.lower() for word in ["user"]) or any(
-                        word in event_type.lower()
-                        for word in ["user", "cart", "login", "register"]
-                    ):
-                        success = analytics.process_user_event(event, topic)
-                    else:
-                        logger.warning(f"⚠️ Unknown event: {event_type}")
-                        analytics.log_event_received(topic, event_type, False)
-
-                    if success:
-                        logger.info(f"✅ Event processed successfully")
-
-                except Exception as e:
-                    logger.error(f"❌ Error processing message: {e}")
-                    try:
-                        # Try to log the failed event
-                        if hasattr(message, "topic") and hasattr(message, "value"):
-                            analytics.log_event_received(
-                                message.topic, "processing_error", False
-                            )
-                    except:
-                        pass
-                    continue
+            while not consumer_stop.is_set():
+                batches = kafka_consumer.poll(
+                    timeout_ms=settings.CONSUMER_TIMEOUT_MS,
+                    max_records=settings.AGGREGATION_FLUSH_MAX_EVENTS,
+                )
+                started = time.perf_counter()
+                messages = [m for batch in batches.values() for m in batch]
+                if messages:
+                    instrumentation.BATCH_SIZE.observe(len(messages))
+                    process_batch(messages)
+
+                if analytics.aggregator.should_flush():
+                    flush_and_commit(kafka_consumer)
+                analytics.refresh_pending_snapshot()
+                reporter.record(len(messages), time.perf_counter() - started)
+                reporter.maybe_report(kafka_consumer)
+                lag.maybe_update(kafka_consumer)
 
         except Exception as e:
             retry_count += 1
@@ -430,30 +1262,65 @@ def kafka_consumer_worker():
             if retry_count < max_retries:
                 wait_time = min(2**retry_count, 30)
                 logger.info(f"⏳ Retrying in {wait_time} seconds...")
-                import time
-
-                time.sleep(wait_time)
+                consumer_stop.wait(wait_time)
             else:
                 logger.error("❌ Max retries reached")
                 break
         finally:
             if kafka_consumer:
                 try:
-                    kafka_consumer.close()
+                    flush_and_commit(kafka_consumer)
+                    kafka_consumer.close(autocommit=False)
+                    lag.clear()
+                    if analytics.archive is not None:
+                        analytics.archive.close()
+                    if reporter:
+                        reporter.clear()
                 except:
                     pass
 
 
+def snapshot_refresher():
+    """Refresh the summary snapshot when consumer processes report a flush.
+
+    Bursts of flushes from several workers are coalesced into at most one
+    rebuild per SNAPSHOT_MIN_INTERVAL_MS.
+    """
+    interval = settings.SNAPSHOT_MIN_INTERVAL_MS / 1000.0
+    while not consumer_stop.is_set():
+        try:
+            pubsub = analytics.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(FLUSH_CHANNEL)
+            pending = False
+            while not consumer_stop.is_set():
+                if pubsub.get_message(timeout=interval):
+                    pending = True
+                    continue
+                if pending and analytics.refresh_snapshot() is not None:
+                    pending = False
+        except Exception as e:
+            logger.error(f"❌ Snapshot refresher error: {e}")
+            consumer_stop.wait(5)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan management"""
-    global consumer_thread
+    global consumer_thread, consumer_pool
 
     logger.info("🚀 Starting Analytics Service...")
 
     try:
+        analytics.live.bind_loop(asyncio.get_running_loop())
         analytics.initialize_metrics()
-        consumer_thread = threading.Thread(target=kafka_consumer_worker, daemon=True)
+        analytics.migrate_popular_products()
+        if settings.MAX_WORKERS > 1:
+            # Consumers run in their own processes; this one serves the API
+            consumer_pool = ConsumerPool(settings.MAX_WORKERS)
+            consumer_pool.start()
+            consumer_thread = threading.Thread(target=snapshot_refresher, daemon=True)
+        else:
+            consumer_thread = threading.Thread(target=kafka_consumer_worker, daemon=True)
         consumer_thread.start()
         logger.info("✅ Analytics Service started")
     except Exception as e:
@@ -463,8 +1330,13 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("🛑 Shutting down...")
-    if kafka_consumer:
-        kafka_consumer.close()
+    consumer_stop.set()
+    if consumer_pool:
+        consumer_pool.stop(timeout=30)
+    if consumer_thread:
+        consumer_thread.join(timeout=30)
+    # Anything left over (e.g. the consumer never connected) still reaches Redis
+    analytics.flush()
 
 
 # FastAPI application
@@ -504,9 +1376,13 @@ def health_check():
             "services": {
                 "redis": "connected",
                 "kafka_consumer": (
-                    "active"
-                    if consumer_thread and consumer_thread.is_alive()
-                    else "inactive"
+                    f"{consumer_pool.alive()}/{consumer_pool.processes} workers"
+                    if consumer_pool
+                    else (
+                        "active"
+                        if consumer_thread and consumer_thread.is_alive()
+                        else "inactive"
+                    )
                 ),
             },
         }
@@ -515,8 +1391,357 @@ def health_check():
 
 
 @app.get("/metrics")
-def get_all_metrics():
-    return analytics.get_metrics_summary()
+def get_all_metrics(request: Request):
+    """Summary served from the precomputed snapshot, with ETag revalidation"""
+    body, etag = analytics.get_summary_snapshot()
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["ETag"] = etag
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/metrics/stream")
+async def stream_metrics(request: Request):
+    """Server-Sent Events: a full snapshot first, then deltas as batches land"""
+    try:
+        analytics.live.check_capacity()
+    except TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    if analytics.live.summary is None:
+        await run_in_threadpool(analytics.refresh_snapshot, True)
+
+    async def event_stream():
+        # Subscribed only once the body starts: a client gone before then,
+        # or an error above, never holds a slot
+        try:
+            subscriber = analytics.live.subscribe()
+        except TooManySubscribers:
+            return
+        try:
+            async for chunk in analytics.live.sse_stream(subscriber):
+                if await request.is_disconnected():
+                    break
+                yield chunk
+        finally:
+            analytics.live.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/metrics/ws")
+async def metrics_websocket(websocket: WebSocket):
+    """WebSocket variant of /metrics/stream sending {"type", "data"} frames"""
+    try:
+        subscriber = analytics.live.subscribe()
+    except TooManySubscribers:
+        await websocket.close(code=1013)
+        return
+
+    try:
+        await websocket.accept()
+        if analytics.live.summary is None:
+            await run_in_threadpool(analytics.refresh_snapshot, True)
+
+        async for message in analytics.live.messages(subscriber):
+            if message is None:
+                await websocket.send_text('{"type":"keepalive"}')
+            else:
+                event, body = message
+                await websocket.send_text(f'{{"type":"{event}","data":{body.decode()}}}')
+    except WebSocketDisconnect:
+        pass
+    finally:
+        analytics.live.unsubscribe(subscriber)
+
+
+@app.get("/metrics/range")
+def get_metrics_range(
+    from_: str = Query(..., alias="from"),
+    to: Optional[str] = None,
+    step: str = "auto",
+):
+    """Orders, revenue, registrations and cart actions per bucket from the rollups"""
+    start = parse_timestamp(from_)
+    end = parse_timestamp(to) if to else datetime.now()
+    if start is None or end is None:
+        raise HTTPException(status_code=400, detail="Invalid from/to timestamp")
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    if step == "auto":
+        step = analytics.choose_rollup_step(start, end)
+    elif step not in ROLLUP_STEPS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"step must be one of: auto, {', '.join(ROLLUP_STEPS)}",
+        )
+
+    if count_buckets(start, end, step) > settings.MAX_RANGE_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range spans more than {settings.MAX_RANGE_BUCKETS} {step} buckets",
+        )
+
+    try:
+        return analytics.get_metrics_range(start, end, step)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics/products/top")
+def get_top_products(window: str = "all", limit: int = 10, at: Optional[str] = None):
+    """Top-N products overall or for the hour/day containing `at` (default now)"""
+    if window != "all" and window not in LEADERBOARD_WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"window must be one of: all, {', '.join(LEADERBOARD_WINDOWS)}",
+        )
+    when = parse_timestamp(at) if at else datetime.now()
+    if when is None:
+        raise HTTPException(status_code=400, detail="Invalid 'at' timestamp")
+    limit = max(1, min(limit, 100))
+
+    try:
+        top = analytics.get_top_products(window, limit, when)
+        return {
+            "window": window,
+            "bucket": None if window == "all" else bucket_id(when, window),
+            "products": [
+                {"product_id": pid, "quantity_sold": qty} for pid, qty in top
+            ],
+            "timestamp": datetime.now().isoformat(),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics/uniques")
+def get_unique_users(
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    step: str = "day",
+):
+    """Approximate distinct viewers, cart users and buyers (HyperLogLog, ~0.81% error)"""
+    if step not in UNIQUE_WINDOWS:
+        raise HTTPException(
+            status_code=400, detail=f"step must be one of: {', '.join(UNIQUE_WINDOWS)}"
+        )
+    end = parse_timestamp(to) if to else datetime.now()
+    start = parse_timestamp(from_) if from_ else end
+    if start is None or end is None:
+        raise HTTPException(status_code=400, detail="Invalid from/to timestamp")
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if count_buckets(start, end, step) > settings.MAX_RANGE_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range spans more than {settings.MAX_RANGE_BUCKETS} {step} buckets",
+        )
+
+    try:
+        return analytics.get_unique_counts(start, end, step)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics/quantiles")
+def get_quantiles(
+    metric: str = "order_value",
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    step: str = "day",
+):
+    """p50/p90/p99 of order value or items per order over the requested buckets"""
+    if metric not in DIGEST_METRICS:
+        raise HTTPException(
+            status_code=400, detail=f"metric must be one of: {', '.join(DIGEST_METRICS)}"
+        )
+    if step not in DIGEST_WINDOWS:
+        raise HTTPException(
+            status_code=400, detail=f"step must be one of: {', '.join(DIGEST_WINDOWS)}"
+        )
+    end = parse_timestamp(to) if to else datetime.now()
+    start = parse_timestamp(from_) if from_ else end
+    if start is None or end is None:
+        raise HTTPException(status_code=400, detail="Invalid from/to timestamp")
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if count_buckets(start, end, step) > settings.MAX_RANGE_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range spans more than {settings.MAX_RANGE_BUCKETS} {step} buckets",
+        )
+
+    try:
+        return {
+            "metric": metric,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "step": step,
+            **analytics.get_quantiles(metric, start, end, step),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics/funnel")
+def get_funnel(step: str = "day", at: Optional[str] = None, limit: int = 10):
+    """View -> cart -> checkout -> order conversion for the hour/day containing `at`"""
+    if step not in FUNNEL_WINDOWS:
+        raise HTTPException(
+            status_code=400, detail=f"step must be one of: {', '.join(FUNNEL_WINDOWS)}"
+        )
+    when = parse_timestamp(at) if at else datetime.now()
+    if when is None:
+        raise HTTPException(status_code=400, detail="Invalid 'at' timestamp")
+
+    try:
+        return analytics.get_funnel(step, when, max(1, min(limit, 100)))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics/consumers")
+def get_consumer_status():
+    """Per-partition lag, throughput and a worker-count hint for autoscalers"""
+    try:
+        status = analytics.get_consumer_status()
+        status["timestamp"] = datetime.now().isoformat()
+        return status
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics/prometheus")
+def get_prometheus_metrics():
+    """Consumer lag, batch sizes and event latencies in Prometheus text format"""
+    body, content_type = instrumentation.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/archive/query")
+def get_archive_query(
+    dataset: str = "events",
+    from_: str = Query(..., alias="from"),
+    to: Optional[str] = None,
+    topic: Optional[List[str]] = Query(None),
+    where: Optional[List[str]] = Query(None, description="column:value, repeatable"),
+    columns: Optional[str] = None,
+    group_by: Optional[str] = None,
+    metric: Optional[List[str]] = Query(None, description="column:aggregation"),
+    bucket: Optional[str] = None,
+    limit: int = 1000,
+):
+    """Ad-hoc scans of the event archive.
+
+    Revenue by product by week, for example, is dataset=items,
+    group_by=product_id, metric=revenue:sum, bucket=week. Aggregations are
+    sum, count, min, max and mean; buckets are hour, day, week and month.
+    """
+    if analytics.archive is None:
+        raise HTTPException(status_code=503, detail="Event archive is disabled")
+    start = parse_timestamp(from_)
+    end = parse_timestamp(to) if to else datetime.now()
+    if start is None or end is None:
+        raise HTTPException(status_code=400, detail="Invalid from/to timestamp")
+
+    filters: Dict[str, List[str]] = {}
+    metrics = []
+    try:
+        for condition in where or []:
+            column, value = condition.split(":", 1)
+            filters.setdefault(column, []).append(value)
+        for spec in metric or []:
+            column, aggregation = spec.split(":", 1)
+            metrics.append((column, aggregation))
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="where/metric must look like column:value"
+        )
+
+    try:
+        return query_archive(
+            settings.ARCHIVE_DIR,
+            dataset,
+            start,
+            end,
+            topics=topic,
+            where=filters,
+            columns=columns.split(",") if columns else None,
+            group_by=group_by.split(",") if group_by else None,
+            metrics=metrics,
+            bucket=bucket,
+            limit=max(1, min(limit, settings.ARCHIVE_QUERY_MAX_ROWS)),
+        )
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/dlq/replay", status_code=202)
+def start_dlq_replay(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    partition: Optional[int] = None,
+    rate: float = Query(settings.DLQ_REPLAY_RATE, gt=0, le=10000),
+    concurrency: int = Query(settings.DLQ_REPLAY_CONCURRENCY, ge=1, le=32),
+):
+    """Replay a range of dead-lettered events in the background"""
+    global replay_job
+
+    bounds = {}
+    for name, value in (("since", since), ("until", until)):
+        if value:
+            parsed = parse_timestamp(value)
+            if parsed is None:
+                raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+            bounds[name] = parsed
+
+    job = create_replay_job(rate, concurrency)
+    if not job.acquire():
+        raise HTTPException(status_code=409, detail="A replay is already running")
+    replay_job = job
+
+    def run():
+        try:
+            replay_dead_letters(
+                start_offset=start_offset,
+                end_offset=end_offset,
+                partitions=[partition] if partition is not None else None,
+                job=job,
+                **bounds,
+            )
+        except Exception as e:
+            logger.error(f"❌ Dead-letter replay failed: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
+    return {"job_id": job.job_id, "topic": analytics.dlq.topic, "state": "starting"}
+
+
+@app.get("/dlq/replay")
+def get_dlq_replay():
+    status = get_replay_status(analytics.redis_client, "analytics:dlq")
+    if replay_job is not None and replay_job.job_id == status.get("job_id"):
+        status["live"] = dict(replay_job.stats)
+    return status
+
+
+@app.post("/dlq/replay/stop")
+def stop_dlq_replay():
+    if replay_job is None:
+        raise HTTPException(status_code=404, detail="No replay started here")
+    replay_job.stop_event.set()
+    return {"job_id": replay_job.job_id, "state": "stopping"}
 
 
 @app.get("/debug/events")
@@ -535,6 +1760,13 @@ def get_events_debug():
         return {
             "events_processed": dict(processed),
             "events_failed": dict(failed),
+            "aggregator": analytics.aggregator.get_stats(),
+            "live": analytics.live.get_stats(),
+            "json_decoding": dict(json_codec.stats),
+            "dedupe": analytics.dedupe.get_stats(),
+            "dead_letters": analytics.dlq.get_stats(),
+            "archive": analytics.archive.get_stats() if analytics.archive else None,
+            "workers": consumer_pool.get_stats() if consumer_pool else None,
             "timestamp": datetime.now().isoformat(),
         }
     except Exception as e:
@@ -546,7 +1778,9 @@ def reset_metrics():
     try:
         for key in analytics.metrics_keys.values():
             analytics.redis_client.delete(key)
+        analytics.redis_client.delete(LEGACY_POPULAR_HASH)
         analytics.initialize_metrics()
+        analytics.refresh_snapshot(force=True)
         return {"message": "Metrics reset", "timestamp": datetime.now().isoformat()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,68 @@
+# microservices/analytics-service/rollups.py
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+# Every event is written into all granularities at once, so coarser buckets
+# are always the exact downsampled sum of the finer ones.
+ROLLUP_STEPS: Dict[str, Dict[str, Any]] = {
+    "minute": {"format": "%Y%m%d%H%M", "delta": timedelta(minutes=1)},
+    "hour": {"format": "%Y%m%d%H", "delta": timedelta(hours=1)},
+    "day": {"format": "%Y%m%d", "delta": timedelta(days=1)},
+}
+
+ROLLUP_KEY_PREFIX = "analytics:rollup"
+
+
+def floor_time(ts: datetime, step: str) -> datetime:
+    """Align a timestamp to the start of its bucket"""
+    if step == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if step == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if step == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup step: {step}")
+
+
+def bucket_id(ts: datetime, step: str) -> str:
+    return ts.strftime(ROLLUP_STEPS[step]["format"])
+
+
+def rollup_key(step: str, bucket: str) -> str:
+    return f"{ROLLUP_KEY_PREFIX}:{step}:{bucket}"
+
+
+def iter_buckets(start: datetime, end: datetime, step: str) -> List[datetime]:
+    """Bucket start times covering [start, end], oldest first"""
+    delta = ROLLUP_STEPS[step]["delta"]
+    current = floor_time(start, step)
+    buckets = []
+    while current <= end:
+        buckets.append(current)
+        current += delta
+    return buckets
+
+
+def count_buckets(start: datetime, end: datetime, step: str) -> int:
+    span = floor_time(end, step) - floor_time(start, step)
+    return int(span / ROLLUP_STEPS[step]["delta"]) + 1
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parse an ISO timestamp or epoch seconds into a naive local datetime"""
+    if value is None or value == "":
+        return None
+    try:
+        if isinstance(value, (int, float)) or str(value).replace(".", "", 1).isdigit():
+            return datetime.fromtimestamp(float(value))
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if ts.tzinfo is not None:
+            ts = ts.astimezone().replace(tzinfo=None)
+        return ts
+    except (ValueError, TypeError, OverflowError, OSError):
+        return None
+
+
+def event_time(event: Dict[str, Any]) -> datetime:
+    """When the event happened according to the producer, falling back to now"""
+    return parse_timestamp(event.get("timestamp")) or datetime.now()
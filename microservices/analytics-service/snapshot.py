@@ -0,0 +1,58 @@
+# microservices/analytics-service/snapshot.py
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Fields that change on every rebuild and must not invalidate client caches
+VOLATILE_FIELDS = ("timestamp",)
+
+
+class SummarySnapshot:
+    """The latest metrics summary, serialized once and shared by every request"""
+
+    def __init__(self, max_age_ms: int = 2000):
+        self.max_age = max_age_ms / 1000.0
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.summary: Optional[Dict[str, Any]] = None
+        self.built_at = 0.0
+        self.version = 0
+        self._lock = threading.Lock()
+        # Held while a stale snapshot is rebuilt so concurrent requests wait
+        # for one rebuild instead of each hitting Redis
+        self.rebuild_lock = threading.Lock()
+
+    @staticmethod
+    def compute_etag(summary: Dict[str, Any]) -> str:
+        stable = {k: v for k, v in summary.items() if k not in VOLATILE_FIELDS}
+        digest = hashlib.blake2b(
+            json.dumps(stable, sort_keys=True, default=str).encode(), digest_size=12
+        ).hexdigest()
+        return f'"{digest}"'
+
+    def update(self, summary: Dict[str, Any]) -> Tuple[bytes, str]:
+        body = json.dumps(summary, separators=(",", ":"), default=str).encode()
+        etag = self.compute_etag(summary)
+        with self._lock:
+            if etag != self.etag:
+                self.version += 1
+            self.summary = summary
+            self.body = body
+            self.etag = etag
+            self.built_at = time.monotonic()
+            return body, etag
+
+    def get(self) -> Optional[Tuple[bytes, str]]:
+        """(body, etag) if the snapshot is fresh enough to serve, else None"""
+        with self._lock:
+            if self.body is None or time.monotonic() - self.built_at > self.max_age:
+                return None
+            return self.body, self.etag
+
+    def age_ms(self) -> Optional[int]:
+        with self._lock:
+            if self.body is None:
+                return None
+            return int((time.monotonic() - self.built_at) * 1000)
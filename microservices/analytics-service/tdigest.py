@@ -0,0 +1,170 @@
+# microservices/analytics-service/tdigest.py
+import base64
+import math
+import struct
+from typing import Iterable, List, Optional
+
+# Header: compression, total weight, min, max, centroid count
+_HEADER = struct.Struct("<ddddI")
+_CENTROID = struct.Struct("<ff")
+
+
+class TDigest:
+    """Merging t-digest (Dunning & Ertl) for streaming quantiles.
+
+    Values are buffered and periodically merged into at most ~compression
+    centroids using the k1 (arcsine) scale function, which keeps the tails
+    accurate - exactly where the whale orders live. Digests are mergeable, so
+    partial digests from several flushes or workers combine losslessly enough
+    to serve p50/p90/p99 per time bucket.
+    """
+
+    def __init__(self, compression: float = 100.0):
+        self.compression = compression
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self.total_weight = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: List[tuple] = []
+        self._buffer_limit = int(compression * 10)
+
+    def __len__(self) -> int:
+        return int(self.total_weight)
+
+    # ----- updates -----
+    def add(self, value: float, weight: float = 1.0):
+        if value != value:  # NaN
+            return
+        self._buffer.append((value, weight))
+        self.total_weight += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self._buffer) >= self._buffer_limit:
+            self._compress()
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """Fold `other` into this digest in place"""
+        other._compress()
+        if not other.total_weight:
+            return self
+        self._buffer.extend(zip(other.means, other.weights))
+        self.total_weight += other.total_weight
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k_to_q(self, k: float) -> float:
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _q_to_k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        items = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+        total = self.total_weight
+
+        means, weights = [], []
+        cur_mean, cur_weight = items[0]
+        weight_so_far = 0.0
+        q_limit = self._k_to_q(self._q_to_k(0.0) + 1)
+
+        for mean, weight in items[1:]:
+            if (weight_so_far + cur_weight + weight) / total <= q_limit:
+                cur_weight += weight
+                cur_mean += (mean - cur_mean) * weight / cur_weight
+            else:
+                weight_so_far += cur_weight
+                means.append(cur_mean)
+                weights.append(cur_weight)
+                q_limit = self._k_to_q(self._q_to_k(weight_so_far / total) + 1)
+                cur_mean, cur_weight = mean, weight
+        means.append(cur_mean)
+        weights.append(cur_weight)
+
+        self.means, self.weights = means, weights
+
+    # ----- queries -----
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not self.total_weight:
+            return None
+        if len(self.means) == 1 or q <= 0:
+            return self.means[0] if q > 0 else self.min
+        if q >= 1:
+            return self.max
+
+        target = q * self.total_weight
+        means, weights = self.means, self.weights
+
+        # Left tail: interpolate from the observed minimum to the first centroid
+        if target < weights[0] / 2:
+            return self.min + (means[0] - self.min) * target / (weights[0] / 2)
+
+        cumulative = 0.0
+        for i in range(len(means) - 1):
+            left_center = cumulative + weights[i] / 2
+            right_center = cumulative + weights[i] + weights[i + 1] / 2
+            if target <= right_center:
+                span = right_center - left_center
+                fraction = (target - left_center) / span if span else 0.0
+                return means[i] + (means[i + 1] - means[i]) * fraction
+            cumulative += weights[i]
+
+        # Right tail: interpolate from the last centroid to the observed maximum
+        last_center = self.total_weight - weights[-1] / 2
+        span = self.total_weight - last_center
+        fraction = (target - last_center) / span if span else 1.0
+        return means[-1] + (self.max - means[-1]) * min(fraction, 1.0)
+
+    def percentiles(self, *percents: float) -> dict:
+        return {f"p{p:g}": self.quantile(p / 100) for p in percents}
+
+    # ----- persistence -----
+    def to_bytes(self) -> bytes:
+        """Compact binary form: fixed header plus float32 (mean, weight) pairs"""
+        self._compress()
+        parts = [
+            _HEADER.pack(
+                self.compression,
+                self.total_weight,
+                self.min,
+                self.max,
+                len(self.means),
+            )
+        ]
+        parts.extend(_CENTROID.pack(m, w) for m, w in zip(self.means, self.weights))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        compression, total, min_value, max_value, count = _HEADER.unpack_from(data)
+        digest = cls(compression)
+        digest.total_weight = total
+        digest.min = min_value
+        digest.max = max_value
+        offset = _HEADER.size
+        for _ in range(count):
+            mean, weight = _CENTROID.unpack_from(data, offset)
+            digest.means.append(mean)
+            digest.weights.append(weight)
+            offset += _CENTROID.size
+        return digest
+
+    def serialize(self) -> str:
+        """ASCII-safe encoding for Redis clients using decode_responses=True"""
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def deserialize(cls, data: str) -> "TDigest":
+        return cls.from_bytes(base64.b64decode(data))
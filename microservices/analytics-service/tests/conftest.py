@@ -0,0 +1,34 @@
+# microservices/analytics-service/tests/conftest.py
+import importlib
+import os
+import sys
+from unittest import mock
+
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def redis_client():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    yield client
+    client.flushall()
+
+
+@pytest.fixture
+def service():
+    """A fresh AnalyticsService on fakeredis, installed as `main.analytics`"""
+    server = fakeredis.FakeServer()
+
+    def from_url(url, **kwargs):
+        return fakeredis.FakeRedis(
+            server=server, decode_responses=kwargs.get("decode_responses", False)
+        )
+
+    with mock.patch("redis.from_url", from_url):
+        main = importlib.import_module("main")
+        main.analytics = main.AnalyticsService()
+    yield main.analytics
+    main.analytics.redis_client.flushall()
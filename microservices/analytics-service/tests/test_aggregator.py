@@ -0,0 +1,104 @@
+# microservices/analytics-service/tests/test_aggregator.py
+import pytest
+import redis
+
+from aggregator import MetricsAggregator
+
+
+class FailingFlushes:
+    """Wraps a Redis client so the next `failures` pipelines fail on EXEC"""
+
+    def __init__(self, client, failures: int = 1):
+        self.client = client
+        self.failures = failures
+
+    def pipeline(self, transaction=True):
+        pipe = self.client.pipeline(transaction=transaction)
+        if self.failures:
+            self.failures -= 1
+
+            def execute(raise_on_error=True):
+                raise redis.ConnectionError("connection lost")
+
+            pipe.execute = execute
+        return pipe
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_flush_writes_deltas_and_offsets_together(redis_client):
+    aggregator = MetricsAggregator(redis_client)
+    for offset in range(3):
+        aggregator.incr("orders", 1)
+        aggregator.incrbyfloat("revenue", 2.5)
+        aggregator.hincrby("events", "order_created")
+        aggregator.mark_offset("orders", 0, offset + 1)
+
+    assert redis_client.get("orders") is None
+    assert aggregator.flush()
+    assert redis_client.get("orders") == "3"
+    assert float(redis_client.get("revenue")) == 7.5
+    assert redis_client.hget("events", "order_created") == "3"
+    assert aggregator.get_committed_offsets() == {("orders", 0): 3}
+    assert aggregator.get_stats()["pending_events"] == 0
+
+
+def test_flushing_again_writes_nothing(redis_client):
+    aggregator = MetricsAggregator(redis_client)
+    aggregator.incr("orders", 2)
+    aggregator.mark_offset("orders", 0, 1)
+    assert aggregator.flush()
+    assert aggregator.flush()
+    assert redis_client.get("orders") == "2"
+    assert aggregator.get_stats()["flushes"] == 1
+
+
+def test_failed_flush_keeps_deltas_for_the_next_one(redis_client):
+    aggregator = MetricsAggregator(FailingFlushes(redis_client))
+    aggregator.incr("orders", 1)
+    aggregator.zincrby("products", "42", 2)
+    aggregator.hset("sessions", {"u1": "cart"})
+    aggregator.mark_offset("orders", 0, 5)
+
+    assert not aggregator.flush()
+    assert redis_client.get("orders") is None
+    assert aggregator.get_committed_offsets() == {}
+
+    # Recorded while Redis was down; newer field writes win over merged ones
+    aggregator.incr("orders", 1)
+    aggregator.hset("sessions", {"u1": "checkout"})
+    aggregator.mark_offset("orders", 0, 6)
+
+    assert aggregator.flush()
+    assert redis_client.get("orders") == "2"
+    assert redis_client.zscore("products", "42") == 2
+    assert redis_client.hget("sessions", "u1") == "checkout"
+    assert aggregator.get_committed_offsets() == {("orders", 0): 6}
+
+
+def test_failed_transaction_leaves_no_partial_deltas(redis_client):
+    aggregator = MetricsAggregator(redis_client)
+    with aggregator.transaction():
+        aggregator.incr("orders", 1)
+        aggregator.mark_offset("orders", 0, 1)
+    with pytest.raises(KeyError):
+        with aggregator.transaction():
+            aggregator.incr("orders", 1)
+            aggregator.hdel("sessions", {"u1"})
+            raise KeyError("total")
+
+    assert aggregator.flush()
+    assert redis_client.get("orders") == "1"
+    assert aggregator.get_stats()["events"] == 1
+
+
+def test_should_flush_once_enough_events_are_pending(redis_client):
+    aggregator = MetricsAggregator(
+        redis_client, flush_interval_ms=60_000, flush_max_events=2
+    )
+    assert not aggregator.should_flush()
+    aggregator.mark_offset("orders", 0, 1)
+    assert not aggregator.should_flush()
+    aggregator.mark_offset("orders", 0, 2)
+    assert aggregator.should_flush()
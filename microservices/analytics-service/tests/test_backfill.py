@@ -0,0 +1,21 @@
+# microservices/analytics-service/tests/test_backfill.py
+from datetime import datetime
+
+import pytest
+
+from backfill import parse_backfill_args, whole_day
+
+
+def test_date_range_is_parsed_as_whole_days():
+    args = parse_backfill_args(["--since", "2024-03-01", "--until", "2024-03-08"])
+    assert args.since == datetime(2024, 3, 1)
+    assert args.until == datetime(2024, 3, 8)
+
+
+def test_mid_day_bounds_are_rejected():
+    # A bound inside a day would overwrite that day's rollup with part of it
+    with pytest.raises(SystemExit):
+        parse_backfill_args(["--since", "2024-03-01T12:30:00"])
+    with pytest.raises(ValueError):
+        whole_day(datetime(2024, 3, 8, 0, 0, 1))
+    assert whole_day(None) is None
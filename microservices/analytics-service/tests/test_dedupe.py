@@ -0,0 +1,56 @@
+# microservices/analytics-service/tests/test_dedupe.py
+from types import SimpleNamespace
+
+import pytest
+
+from dedupe import EventDeduplicator, event_identity
+
+WINDOW = 3600
+NOW = 1_700_000_000.0
+
+
+@pytest.mark.parametrize("backend", ["set", "bloom"])
+def test_marked_ids_are_remembered_for_the_next_window(redis_client, backend):
+    dedupe = EventDeduplicator(
+        redis_client, "test:dedupe", WINDOW, backend=backend, bloom_capacity=1000
+    )
+    dedupe.mark(["a", "b"], now=NOW)
+    assert dedupe.seen(["a", "c", "b"], now=NOW) == [True, False, True]
+    assert dedupe.seen(["a"], now=NOW + WINDOW) == [True]
+    assert dedupe.seen(["a"], now=NOW + 2 * WINDOW) == [False]
+    assert redis_client.ttl(dedupe.key(dedupe.bucket(NOW))) == 2 * WINDOW
+
+
+def test_unavailable_redis_counts_every_id_as_new(redis_client):
+    dedupe = EventDeduplicator(redis_client, "test:dedupe", WINDOW)
+    redis_client.set(dedupe.key(dedupe.bucket(NOW)), "not a set")
+    assert dedupe.seen(["a", "b"], now=NOW) == [False, False]
+    assert dedupe.get_stats()["check_errors"] == 1
+
+
+def test_legacy_events_are_identified_by_their_coordinates():
+    assert event_identity({"event_id": "e1"}, "orders", 0, 5) == "e1"
+    assert event_identity({"event": "order_created"}, "orders", 2, 5) == "orders:2:5"
+    assert event_identity(None, "orders", 2, 6) == "orders:2:6"
+
+
+def order_message(offset, event_id):
+    event = {"event": "order_created", "event_id": event_id, "total": 10.0}
+    return SimpleNamespace(
+        topic="orders", partition=0, offset=offset, value=event, timestamp=None
+    )
+
+
+def test_redelivered_orders_are_counted_once(service):
+    import main
+
+    orders_key = service.metrics_keys["orders_total"]
+    # The same id twice in one poll: the second is caught in memory
+    assert main.process_batch([order_message(0, "e1"), order_message(1, "e1")]) == 1
+    assert service.flush()
+    # Redelivered after the flush: caught by the ids written with it
+    assert main.process_batch([order_message(0, "e1"), order_message(2, "e2")]) == 1
+    assert service.flush()
+
+    assert service.redis_client.get(orders_key) == "2"
+    assert service.aggregator.get_committed_offsets() == {("orders", 0): 3}
@@ -0,0 +1,91 @@
+# microservices/analytics-service/tests/test_funnel.py
+from datetime import datetime, timedelta
+
+from funnel import FunnelEngine
+
+START = datetime(2024, 3, 1, 10, 0)
+EMAIL = "a@example.com"
+
+
+class Recorder:
+    def __init__(self):
+        self.emitted = []
+
+    def __call__(self, kind, name, when, product_id):
+        self.emitted.append((kind, name, product_id))
+
+    def stages(self):
+        return [name for kind, name, _ in self.emitted if kind == "stage"]
+
+    def products(self, outcome):
+        return sorted(p for kind, name, p in self.emitted if name == outcome)
+
+
+def feed(engine, events):
+    for minutes, event in events:
+        engine.process(event, START + timedelta(minutes=minutes))
+
+
+def test_stages_are_credited_once_in_funnel_order():
+    recorder = Recorder()
+    engine = FunnelEngine(recorder)
+    feed(
+        engine,
+        [
+            (0, {"event": "user_logged_in", "user_id": 7, "email": "A@example.com"}),
+            (1, {"event": "products_viewed", "user_id": 7}),
+            (2, {"event": "products_viewed", "user_id": 7}),
+            (3, {"event": "item_added_to_cart", "user_id": 7, "product_id": 1}),
+            (4, {"event": "item_added_to_cart", "user_id": 7, "product_id": 2}),
+            # Joined to the session through the email seen at login
+            (5, {"event": "checkout_session_created", "customer_email": EMAIL}),
+            (6, {"event": "order_created", "user_id": 7, "items": [{"product_id": 1}]}),
+        ],
+    )
+    assert recorder.stages() == ["view", "cart", "checkout", "order"]
+    assert recorder.products("added") == ["1", "2"]
+    assert recorder.products("ordered") == ["1"]
+    assert recorder.products("abandoned") == ["2"]
+    assert not engine.sessions
+
+
+def test_idle_sessions_close_as_abandoned():
+    recorder = Recorder()
+    engine = FunnelEngine(recorder, idle_timeout_s=600)
+    feed(
+        engine,
+        [
+            (0, {"event": "item_added_to_cart", "user_id": 1, "product_id": 5}),
+            (1, {"event": "item_added_to_cart", "user_id": 1, "product_id": 6}),
+            (2, {"event": "item_removed_from_cart", "user_id": 1, "product_id": 6}),
+            (30, {"event": "products_viewed", "user_id": 2}),
+        ],
+    )
+    assert list(engine.sessions) == ["2"]
+    assert recorder.products("removed") == ["6"]
+    assert recorder.products("abandoned") == ["5"]
+
+
+def test_unmatched_checkout_credits_nothing():
+    recorder = Recorder()
+    engine = FunnelEngine(recorder)
+    feed(engine, [(0, {"event": "checkout_session_created", "customer_email": "x@y"})])
+    assert recorder.stages() == []
+    assert engine.get_stats()["unmatched"] == 1
+
+
+def test_checkpointed_sessions_resume_on_another_worker(service):
+    service.track_funnel({"event": "products_viewed", "user_id": 3}, shard=4)
+    service.track_funnel(
+        {"event": "item_added_to_cart", "user_id": 3, "product_id": 9}, shard=4
+    )
+    assert service.flush()
+
+    recorder = Recorder()
+    successor = FunnelEngine(recorder)
+    entries = service.redis_client.hscan_iter(service.funnel_sessions_key(4))
+    assert successor.restore(entries, shard=4) == 1
+    successor.process({"event": "order_created", "user_id": 3, "items": []}, START)
+    # Stages already credited by the first worker are not counted again
+    assert recorder.stages() == ["order"]
+    assert recorder.products("abandoned") == ["9"]
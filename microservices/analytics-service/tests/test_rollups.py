@@ -0,0 +1,39 @@
+# microservices/analytics-service/tests/test_rollups.py
+from datetime import datetime
+
+from rollups import bucket_id, count_buckets, iter_buckets, parse_timestamp, rollup_key
+
+
+def test_buckets_cover_the_range_inclusively():
+    start, end = datetime(2024, 3, 1, 10, 15, 30), datetime(2024, 3, 1, 12, 0)
+    buckets = iter_buckets(start, end, "hour")
+    assert buckets == [datetime(2024, 3, 1, hour) for hour in (10, 11, 12)]
+    assert count_buckets(start, end, "hour") == 3
+    minutes = iter_buckets(start, end, "minute")
+    assert count_buckets(start, end, "minute") == len(minutes) == 106
+
+
+def test_timestamps_parse_to_naive_datetimes():
+    assert parse_timestamp("2024-03-01T10:15:00") == datetime(2024, 3, 1, 10, 15)
+    assert parse_timestamp("2024-03-01T10:15:00Z").tzinfo is None
+    assert parse_timestamp("not a date") is None
+    assert parse_timestamp("") is None
+
+
+def test_coarse_buckets_sum_the_fine_ones(service):
+    for minute, total in ((1, 10.0), (2, 5.5), (59, 4.5)):
+        service.record_rollup(
+            datetime(2024, 3, 1, 10, minute), {"orders": 1, "revenue": total}
+        )
+    assert service.flush()
+
+    start, end = datetime(2024, 3, 1, 10), datetime(2024, 3, 1, 10, 59)
+    minutes = service.get_metrics_range(start, end, "minute")
+    hours = service.get_metrics_range(start, end, "hour")
+    assert len(minutes["points"]) == 60
+    assert minutes["totals"] == hours["totals"]
+    assert hours["totals"]["orders"] == 3
+    assert hours["totals"]["revenue"] == 20.0
+
+    key = rollup_key("day", bucket_id(start, "day"))
+    assert 0 < service.redis_client.ttl(key) <= service.rollup_ttls["day"]
@@ -0,0 +1,24 @@
+# microservices/analytics-service/tests/test_shared_modules.py
+import os
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIBLING_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "notification-service")
+
+# Each service is built from its own directory, so these are copied, not shared
+SHARED_MODULES = ("dedupe.py", "dlq.py", "instrumentation.py", "json_codec.py")
+
+
+def body(path: str) -> str:
+    """The module without its first line, which names its own path"""
+    with open(path, encoding="utf-8") as handle:
+        return handle.read().split("\n", 1)[1]
+
+
+@pytest.mark.parametrize("name", SHARED_MODULES)
+def test_shared_module_matches_the_other_service(name):
+    sibling = os.path.join(SIBLING_DIR, name)
+    if not os.path.exists(sibling):
+        pytest.skip("notification-service is not checked out")
+    assert body(os.path.join(SERVICE_DIR, name)) == body(sibling)
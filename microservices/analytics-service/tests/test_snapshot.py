@@ -0,0 +1,33 @@
+# microservices/analytics-service/tests/test_snapshot.py
+import json
+
+from config import settings
+
+
+def snapshot_orders(service) -> int:
+    body, _ = service.snapshot.get()
+    return json.loads(body)["orders"]["total"]
+
+
+def test_rate_limited_refresh_runs_once_the_interval_passes(service, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_MIN_INTERVAL_MS", 60_000)
+    service.refresh_snapshot(force=True)
+
+    service.aggregator.incr(service.metrics_keys["orders_total"], 3)
+    assert service.flush()
+    assert service.snapshot_pending
+    service.refresh_pending_snapshot()
+    assert service.snapshot_pending
+
+    monkeypatch.setattr(settings, "SNAPSHOT_MIN_INTERVAL_MS", 0)
+    service.refresh_pending_snapshot()
+    assert not service.snapshot_pending
+    assert snapshot_orders(service) == 3
+
+
+def test_flush_refreshes_directly_when_not_rate_limited(service, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_MIN_INTERVAL_MS", 0)
+    service.aggregator.incr(service.metrics_keys["orders_total"], 2)
+    assert service.flush()
+    assert not service.snapshot_pending
+    assert snapshot_orders(service) == 2
@@ -0,0 +1,46 @@
+# microservices/analytics-service/tests/test_tdigest.py
+import random
+from datetime import datetime
+
+from tdigest import TDigest
+
+
+def test_quantiles_track_the_exact_values():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(6, 1) for _ in range(20_000)]
+    digest = TDigest(200)
+    digest.update(values)
+    exact = sorted(values)
+    for q in (0.5, 0.9, 0.99):
+        expected = exact[int(q * len(exact))]
+        assert abs(digest.quantile(q) - expected) / expected < 0.02
+    assert digest.quantile(0) == exact[0]
+    assert digest.quantile(1) == exact[-1]
+
+
+def test_merged_parts_match_one_digest():
+    rng = random.Random(11)
+    values = [rng.uniform(0, 1000) for _ in range(10_000)]
+    whole = TDigest(200)
+    whole.update(values)
+    merged = TDigest(200)
+    for start in range(0, len(values), 1000):
+        part = TDigest(200)
+        part.update(values[start : start + 1000])
+        merged.merge(TDigest.deserialize(part.serialize()))
+    assert len(merged) == len(whole)
+    for q in (0.5, 0.9, 0.99):
+        assert abs(merged.quantile(q) - whole.quantile(q)) < 10
+
+
+def test_quantiles_merge_the_parts_of_every_flush(service):
+    when = datetime(2024, 3, 1, 10, 30)
+    for batch in ([10.0, 20.0], [30.0, 40.0, 50.0]):
+        for value in batch:
+            service.record_digest("order_value", value, when)
+        assert service.flush()
+
+    summary = service.get_quantiles("order_value", when, when, "hour")
+    assert summary["count"] == 5
+    assert (summary["min"], summary["max"]) == (10.0, 50.0)
+    assert summary["p50"] == 30.0
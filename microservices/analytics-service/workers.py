@@ -0,0 +1,238 @@
+# microservices/analytics-service/workers.py
+import json
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name(index: int) -> str:
+    """Stable per-host name; Kafka's range assignor orders members by it"""
+    return f"{socket.gethostname()}-{index}"
+
+
+def run_worker(index: int, stop_event) -> None:
+    """Entry point of a consumer process (spawned, so it imports main afresh)"""
+    import main
+
+    main.consumer_stop = stop_event
+    # The API process owns the snapshot; workers just announce their flushes
+    main.analytics.publish_flushes = True
+    try:
+        main.kafka_consumer_worker(worker_name(index))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        main.analytics.flush()
+
+
+class ConsumerPool:
+    """Runs N Kafka consumer processes in the analytics-service group.
+
+    Each process owns a disjoint set of partitions, aggregates locally and
+    flushes commutative deltas to Redis, so workers never coordinate with
+    each other. Dead workers are restarted with exponential backoff.
+    """
+
+    def __init__(self, processes: int, restart_backoff_s: float = 1.0):
+        self.processes = processes
+        self.restart_backoff_s = restart_backoff_s
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.workers: Dict[int, multiprocessing.process.BaseProcess] = {}
+        self.restarts: Dict[int, int] = {}
+        self._monitor: Optional[threading.Thread] = None
+
+    def _spawn(self, index: int):
+        process = self.context.Process(
+            target=run_worker,
+            args=(index, self.stop_event),
+            name=f"analytics-consumer-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.workers[index] = process
+        logger.info(f"🚀 Started consumer worker {index} (pid {process.pid})")
+
+    def start(self):
+        for index in range(self.processes):
+            self._spawn(index)
+        self._monitor = threading.Thread(target=self._supervise, daemon=True)
+        self._monitor.start()
+
+    def _supervise(self):
+        while not self.stop_event.wait(1.0):
+            for index, process in list(self.workers.items()):
+                if process.is_alive() or self.stop_event.is_set():
+                    continue
+                restarts = self.restarts.get(index, 0)
+                instrumentation.mark_process_dead(process.pid)
+                logger.error(
+                    f"❌ Consumer worker {index} exited with {process.exitcode}, "
+                    f"restart #{restarts + 1}"
+                )
+                if self.stop_event.wait(min(self.restart_backoff_s * 2**restarts, 30)):
+                    return
+                self.restarts[index] = restarts + 1
+                self._spawn(index)
+
+    def stop(self, timeout: float = 30.0):
+        """Ask every worker to flush and leave the group, then wait for them"""
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for process in self.workers.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"⚠️ Terminating stuck consumer worker {process.pid}")
+                process.terminate()
+                process.join(1.0)
+            instrumentation.mark_process_dead(process.pid)
+
+    def alive(self) -> int:
+        return sum(1 for process in self.workers.values() if process.is_alive())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "alive": self.alive(),
+            "restarts": sum(self.restarts.values()),
+        }
+
+
+class ConsumerStatusReporter:
+    """Publishes a worker's partitions, lag and throughput to a Redis hash.
+
+    Lag comes from the high watermarks the consumer already receives with
+    every fetch, so reporting costs no extra broker round trips. Capacity is
+    events per second of busy time (handling plus flushing), which tells how
+    fast the worker could go, not just how fast events are arriving.
+    """
+
+    def __init__(self, redis_client, key: str, worker_id: str, interval_s: float = 5.0):
+        self.redis_client = redis_client
+        self.key = key
+        self.worker_id = worker_id
+        self.interval_s = interval_s
+        self.events = 0
+        self.busy_s = 0.0
+        self.window_start = time.monotonic()
+
+    def record(self, events: int, busy_s: float):
+        self.events += events
+        self.busy_s += busy_s
+
+    def maybe_report(self, consumer) -> bool:
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        if elapsed < self.interval_s:
+            return False
+
+        partitions = {}
+        for tp in consumer.assignment():
+            highwater = consumer.highwater(tp)
+            try:
+                position = consumer.position(tp)
+            except Exception:
+                position = None
+            lag = None
+            if highwater is not None and position is not None:
+                lag = max(highwater - position, 0)
+            partitions[f"{tp.topic}:{tp.partition}"] = lag
+
+        status = {
+            "pid": os.getpid(),
+            "partitions": partitions,
+            "lag": sum(lag for lag in partitions.values() if lag),
+            "rate": round(self.events / elapsed, 2),
+            "capacity": round(self.events / self.busy_s, 2) if self.busy_s else None,
+            "updated": time.time(),
+        }
+        try:
+            self.redis_client.hset(self.key, self.worker_id, json.dumps(status))
+        except Exception as e:
+            logger.warning(f"⚠️ Could not publish consumer status: {e}")
+        self.events = 0
+        self.busy_s = 0.0
+        self.window_start = now
+        return True
+
+    def clear(self):
+        try:
+            self.redis_client.hdel(self.key, self.worker_id)
+        except Exception:
+            pass
+
+
+def summarize_consumers(
+    entries: Dict[str, str],
+    stale_after_s: float,
+    lag_target_s: float,
+    now: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Group-wide lag plus a worker-count recommendation for autoscaling.
+
+    The recommendation is the number of workers whose combined capacity
+    keeps up with the arrival rate and drains the current backlog within
+    `lag_target_s`, capped at the partition count (extra workers sit idle).
+    """
+    now = now or time.time()
+    workers: Dict[str, Dict[str, Any]] = {}
+    stale: List[str] = []
+    for worker_id, raw in entries.items():
+        try:
+            status = json.loads(raw)
+        except (TypeError, ValueError):
+            stale.append(worker_id)
+            continue
+        if now - status.get("updated", 0) > stale_after_s:
+            stale.append(worker_id)
+            continue
+        workers[worker_id] = status
+
+    partition_lag: Dict[str, Optional[int]] = {}
+    partitions_per_topic: Dict[str, int] = {}
+    for status in workers.values():
+        for tp, lag in status.get("partitions", {}).items():
+            partition_lag[tp] = lag
+            topic = tp.rpartition(":")[0]
+            partitions_per_topic[topic] = partitions_per_topic.get(topic, 0) + 1
+
+    total_lag = sum(lag for lag in partition_lag.values() if lag)
+    rate = sum(status.get("rate") or 0 for status in workers.values())
+    capacities = [
+        status["capacity"] for status in workers.values() if status.get("capacity")
+    ]
+    max_useful = max(partitions_per_topic.values(), default=0)
+
+    current = len(workers)
+    recommended = current
+    if capacities and max_useful:
+        per_worker = sum(capacities) / len(capacities)
+        needed = (rate + total_lag / lag_target_s) / per_worker
+        recommended = min(max(math.ceil(needed), 1), max_useful)
+
+    if recommended > current:
+        hint = "scale_up"
+    elif recommended < current:
+        hint = "scale_down"
+    else:
+        hint = "steady"
+
+    return {
+        "workers": workers,
+        "stale_workers": stale,
+        "partition_lag": partition_lag,
+        "total_lag": total_lag,
+        "events_per_second": round(rate, 2),
+        "max_useful_workers": max_useful,
+        "recommended_workers": recommended,
+        "scaling_hint": hint,
+    }
@@ -0,0 +1,236 @@
+# microservices/notification-service/benchmarks/bench_notifications.py
+"""End-to-end notification throughput, offline.
+
+Runs the service's consumer path (process_batch: dedupe, directory lookups,
+template rendering, the send queue and its workers, the low stock digest)
+against the local SMTP sink (benchmarks/smtp_sink.py) and an in-process
+fakeredis, or REDIS_URL when given. Synthetic user_registered,
+order_created and low_stock_detected events are fed in batches like
+polled Kafka messages, as fast as possible or at --rate events/s; orders
+refer to registered users by id, so their emails go through the user
+directory. Reports:
+  * events/s through the consumer, and handler latency per event;
+  * emails/s accepted by the sink, and enqueue-to-accepted latency;
+  * peak RSS and its growth over the run (fakeredis data included).
+
+Usage: python benchmarks/bench_notifications.py [--events 5000] [--batch 50]
+       [--rate 0] [--mix 3:6:1] [--senders 4] [--rtt-ms 5] [--connect-ms 30]
+       [--rate-limit 0] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from smtp_sink import SMTPSink  # noqa: E402
+
+
+def load_service(args, host: str, port: int):
+    """Import main configured for the sink; main connects to Redis on import"""
+    os.environ.update(
+        SMTP_SERVER=host,
+        SMTP_PORT=str(port),
+        SMTP_USERNAME="bench",
+        SMTP_PASSWORD="bench",
+        SMTP_STARTTLS="false",
+        SMTP_POOL_SIZE=str(args.senders),
+        SEND_WORKERS=str(args.senders),
+        SMTP_RATE_LIMIT_PER_MINUTE=str(args.rate_limit),
+        LOW_STOCK_DIGEST_INTERVAL_SECONDS=str(args.digest_interval),
+        BACKEND_URL="",
+    )
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+    else:
+        import fakeredis
+        import redis
+
+        server = fakeredis.FakeServer()
+        redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(
+            server=server, decode_responses=kwargs.get("decode_responses", False)
+        )
+
+    import logging
+
+    logging.disable(logging.WARNING)
+    import main
+
+    main.notification_service.redis_client.flushdb()
+    return main
+
+
+def make_events(args):
+    """(topic, event) pairs in the --mix ratio of users:orders:low stock"""
+    rng = random.Random(1)
+    weights = [float(w) for w in args.mix.split(":")]
+    users = []
+    for _ in range(args.events):
+        kind = rng.choices(("user", "order", "stock"), weights)[0]
+        if kind == "order" and not users:
+            kind = "user"
+        if kind == "user":
+            user_id = str(len(users) + 1)
+            users.append(user_id)
+            yield "users", {
+                "event": "user_registered",
+                "user_id": user_id,
+                "email": f"user{user_id}@example.com",
+            }
+        elif kind == "order":
+            items = [
+                {
+                    "product_id": rng.randint(1, 500),
+                    "product_name": f"Product {rng.randint(1, 500)}",
+                    "quantity": rng.randint(1, 3),
+                    "price": round(rng.uniform(5, 200), 2),
+                }
+                for _ in range(rng.randint(1, 5))
+            ]
+            yield "orders", {
+                "event": "order_created",
+                "order_id": uuid.uuid4().hex[:8],
+                "user_id": rng.choice(users),
+                "total": round(sum(i["price"] * i["quantity"] for i in items), 2),
+                "items": items,
+            }
+        else:
+            yield "products", {
+                "event": "low_stock_detected",
+                "product_id": str(rng.randint(1, 500)),
+                "name": "Bench product",
+                "stock": rng.randint(0, 5),
+                "threshold": 5,
+                "price": 19.99,
+            }
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0.0, help="events/s, 0 = max")
+    parser.add_argument("--mix", default="3:6:1", help="users:orders:low stock")
+    parser.add_argument("--senders", type=int, default=4)
+    parser.add_argument("--rtt-ms", type=float, default=5.0)
+    parser.add_argument("--connect-ms", type=float, default=30.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="emails/min")
+    parser.add_argument("--digest-interval", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL"))
+    args = parser.parse_args()
+
+    sink = SMTPSink(rtt_s=args.rtt_ms / 1000, connect_s=args.connect_ms / 1000)
+    host, port = sink.start_in_thread()
+    service = load_service(args, host, port)
+    notifications = service.notification_service
+    outbox = notifications.outbox
+
+    handler_s = []
+    handle_message = service.handle_message
+
+    def timed_handle(message):
+        started = time.perf_counter()
+        try:
+            return handle_message(message)
+        finally:
+            handler_s.append(time.perf_counter() - started)
+
+    service.handle_message = timed_handle
+
+    delivery_s = []
+    record_delivery = outbox.on_done
+
+    def timed_done(job, success):
+        delivery_s.append(time.time() - job["enqueued_at"])
+        record_delivery(job, success)
+
+    outbox.on_done = timed_done
+
+    events = list(make_events(args))
+    rss_before = rss_mb()
+    notifications.email_service.pool.start()
+    outbox.start()
+    notifications.low_stock.start()
+
+    began = time.perf_counter()
+    for offset in range(0, len(events), args.batch):
+        batch = [
+            SimpleNamespace(
+                topic=topic,
+                value={
+                    **event,
+                    "event_id": uuid.uuid4().hex,
+                    "timestamp": datetime.now().isoformat(),
+                },
+                partition=0,
+                offset=offset + i,
+                timestamp=int(time.time() * 1000),
+            )
+            for i, (topic, event) in enumerate(events[offset : offset + args.batch])
+        ]
+        service.process_batch(batch)
+        if args.rate:
+            ahead = (offset + len(batch)) / args.rate - (time.perf_counter() - began)
+            if ahead > 0:
+                time.sleep(ahead)
+    consumed = time.perf_counter() - began
+
+    # Digests still pending go out on the next tick; then wait for the queue
+    deadline = time.monotonic() + max(args.digest_interval * 2, 2.0)
+    while notifications.low_stock.get_stats()["pending"] and (
+        time.monotonic() < deadline
+    ):
+        time.sleep(0.1)
+    notifications.low_stock.stop()
+    deadline = time.monotonic() + args.timeout
+    while outbox.stats["sent"] + outbox.stats["failed"] < outbox.stats["enqueued"]:
+        if time.monotonic() > deadline:
+            print("timed out waiting for the send queue to drain")
+            break
+        time.sleep(0.05)
+    drained = time.perf_counter() - began
+    outbox.stop()
+    notifications.email_service.pool.close()
+
+    emails = sink.stats["messages"]
+    print(
+        f"consumer: {len(events)} events in {consumed:.2f}s "
+        f"({len(events) / consumed:.0f} events/s), handler "
+        f"p50 {percentile(handler_s, 0.5) * 1000:.2f} ms, "
+        f"p99 {percentile(handler_s, 0.99) * 1000:.2f} ms"
+    )
+    print(
+        f"email: {emails} accepted by the sink in {drained:.2f}s "
+        f"({emails / drained:.0f} emails/s), enqueue to accepted "
+        f"p50 {percentile(delivery_s, 0.5) * 1000:.1f} ms, "
+        f"p99 {percentile(delivery_s, 0.99) * 1000:.1f} ms"
+    )
+    print(f"memory: peak RSS {rss_mb():.0f} MB (+{rss_mb() - rss_before:.0f} MB)")
+    print(f"  send queue: {outbox.get_stats()}")
+    print(f"  low stock digest: {notifications.low_stock.get_stats()}")
+    print(f"  smtp pool: {notifications.email_service.pool.get_stats()}")
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
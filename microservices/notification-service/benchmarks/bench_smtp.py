@@ -0,0 +1,128 @@
+# microservices/notification-service/benchmarks/bench_smtp.py
+"""Email throughput with a connection per message versus pooled sessions.
+
+Sends order-confirmation-sized messages to the local SMTP sink
+(benchmarks/smtp_sink.py), which waits --rtt-ms before every reply and
+--connect-ms after accepting a connection to stand in for a remote
+provider's network round trip and TLS handshake. Compares:
+  * the previous EmailService behaviour: connect, EHLO, AUTH, send, QUIT
+    for every message;
+  * SMTPConnectionPool with one sender (the Kafka consumer thread);
+  * SMTPConnectionPool shared by --senders threads.
+Then lets the pooled sessions go stale past the sink's idle timeout and
+checks that sends reconnect without losing or duplicating messages.
+
+Usage: python benchmarks/bench_smtp.py [--messages 500] [--rtt-ms 5]
+       [--connect-ms 30] [--senders 4] [--max-messages 100]
+"""
+import argparse
+import os
+import smtplib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from smtp_pool import SMTPConnectionPool  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+
+def build_message(index: int) -> MIMEMultipart:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = f"Order Confirmation #{index} - Your Online Store"
+    msg["From"] = "E-Commerce Store <store@example.com>"
+    msg["To"] = f"customer{index}@example.com"
+    msg.attach(MIMEText("Thank you for your order!\n" * 20, "plain"))
+    msg.attach(MIMEText("<p>Thank you for your order!</p>" * 80, "html"))
+    return msg
+
+
+def connection_per_message(host: str, port: int, messages):
+    for msg in messages:
+        with smtplib.SMTP(host, port) as server:
+            server.login("bench", "bench")
+            server.send_message(msg)
+
+
+def pooled(pool: SMTPConnectionPool, messages, senders: int):
+    if senders == 1:
+        for msg in messages:
+            pool.send_message(msg)
+        return
+    with ThreadPoolExecutor(senders) as executor:
+        list(executor.map(pool.send_message, messages))
+
+
+def report(label: str, count: int, elapsed: float, baseline: float = None):
+    rate = count / elapsed
+    speedup = f", {rate / baseline:.1f}x" if baseline else ""
+    print(f"{label}: {count} emails in {elapsed:.2f}s ({rate:.0f}/s{speedup})")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=5.0)
+    parser.add_argument("--connect-ms", type=float, default=30.0)
+    parser.add_argument("--senders", type=int, default=4)
+    parser.add_argument("--max-messages", type=int, default=100)
+    parser.add_argument("--idle-timeout", type=float, default=2.0)
+    args = parser.parse_args()
+
+    sink = SMTPSink(
+        rtt_s=args.rtt_ms / 1000,
+        connect_s=args.connect_ms / 1000,
+        idle_timeout_s=args.idle_timeout,
+    )
+    host, port = sink.start_in_thread()
+    messages = [build_message(i) for i in range(args.messages)]
+
+    # The old path is slow; a fifth of the messages is enough to measure it
+    sample = messages[: max(args.messages // 5, 1)]
+    began = time.perf_counter()
+    connection_per_message(host, port, sample)
+    baseline = report(
+        "connection per message", len(sample), time.perf_counter() - began
+    )
+
+    def pool_run(senders: int) -> SMTPConnectionPool:
+        pool = SMTPConnectionPool(
+            host,
+            port,
+            "bench",
+            "bench",
+            size=senders,
+            max_messages=args.max_messages,
+            starttls=False,
+        )
+        began = time.perf_counter()
+        pooled(pool, messages, senders)
+        elapsed = time.perf_counter() - began
+        report(f"pool, {senders} sender(s)", len(messages), elapsed, baseline)
+        print(f"  {pool.get_stats()}")
+        return pool
+
+    pool_run(1).close()
+    pool = pool_run(args.senders)
+
+    # Sessions go stale: the sink drops them, the pool must reconnect
+    before = sink.stats["messages"]
+    time.sleep(args.idle_timeout + 0.5)
+    pooled(pool, messages[: args.senders * 2], args.senders)
+    delivered = sink.stats["messages"] - before
+    stats = pool.get_stats()
+    print(
+        f"after idle timeout: {delivered}/{args.senders * 2} delivered, "
+        f"{stats['reconnects']} reconnects"
+    )
+    pool.close()
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# microservices/notification-service/benchmarks/bench_templates.py
+"""Render time per email: a Template per call versus the cached Environment.
+
+"per call" builds jinja2.Template objects from the template source for
+every email, as NotificationTemplates used to, so each render re-parses
+and re-compiles the HTML. "cached" renders through the shared Environment
+(compiled once, looked up by name); "auto reload" is the same with the
+development mtime check on every lookup. Also times the first render in
+a fresh process-like Environment with and without a warm bytecode cache.
+
+Usage: python benchmarks/bench_templates.py [--emails 2000] [--items 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from jinja2 import Template
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rendering import TEMPLATE_DIR, create_environment  # noqa: E402
+
+TEMPLATES = ("order_confirmation.html", "order_confirmation.txt")
+
+
+def order(index: int, items: int):
+    return {
+        "order_id": f"ORD{index}",
+        "total": 42.5 * items,
+        "user_email": f"customer{index}@example.com",
+        "items": [
+            {"product_name": f"Product {n}", "quantity": n + 1, "price": 42.5}
+            for n in range(items)
+        ],
+    }
+
+
+def per_call(sources, orders):
+    for data in orders:
+        for source in sources:
+            Template(source, trim_blocks=True, lstrip_blocks=True).render(**data)
+
+
+def cached(env, orders):
+    for data in orders:
+        for name in TEMPLATES:
+            env.get_template(name).render(**data)
+
+
+def timed(label: str, fn, count: int, baseline: float = None) -> float:
+    began = time.perf_counter()
+    fn()
+    per_email = (time.perf_counter() - began) / count
+    speedup = f" ({baseline / per_email:.0f}x)" if baseline else ""
+    print(f"{label}: {per_email * 1e6:.0f} µs per email{speedup}")
+    return per_email
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=5)
+    args = parser.parse_args()
+
+    orders = [order(i, args.items) for i in range(args.emails)]
+    sources = []
+    for name in TEMPLATES:
+        with open(os.path.join(TEMPLATE_DIR, name), encoding="utf-8") as f:
+            sources.append(f.read())
+
+    sample = orders[: max(args.emails // 10, 1)]
+    baseline = timed(
+        "per call Template()", lambda: per_call(sources, sample), len(sample)
+    )
+    env = create_environment(bytecode_cache_dir="off")
+    cached(env, orders[:1])
+    timed("cached Environment", lambda: cached(env, orders), args.emails, baseline)
+    env = create_environment(auto_reload=True, bytecode_cache_dir="off")
+    cached(env, orders[:1])
+    timed("cached, auto reload", lambda: cached(env, orders), args.emails, baseline)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for label, cache in (
+            ("first render, no bytecode cache", "off"),
+            ("first render, cold bytecode cache", cache_dir),
+            ("first render, warm bytecode cache", cache_dir),
+        ):
+            env = create_environment(bytecode_cache_dir=cache)
+            timed(label, lambda: cached(env, orders[:1]), 1)
+
+
+if __name__ == "__main__":
+    main()
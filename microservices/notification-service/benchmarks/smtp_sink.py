@@ -0,0 +1,167 @@
+# microservices/notification-service/benchmarks/smtp_sink.py
+"""Minimal SMTP server that accepts and discards mail, for benchmarks.
+
+Speaks enough of RFC 5321 for smtplib (EHLO/HELO, AUTH PLAIN, MAIL,
+RCPT, DATA, RSET, NOOP, QUIT), with knobs to make it behave like a remote
+provider: a delay before every reply (network round trip), a delay after
+connecting (standing in for the TLS handshake and login), dropping sessions
+that stay idle and refusing further mail on a session (421) after a number
+of messages. No STARTTLS; run the service against it with
+SMTP_STARTTLS=false.
+
+Usage: python benchmarks/smtp_sink.py [--port 2525] [--rtt-ms 5]
+       [--connect-ms 30] [--idle-timeout 60] [--max-messages 0]
+"""
+import argparse
+import asyncio
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class SMTPSink:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        rtt_s: float = 0.0,
+        connect_s: float = 0.0,
+        idle_timeout_s: Optional[float] = None,
+        max_messages: int = 0,
+    ):
+        self.host = host
+        self.port = port
+        self.rtt_s = rtt_s
+        self.connect_s = connect_s
+        self.idle_timeout_s = idle_timeout_s
+        self.max_messages = max_messages
+        self.stats = {"connections": 0, "messages": 0, "bytes": 0, "timeouts": 0}
+        self._server = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _reply(self, writer, line: str):
+        if self.rtt_s:
+            await asyncio.sleep(self.rtt_s)
+        writer.write(line.encode() + b"\r\n")
+        await writer.drain()
+
+    async def _readline(self, reader) -> Optional[bytes]:
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.idle_timeout_s)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            return None
+        return line or None
+
+    async def _session(self, reader, writer):
+        self.stats["connections"] += 1
+        messages = 0
+        try:
+            if self.connect_s:
+                await asyncio.sleep(self.connect_s)
+            await self._reply(writer, "220 sink ESMTP ready")
+            while True:
+                line = await self._readline(reader)
+                if line is None:
+                    break
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    writer.write(b"250-sink\r\n250-8BITMIME\r\n")
+                    await self._reply(writer, "250 AUTH PLAIN")
+                elif verb == "HELO":
+                    await self._reply(writer, "250 sink")
+                elif verb == "AUTH":
+                    await self._reply(writer, "235 2.7.0 Authentication successful")
+                elif verb == "MAIL" and self.max_messages and (
+                    messages >= self.max_messages
+                ):
+                    await self._reply(writer, "421 4.7.0 Too many messages")
+                    break
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    await self._reply(writer, "250 OK")
+                elif verb == "DATA":
+                    await self._reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                    size = 0
+                    while True:
+                        chunk = await self._readline(reader)
+                        if chunk is None or chunk == b".\r\n":
+                            break
+                        size += len(chunk)
+                    if chunk is None:
+                        break
+                    messages += 1
+                    self.stats["messages"] += 1
+                    self.stats["bytes"] += size
+                    await self._reply(writer, "250 OK queued")
+                elif verb == "QUIT":
+                    await self._reply(writer, "221 Bye")
+                    break
+                else:
+                    await self._reply(writer, "502 Command not implemented")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._session, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    def start_in_thread(self) -> Tuple[str, int]:
+        """Serve from a background event loop; returns (host, port)"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name="smtp-sink", daemon=True).start()
+        ready.wait()
+        return self.host, self.port
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--connect-ms", type=float, default=0.0)
+    parser.add_argument("--idle-timeout", type=float, default=None)
+    parser.add_argument("--max-messages", type=int, default=0)
+    args = parser.parse_args()
+
+    sink = SMTPSink(
+        args.host,
+        args.port,
+        rtt_s=args.rtt_ms / 1000,
+        connect_s=args.connect_ms / 1000,
+        idle_timeout_s=args.idle_timeout,
+        max_messages=args.max_messages,
+    )
+
+    async def run():
+        server = await sink.serve()
+        print(f"SMTP sink listening on {sink.host}:{sink.port}")
+        began = time.monotonic()
+        async with server:
+            while True:
+                await asyncio.sleep(10)
+                print(f"{time.monotonic() - began:.0f}s {sink.stats}")
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# microservices/notification-service/campaigns.py
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from outbox import SendQueue, email_job
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("directory", "backend")
+NUMERIC_FIELDS = ("queued", "sent", "failed", "total")
+
+
+class CampaignSender:
+    """Bulk emails (e.g. a sale announcement) to every known customer.
+
+    A campaign is a Redis hash `{prefix}:{id}`. Its recipients are streamed
+    a chunk at a time from the user directory's Redis hash (HSCAN) or from
+    the backend's users table (paging by id); each chunk is rendered with
+    the cached campaign template and put on the send queue as "campaign"
+    jobs, the lowest priority, so order confirmations and alerts go first
+    and share the SMTP rate limit and pooled sessions. The runner keeps at
+    most `max_backlog` emails waiting in the bulk and delayed queues, and
+    paces itself to the campaign's `rate_per_minute`.
+
+    The source cursor and queued count are checkpointed in the transaction
+    that queues each chunk, so a paused, stopped or crashed campaign
+    resumes after the last queued chunk without skipping or repeating
+    anyone (HSCAN may still repeat entries if the hash is resized). The
+    send queue adds sent and failed counts as each email finishes
+    (`settle`). One replica runs a campaign at a time, under a lock that
+    is refreshed while it runs; `start` runs a watcher that relaunches
+    campaigns left running by a process that died once their lock expires.
+    Pausing or cancelling stops queueing; emails already queued still go
+    out.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        prefix: str,
+        outbox: SendQueue,
+        directory,
+        render: Callable[[str, str, Dict[str, Any]], Dict[str, str]],
+        chunk_size: int = 500,
+        max_backlog: int = 1000,
+        lock_ttl_s: int = 120,
+    ):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.index_key = f"{prefix}:index"
+        self.outbox = outbox
+        self.directory = directory
+        self.render = render
+        self.chunk_size = chunk_size
+        self.max_backlog = max_backlog
+        self.lock_ttl_s = lock_ttl_s
+        # Unique per process: a restarted container keeps its hostname and pid
+        self.owner = f"{socket.gethostname()}:{uuid.uuid4().hex[:12]}"
+        self._stop = threading.Event()
+        self._threads: Dict[str, threading.Thread] = {}
+        self._watcher: Optional[threading.Thread] = None
+
+    def key(self, campaign_id: str) -> str:
+        return f"{self.prefix}:{campaign_id}"
+
+    def lock_key(self, campaign_id: str) -> str:
+        return f"{self.prefix}:{campaign_id}:lock"
+
+    # ----- campaigns -----
+    def create(
+        self,
+        name: str,
+        subject: str,
+        template: str,
+        context: Dict[str, Any],
+        source: str = "directory",
+        rate_per_minute: float = 0.0,
+    ) -> Dict[str, Any]:
+        if source not in SOURCES:
+            raise ValueError(f"Unknown recipient source: {source}")
+        campaign_id = uuid.uuid4().hex[:12]
+        total = self.redis_client.hlen(self.directory.key)
+        pipe = self.redis_client.pipeline()
+        pipe.hset(
+            self.key(campaign_id),
+            mapping={
+                "id": campaign_id,
+                "name": name,
+                "subject": subject,
+                "template": template,
+                "context": json.dumps(context),
+                "source": source,
+                "rate_per_minute": rate_per_minute,
+                "state": "created",
+                "cursor": 0,
+                "queued": 0,
+                "sent": 0,
+                "failed": 0,
+                "active_s": 0,
+                # The backend does not say how many users it has
+                "total": total if source == "directory" else "",
+                "created_at": datetime.now().isoformat(),
+            },
+        )
+        pipe.zadd(self.index_key, {campaign_id: time.time()})
+        pipe.execute()
+        logger.info(f"📣 Created campaign {campaign_id}: {name}")
+        return self.get(campaign_id)
+
+    def get(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        """A campaign with its progress, or None"""
+        campaign: Dict[str, Any] = self.redis_client.hgetall(self.key(campaign_id))
+        if not campaign:
+            return None
+        for field in NUMERIC_FIELDS:
+            campaign[field] = int(campaign[field]) if campaign.get(field) else None
+        campaign["context"] = json.loads(campaign.get("context") or "{}")
+        campaign["rate_per_minute"] = float(campaign.get("rate_per_minute") or 0)
+        active_s = float(campaign.get("active_s") or 0)
+        campaign["active_s"] = round(active_s, 1)
+        campaign["queued_per_s"] = (
+            round(campaign["queued"] / active_s, 1) if active_s else None
+        )
+        if campaign["total"]:
+            progress = campaign["queued"] / campaign["total"]
+            campaign["progress"] = round(min(progress, 1.0), 4)
+        campaign["running_on"] = self.redis_client.get(self.lock_key(campaign_id))
+        return campaign
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        ids = self.redis_client.zrevrange(self.index_key, 0, limit - 1)
+        return [c for c in (self.get(i) for i in ids) if c is not None]
+
+    # ----- control -----
+    def launch(self, campaign_id: str) -> bool:
+        """Start or resume a campaign here; False if it is finished or running"""
+        campaign = self.get(campaign_id)
+        if campaign is None:
+            raise KeyError(campaign_id)
+        if campaign["state"] in ("done", "cancelled"):
+            return False
+        if not self.redis_client.set(
+            self.lock_key(campaign_id), self.owner, nx=True, ex=self.lock_ttl_s
+        ):
+            return False
+        self.redis_client.hset(
+            self.key(campaign_id), mapping={"state": "running", "error": ""}
+        )
+        thread = threading.Thread(
+            target=self.run, args=(campaign_id,), name=f"campaign-{campaign_id}"
+        )
+        thread.daemon = True
+        self._threads[campaign_id] = thread
+        thread.start()
+        return True
+
+    def _set_state(self, campaign_id: str, state: str, allowed: Tuple[str, ...]):
+        key = self.key(campaign_id)
+        current = self.redis_client.hget(key, "state")
+        if current is None:
+            raise KeyError(campaign_id)
+        if current not in allowed:
+            return False
+        self.redis_client.hset(key, "state", state)
+        return True
+
+    def pause(self, campaign_id: str) -> bool:
+        """Stop queueing after the current chunk; `launch` resumes"""
+        return self._set_state(campaign_id, "paused", ("created", "running"))
+
+    def cancel(self, campaign_id: str) -> bool:
+        return self._set_state(
+            campaign_id, "cancelled", ("created", "running", "paused", "failed")
+        )
+
+    def resume_interrupted(self) -> int:
+        """Start campaigns left running by a process that stopped"""
+        resumed = 0
+        for campaign_id in self.redis_client.zrange(self.index_key, 0, -1):
+            if self.redis_client.hget(self.key(campaign_id), "state") == "running":
+                resumed += self.launch(campaign_id)
+        if resumed:
+            logger.info(f"♻️ Resumed {resumed} interrupted campaigns")
+        return resumed
+
+    # ----- running -----
+    def _recipients(
+        self, source: str, cursor: int
+    ) -> Iterator[Tuple[Dict[str, str], Optional[int]]]:
+        if source == "backend":
+            return self.directory.pages(cursor, self.chunk_size)
+        return self.directory.scan(cursor, self.chunk_size)
+
+    def _refresh_lock(self, campaign_id: str) -> bool:
+        key = self.lock_key(campaign_id)
+        if self.redis_client.get(key) != self.owner:
+            return False
+        self.redis_client.expire(key, self.lock_ttl_s)
+        return True
+
+    def _wait_turn(self, campaign_id: str, not_before: float) -> bool:
+        """Wait for the pacing slot and room in the backlog; False to stop"""
+        while True:
+            if self._stop.is_set() or not self._refresh_lock(campaign_id):
+                return False
+            if self.redis_client.hget(self.key(campaign_id), "state") != "running":
+                return False
+            depths = self.outbox.depths()
+            delay = not_before - time.monotonic()
+            if delay <= 0 and depths["bulk"] + depths["delayed"] < self.max_backlog:
+                return True
+            self._stop.wait(min(max(delay, 0.5), 5.0))
+
+    def run(self, campaign_id: str):
+        """Queue a campaign's remaining recipients; the caller holds the lock"""
+        key = self.key(campaign_id)
+        try:
+            campaign = self.get(campaign_id)
+            context = campaign["context"]
+            rate = campaign["rate_per_minute"]
+            interval = 60.0 / rate if rate > 0 else 0.0
+            # An empty cursor: the last chunk was queued
+            cursor = campaign["cursor"]
+            pages = self._recipients(campaign["source"], int(cursor)) if cursor else []
+            logger.info(f"📣 Running campaign {campaign_id} from cursor {cursor}")
+
+            finished = True
+            not_before = last = time.monotonic()
+            for emails, cursor in pages:
+                if not self._wait_turn(campaign_id, not_before):
+                    finished = False
+                    break
+                for user_id, email in emails.items():
+                    job = email_job(
+                        "campaign",
+                        email,
+                        self.render(
+                            campaign["template"],
+                            campaign["subject"],
+                            {**context, "email": email, "user_id": user_id},
+                        ),
+                    )
+                    job["campaign_id"] = campaign_id
+                    self.outbox.put(job)
+
+                now = time.monotonic()
+                active_s, last = now - last, now
+
+                def checkpoint(pipe, cursor=cursor, count=len(emails)):
+                    pipe.hset(
+                        key,
+                        mapping={
+                            "cursor": cursor if cursor is not None else "",
+                            "updated_at": datetime.now().isoformat(),
+                        },
+                    )
+                    pipe.hincrby(key, "queued", count)
+                    pipe.hincrbyfloat(key, "active_s", active_s)
+
+                if not self.outbox.flush(on_commit=checkpoint):
+                    raise RuntimeError("Send queue unavailable")
+                not_before = max(not_before, now) + len(emails) * interval
+
+            if finished:
+                finished_at = datetime.now().isoformat()
+                self.redis_client.hset(
+                    key, mapping={"state": "done", "finished_at": finished_at}
+                )
+                logger.info(f"✅ Campaign {campaign_id} fully queued")
+        except Exception as e:
+            logger.error(f"❌ Campaign {campaign_id} failed: {e}")
+            self.redis_client.hset(key, mapping={"state": "failed", "error": str(e)})
+        finally:
+            if self.redis_client.get(self.lock_key(campaign_id)) == self.owner:
+                self.redis_client.delete(self.lock_key(campaign_id))
+            self._threads.pop(campaign_id, None)
+
+    def settle(self, pipe, job: Dict[str, Any], success: bool):
+        """Count a campaign email's outcome on the send worker's pipeline"""
+        campaign_id = job.get("campaign_id")
+        if campaign_id:
+            pipe.hincrby(self.key(campaign_id), "sent" if success else "failed", 1)
+
+    def _watch(self):
+        while True:
+            try:
+                self.resume_interrupted()
+            except Exception as e:
+                logger.error(f"❌ Campaign watcher failed: {e}")
+            if self._stop.wait(self.lock_ttl_s):
+                break
+
+    def start(self):
+        if self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, name="campaign-watcher", daemon=True
+            )
+            self._watcher.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop queueing; running campaigns stay "running" and resume on restart"""
+        self._stop.set()
+        for thread in list(self._threads.values()):
+            thread.join(timeout)
+        self._watcher = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"running_here": sorted(self._threads), "max_backlog": self.max_backlog}
@@ -0,0 +1,168 @@
+# microservices/notification-service/digest.py
+import json
+import logging
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LowStockDigest:
+    """Coalesces low-stock alerts into one admin email per interval.
+
+    All state is in Redis so replicas share it:
+      * `pending`  - HASH product_id -> latest alert, plus a HASH of event
+                     counts; repeated alerts for a product overwrite each other;
+      * `cooldown:<product_id>` - set for `cooldown_s` once a product was
+                     reported; alerts for it are dropped meanwhile unless it
+                     has run out of stock since;
+      * `window`   - claimed with SET NX for `interval_s` by the replica that
+                     sends a digest, so at most one goes out per interval.
+    The sender RENAMEs the pending hashes away before building the digest,
+    so alerts recorded meanwhile go into the next one. If the digest cannot
+    be queued the alerts are put back and the window released; a replica
+    that dies in between loses that digest.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        prefix: str,
+        send: Callable[[List[Dict[str, Any]]], bool],
+        interval_s: float = 300.0,
+        cooldown_s: float = 3600.0,
+    ):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.pending_key = f"{prefix}:pending"
+        self.counts_key = f"{prefix}:pending:counts"
+        self.window_key = f"{prefix}:window"
+        self.send = send
+        self.interval_s = interval_s
+        self.cooldown_s = cooldown_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            "recorded": 0,
+            "suppressed": 0,
+            "digests_sent": 0,
+            "products_reported": 0,
+            "send_errors": 0,
+        }
+
+    def cooldown_key(self, product_id: str) -> str:
+        return f"{self.prefix}:cooldown:{product_id}"
+
+    # ----- recording -----
+    def record(self, alert: Dict[str, Any]) -> bool:
+        """Add an alert to the next digest; False if the product is cooling down"""
+        product_id = str(alert.get("product_id", "N/A"))
+        stock = int(alert.get("stock") or 0)
+        reported = self.redis_client.get(self.cooldown_key(product_id))
+        # Running out completely is worth a second mention
+        if reported is not None and not (stock <= 0 < int(reported)):
+            self.stats["suppressed"] += 1
+            return False
+        pipe = self.redis_client.pipeline()
+        pipe.hset(self.pending_key, product_id, json.dumps(alert, default=str))
+        pipe.hincrby(self.counts_key, product_id, 1)
+        pipe.execute()
+        self.stats["recorded"] += 1
+        return True
+
+    # ----- sending -----
+    def _take_pending(self) -> Optional[Tuple[str, str]]:
+        token = uuid.uuid4().hex
+        taken = f"{self.pending_key}:sending:{token}"
+        taken_counts = f"{self.counts_key}:sending:{token}"
+        pipe = self.redis_client.pipeline()
+        pipe.rename(self.pending_key, taken)
+        pipe.rename(self.counts_key, taken_counts)
+        try:
+            pipe.execute()
+        except Exception:
+            # Another replica took them first
+            return None
+        return taken, taken_counts
+
+    def _restore(self, alerts: Dict[str, str], counts: Dict[str, str]):
+        pipe = self.redis_client.pipeline()
+        for product_id, alert in alerts.items():
+            pipe.hsetnx(self.pending_key, product_id, alert)
+            pipe.hincrby(self.counts_key, product_id, int(counts.get(product_id, 1)))
+        pipe.execute()
+
+    def maybe_send(self) -> int:
+        """Send a digest if alerts are pending and none went out this interval"""
+        if not self.redis_client.exists(self.pending_key):
+            return 0
+        if not self.redis_client.set(
+            self.window_key, "1", nx=True, ex=max(int(self.interval_s), 1)
+        ):
+            return 0
+        taken = self._take_pending()
+        if taken is None:
+            return 0
+        taken_key, taken_counts = taken
+        alerts = self.redis_client.hgetall(taken_key)
+        counts = self.redis_client.hgetall(taken_counts)
+
+        products = []
+        for product_id, raw in alerts.items():
+            alert = json.loads(raw)
+            alert["alerts_coalesced"] = int(counts.get(product_id, 1))
+            products.append(alert)
+        products.sort(key=lambda a: (int(a.get("stock") or 0), str(a.get("name"))))
+
+        try:
+            sent = self.send(products)
+        except Exception as e:
+            logger.error(f"❌ Low stock digest failed: {e}")
+            sent = False
+        if not sent:
+            self.stats["send_errors"] += 1
+            self._restore(alerts, counts)
+            self.redis_client.delete(self.window_key, taken_key, taken_counts)
+            return 0
+
+        pipe = self.redis_client.pipeline()
+        for alert in products:
+            pipe.set(
+                self.cooldown_key(str(alert.get("product_id", "N/A"))),
+                int(alert.get("stock") or 0),
+                ex=max(int(self.cooldown_s), 1),
+            )
+        pipe.delete(taken_key, taken_counts)
+        pipe.execute()
+        self.stats["digests_sent"] += 1
+        self.stats["products_reported"] += len(products)
+        logger.info(f"✅ Low stock digest queued for {len(products)} products")
+        return len(products)
+
+    def _loop(self):
+        tick = min(max(self.interval_s / 10, 1.0), 15.0)
+        while not self._stop.wait(tick):
+            try:
+                self.maybe_send()
+            except Exception as e:
+                logger.error(f"❌ Low stock digest check failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name="low-stock-digest", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        try:
+            pending = self.redis_client.hlen(self.pending_key)
+        except Exception:
+            pending = None
+        return {**self.stats, "pending": pending, "interval_s": self.interval_s}
@@ -0,0 +1,238 @@
+# microservices/notification-service/directory.py
+import argparse
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ids per backend lookup request and per HSET while bulk loading
+LOOKUP_BATCH = 1000
+
+
+class UserDirectory:
+    """user id -> email, for notifications about events that carry only a user id.
+
+    Entries live in one Redis hash without expiry, fed by `user_registered`
+    events and by `bulk_load` from the backend's users table, with a small
+    in-process LRU in front. Ids missing from both are looked up in batches
+    through the backend's internal API (X-Internal-Token) and written back;
+    ids the backend does not know are not asked for again for `unknown_ttl_s`.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        key: str = "users:emails",
+        backend_url: str = "",
+        token: str = "",
+        lru_size: int = 10000,
+        timeout: float = 2.0,
+        unknown_ttl_s: float = 300.0,
+    ):
+        self.redis_client = redis_client
+        self.key = key
+        self.backend_url = backend_url.rstrip("/")
+        self.token = token
+        self.lru_size = lru_size
+        self.timeout = timeout
+        self.unknown_ttl_s = unknown_ttl_s
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._unknown: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "lru_hits": 0,
+            "redis_hits": 0,
+            "backend_hits": 0,
+            "not_found": 0,
+            "backend_errors": 0,
+            "loaded": 0,
+        }
+
+    # ----- local cache -----
+    def _cache(self, user_id: str, email: str):
+        with self._lock:
+            self._lru[user_id] = email
+            self._lru.move_to_end(user_id)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _cached(self, user_id: str) -> Optional[str]:
+        with self._lock:
+            email = self._lru.get(user_id)
+            if email is not None:
+                self._lru.move_to_end(user_id)
+        return email
+
+    # ----- writes -----
+    def remember(self, user_id, email: str):
+        self.remember_many({str(user_id): email})
+
+    def remember_many(self, emails: Dict[str, str]):
+        items = list(emails.items())
+        for start in range(0, len(items), LOOKUP_BATCH):
+            self.redis_client.hset(
+                self.key, mapping=dict(items[start : start + LOOKUP_BATCH])
+            )
+        for user_id, email in items:
+            self._cache(user_id, email)
+
+    # ----- lookups -----
+    def get(self, user_id) -> Optional[str]:
+        return self.get_many([user_id]).get(str(user_id))
+
+    def get_many(self, user_ids: Iterable[Any]) -> Dict[str, str]:
+        """Emails for the ids that have one: LRU, then one HMGET, then the backend"""
+        wanted = list(dict.fromkeys(str(i) for i in user_ids if i is not None))
+        found: Dict[str, str] = {}
+        misses = []
+        for user_id in wanted:
+            email = self._cached(user_id)
+            if email is None:
+                misses.append(user_id)
+            else:
+                found[user_id] = email
+        self.stats["lru_hits"] += len(found)
+        if not misses:
+            return found
+
+        remote = []
+        now = time.monotonic()
+        for user_id, email in zip(misses, self.redis_client.hmget(self.key, misses)):
+            if email:
+                found[user_id] = email
+                self._cache(user_id, email)
+                self.stats["redis_hits"] += 1
+            elif self._unknown.get(user_id, 0) > now:
+                self.stats["not_found"] += 1
+            else:
+                remote.append(user_id)
+        if remote:
+            fetched = self.fetch(remote)
+            if fetched:
+                self.remember_many(fetched)
+                found.update(fetched)
+            self.stats["backend_hits"] += len(fetched)
+            self.stats["not_found"] += len(remote) - len(fetched)
+        return found
+
+    # ----- backend -----
+    def _request(self, path: str, body: Optional[Dict[str, Any]] = None):
+        request = urllib.request.Request(
+            f"{self.backend_url}{path}",
+            data=json.dumps(body).encode() if body is not None else None,
+            headers={
+                "Content-Type": "application/json",
+                "X-Internal-Token": self.token,
+            },
+            method="POST" if body is not None else "GET",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def fetch(self, user_ids: List[str]) -> Dict[str, str]:
+        """Batched backend lookup; ids the backend cannot resolve are left out"""
+        if not (self.backend_url and self.token):
+            return {}
+        found: Dict[str, str] = {}
+        for start in range(0, len(user_ids), LOOKUP_BATCH):
+            chunk = [
+                int(i) for i in user_ids[start : start + LOOKUP_BATCH] if i.isdigit()
+            ]
+            if not chunk:
+                continue
+            try:
+                result = self._request("/internal/users/emails", {"user_ids": chunk})
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                self.stats["backend_errors"] += 1
+                logger.error(f"❌ User email lookup failed: {e}")
+                continue
+            for user in result.get("users", []):
+                found[str(user["id"])] = user["email"]
+            self._forget_unknown()
+            expires = time.monotonic() + self.unknown_ttl_s
+            for user_id in result.get("missing", []):
+                self._unknown[str(user_id)] = expires
+        return found
+
+    def _forget_unknown(self):
+        if len(self._unknown) >= self.lru_size:
+            now = time.monotonic()
+            self._unknown = {k: v for k, v in self._unknown.items() if v > now}
+            if len(self._unknown) >= self.lru_size:
+                self._unknown.clear()
+
+    def pages(
+        self, after_id: Optional[int] = 0, page_size: int = 5000
+    ) -> Iterator[Tuple[Dict[str, str], Optional[int]]]:
+        """Every user's email from the backend, paging by id.
+
+        Yields each page with the id to resume after (None after the last).
+        """
+        if not (self.backend_url and self.token):
+            raise RuntimeError("BACKEND_URL and INTERNAL_API_TOKEN are required")
+        while after_id is not None:
+            query = urllib.parse.urlencode({"after_id": after_id, "limit": page_size})
+            page = self._request(f"/internal/users/emails?{query}")
+            after_id = page.get("next_after_id")
+            yield {str(u["id"]): u["email"] for u in page.get("users", [])}, after_id
+
+    def scan(
+        self, cursor: int = 0, count: int = 1000
+    ) -> Iterator[Tuple[Dict[str, str], Optional[int]]]:
+        """Every stored email, in HSCAN order.
+
+        Yields each page with the cursor to resume from (None after the
+        last). HSCAN may return an entry more than once if the hash is
+        resized meanwhile.
+        """
+        while True:
+            cursor, emails = self.redis_client.hscan(self.key, cursor, count=count)
+            cursor = int(cursor)
+            yield emails, cursor or None
+            if not cursor:
+                return
+
+    def bulk_load(self, page_size: int = 5000) -> int:
+        """Copy every user's email from the backend, paging by id"""
+        started = time.monotonic()
+        loaded = 0
+        for emails, _ in self.pages(0, page_size):
+            if emails:
+                self.redis_client.hset(self.key, mapping=emails)
+                loaded += len(emails)
+        self.stats["loaded"] += loaded
+        logger.info(
+            f"✅ Loaded {loaded} user emails in {time.monotonic() - started:.1f}s"
+        )
+        return loaded
+
+    def get_stats(self) -> Dict[str, Any]:
+        try:
+            size = self.redis_client.hlen(self.key)
+        except Exception:
+            size = None
+        return {**self.stats, "size": size, "lru": len(self._lru)}
+
+
+def parse_load_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Load every user's email from the backend into the directory"
+    )
+    parser.add_argument("--page-size", type=int, default=5000)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # BACKEND_URL=http://backend:8001 INTERNAL_API_TOKEN=... python directory.py
+    args = parse_load_args()
+    import main
+
+    loaded = main.notification_service.directory.bulk_load(args.page_size)
+    print(json.dumps({"loaded": loaded}))
@@ -0,0 +1,389 @@
+# microservices/notification-service/dlq.py
+# Shared with the other consumer service; keep both copies identical
+# (checked by analytics-service/tests/test_shared_modules.py)
+import argparse
+import base64
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from kafka import KafkaConsumer, KafkaProducer, TopicPartition
+
+from dedupe import event_identity
+from json_codec import UndecodableMessage
+
+logger = logging.getLogger(__name__)
+
+
+def dead_letter_topic(service: str) -> str:
+    return f"{service}.dlq"
+
+
+def envelope_identity(envelope: Dict[str, Any]) -> str:
+    """The dedupe id of the original event, so replays and live traffic agree"""
+    source = envelope.get("source") or {}
+    return event_identity(
+        envelope.get("event"),
+        source.get("topic"),
+        source.get("partition"),
+        source.get("offset"),
+    )
+
+
+class DeadLetterQueue:
+    """Publishes events that failed processing, with error metadata, to a DLQ topic.
+
+    Sends are asynchronous; callers must `flush()` before committing the
+    offsets of the failed messages, so a failure is never both skipped and
+    lost. The producer is created on first use.
+    """
+
+    def __init__(
+        self, bootstrap_servers: List[str], service: str, max_resends: int = 3
+    ):
+        self.bootstrap_servers = bootstrap_servers
+        self.service = service
+        self.topic = dead_letter_topic(service)
+        self.max_resends = max_resends
+        self.producer: Optional[KafkaProducer] = None
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "publish_errors": 0}
+
+    def _get_producer(self) -> KafkaProducer:
+        if self.producer is None:
+            self.producer = KafkaProducer(
+                bootstrap_servers=self.bootstrap_servers,
+                value_serializer=lambda v: json.dumps(v, default=str).encode("utf-8"),
+                key_serializer=lambda k: k.encode("utf-8") if k else None,
+                acks="all",
+                retries=3,
+            )
+        return self.producer
+
+    @staticmethod
+    def envelope(service: str, message, error: BaseException) -> Dict[str, Any]:
+        value = message.value
+        envelope = {
+            "service": service,
+            "failed_at": datetime.now().isoformat(),
+            "attempts": 1,
+            "error": {"type": type(error).__name__, "message": str(error)[:2000]},
+            "source": {
+                "topic": message.topic,
+                "partition": message.partition,
+                "offset": message.offset,
+                "timestamp": getattr(message, "timestamp", None),
+            },
+            "event": value if isinstance(value, dict) else None,
+        }
+        if isinstance(value, UndecodableMessage):
+            envelope["raw_b64"] = base64.b64encode(value.raw).decode("ascii")
+        return envelope
+
+    def publish(self, message, error: BaseException):
+        self.publish_envelope(self.envelope(self.service, message, error))
+
+    def publish_envelope(self, envelope: Dict[str, Any]):
+        key = envelope_identity(envelope)
+        with self._lock:
+            future = self._get_producer().send(self.topic, envelope, key=key)
+            self._pending.append((future, envelope, key))
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until every published envelope is acknowledged; False if any is lost"""
+        for _ in range(self.max_resends + 1):
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return True
+            try:
+                self._get_producer().flush(timeout=timeout)
+            except Exception as e:
+                logger.error(f"❌ Dead-letter flush failed: {e}")
+            failed = [(f, env, key) for f, env, key in pending if not f.succeeded()]
+            self.stats["published"] += len(pending) - len(failed)
+            if not failed:
+                continue
+            self.stats["publish_errors"] += len(failed)
+            logger.error(f"❌ {len(failed)} dead letters not acknowledged, resending")
+            with self._lock:
+                for _, envelope, key in failed:
+                    future = self._get_producer().send(self.topic, envelope, key=key)
+                    self._pending.append((future, envelope, key))
+        with self._lock:
+            return not self._pending
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "topic": self.topic, "pending": len(self._pending)}
+
+
+def read_dead_letters(
+    bootstrap_servers: List[str],
+    topic: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    partitions: Optional[List[int]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield DLQ envelopes in [since, until) / [start_offset, end_offset).
+
+    Reads without a consumer group, up to the end offsets observed at start,
+    so a replay that dead-letters again never chases its own output.
+    """
+    consumer = KafkaConsumer(
+        bootstrap_servers=bootstrap_servers,
+        group_id=None,
+        enable_auto_commit=False,
+        value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+    )
+    try:
+        available = consumer.partitions_for_topic(topic) or set()
+        tps = [
+            TopicPartition(topic, p)
+            for p in sorted(available)
+            if partitions is None or p in partitions
+        ]
+        if not tps:
+            return
+        consumer.assign(tps)
+
+        stop_at = consumer.end_offsets(tps)
+        if until is not None:
+            by_time = consumer.offsets_for_times(
+                {tp: int(until.timestamp() * 1000) for tp in tps}
+            )
+            for tp, found in by_time.items():
+                if found is not None:
+                    stop_at[tp] = min(stop_at[tp], found.offset)
+        if end_offset is not None:
+            stop_at = {tp: min(offset, end_offset) for tp, offset in stop_at.items()}
+
+        starts = consumer.beginning_offsets(tps)
+        if since is not None:
+            by_time = consumer.offsets_for_times(
+                {tp: int(since.timestamp() * 1000) for tp in tps}
+            )
+            for tp, found in by_time.items():
+                starts[tp] = found.offset if found is not None else stop_at[tp]
+        if start_offset is not None:
+            starts = {tp: max(offset, start_offset) for tp, offset in starts.items()}
+
+        remaining = set()
+        for tp in tps:
+            if starts[tp] < stop_at[tp]:
+                consumer.seek(tp, starts[tp])
+                remaining.add(tp)
+            else:
+                consumer.pause(tp)
+
+        while remaining:
+            batches = consumer.poll(timeout_ms=1000, max_records=500)
+            for tp, messages in batches.items():
+                for message in messages:
+                    if message.offset >= stop_at[tp]:
+                        break
+                    yield message.value
+            for tp in list(remaining):
+                if consumer.position(tp) >= stop_at[tp]:
+                    remaining.discard(tp)
+                    consumer.pause(tp)
+    finally:
+        consumer.close()
+
+
+class ReplayJob:
+    """Replays dead letters through a service's handlers, rate limited and in parallel.
+
+    Safeguards against double processing:
+      * one replay per service at a time (Redis lock with TTL),
+      * envelopes are checked in bulk against the consumer's event dedupe, so
+        events handled by a retry or an earlier replay are skipped,
+      * `on_chunk` receives the ids of the events each chunk replayed and
+        makes them durable (marking them, or flushing the deltas they were
+        recorded with) before the next chunk starts; an event that fails
+        again is dead-lettered with `attempts` + 1 instead of being retried
+        in a loop.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        prefix: str,
+        dlq: DeadLetterQueue,
+        dedupe,
+        handler: Callable[[Dict[str, Any]], None],
+        on_chunk: Callable[[List[str]], None],
+        rate: float = 100.0,
+        concurrency: int = 4,
+        chunk_size: int = 200,
+        max_attempts: int = 5,
+    ):
+        self.redis_client = redis_client
+        self.lock_key = f"{prefix}:replay:lock"
+        self.status_key = f"{prefix}:replay:status"
+        self.dlq = dlq
+        self.dedupe = dedupe
+        self.handler = handler
+        self.on_chunk = on_chunk
+        self.rate = rate
+        self.concurrency = max(1, concurrency)
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.job_id = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+        self.stats = {
+            "read": 0,
+            "replayed": 0,
+            "skipped_duplicates": 0,
+            "skipped_undecodable": 0,
+            "failed": 0,
+            "abandoned": 0,
+        }
+        self.stop_event = threading.Event()
+        self._next_slot = time.monotonic()
+
+    # ----- coordination -----
+    def acquire(self, ttl_s: int = 600) -> bool:
+        if self.redis_client.set(self.lock_key, self.job_id, nx=True, ex=ttl_s):
+            return True
+        return self.redis_client.get(self.lock_key) == self.job_id
+
+    def _refresh_lock(self, ttl_s: int = 600):
+        if self.redis_client.get(self.lock_key) == self.job_id:
+            self.redis_client.expire(self.lock_key, ttl_s)
+
+    def release(self):
+        if self.redis_client.get(self.lock_key) == self.job_id:
+            self.redis_client.delete(self.lock_key)
+
+    def _save_status(self, state: str, **extra):
+        status = {"job_id": self.job_id, "state": state, **self.stats, **extra}
+        status["updated"] = datetime.now().isoformat()
+        self.redis_client.hset(
+            self.status_key, mapping={k: str(v) for k, v in status.items()}
+        )
+
+    # ----- replay -----
+    def _replay_one(self, envelope: Dict[str, Any]) -> str:
+        try:
+            self.handler(envelope)
+            return "replayed"
+        except Exception as e:
+            attempts = int(envelope.get("attempts") or 1) + 1
+            if attempts > self.max_attempts:
+                logger.error(
+                    f"❌ Abandoning dead letter after {attempts - 1} attempts: {e}"
+                )
+                return "abandoned"
+            self.dlq.publish_envelope(
+                {
+                    **envelope,
+                    "attempts": attempts,
+                    "failed_at": datetime.now().isoformat(),
+                    "error": {"type": type(e).__name__, "message": str(e)[:2000]},
+                }
+            )
+            return "failed"
+
+    def _run_chunk(self, pool: ThreadPoolExecutor, chunk: List[Dict[str, Any]]):
+        ids = [envelope_identity(envelope) for envelope in chunk]
+        seen = self.dedupe.seen(ids)
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        in_flight = {}
+        replayed: List[str] = []
+
+        for envelope, event_id, duplicate in zip(chunk, ids, seen):
+            if duplicate or event_id in in_flight.values() or event_id in replayed:
+                self.stats["skipped_duplicates"] += 1
+                continue
+            if envelope.get("event") is None:
+                self.stats["skipped_undecodable"] += 1
+                continue
+            # Token pacing across the whole job, not per worker
+            if interval:
+                delay = self._next_slot - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self._next_slot = max(self._next_slot, time.monotonic()) + interval
+            while len(in_flight) >= self.concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._collect(future, in_flight.pop(future), replayed)
+            in_flight[pool.submit(self._replay_one, envelope)] = event_id
+
+        for future in list(in_flight):
+            self._collect(future, in_flight.pop(future), replayed)
+        if replayed:
+            self.on_chunk(replayed)
+
+    def _collect(self, future, event_id: str, replayed: List[str]):
+        outcome = future.result()
+        self.stats[outcome] += 1
+        if outcome == "replayed":
+            replayed.append(event_id)
+
+    def run(self, envelopes: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+        """Replay everything `envelopes` yields; the caller must hold the lock"""
+        started = time.monotonic()
+        self._save_status("running")
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                chunk: List[Dict[str, Any]] = []
+                for envelope in envelopes:
+                    if self.stop_event.is_set():
+                        break
+                    self.stats["read"] += 1
+                    chunk.append(envelope)
+                    if len(chunk) >= self.chunk_size:
+                        self._run_chunk(pool, chunk)
+                        chunk = []
+                        self._refresh_lock()
+                        self._save_status("running")
+                if chunk:
+                    self._run_chunk(pool, chunk)
+            if not self.dlq.flush():
+                raise RuntimeError("re-dead-lettered events were not acknowledged")
+        except Exception as e:
+            logger.error(f"❌ Dead-letter replay failed: {e}")
+            self._save_status("failed", error=str(e))
+            raise
+        elapsed = time.monotonic() - started
+        self._save_status(
+            "stopped" if self.stop_event.is_set() else "done",
+            seconds=round(elapsed, 1),
+        )
+        logger.info(f"✅ Dead-letter replay finished in {elapsed:.1f}s: {self.stats}")
+        return dict(self.stats)
+
+
+def get_replay_status(redis_client, prefix: str) -> Dict[str, Any]:
+    status = redis_client.hgetall(f"{prefix}:replay:status") or {}
+    status["locked_by"] = redis_client.get(f"{prefix}:replay:lock")
+    return status
+
+
+def parse_replay_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay dead-lettered events")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="ISO timestamp")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="ISO timestamp")
+    parser.add_argument("--start-offset", type=int)
+    parser.add_argument("--end-offset", type=int)
+    parser.add_argument("--partition", type=int, action="append", dest="partitions")
+    parser.add_argument("--rate", type=float, default=100.0, help="events per second")
+    parser.add_argument("--concurrency", type=int, default=4)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # python dlq.py --since 2026-10-19T00:00 --rate 200 --concurrency 8
+    args = parse_replay_args()
+    import main
+
+    print(json.dumps(main.replay_dead_letters(**vars(args)), indent=2))
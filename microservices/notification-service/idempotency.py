@@ -0,0 +1,146 @@
+# microservices/notification-service/idempotency.py
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationGuard:
+    """At most one email per notification, e.g. one confirmation per order.
+
+    Event dedupe only catches redeliveries of the same event id; this keys
+    on what the email is about (`{prefix}:{type}:{entity id}`), so replays,
+    rebalances and re-published events all map to the same key. A key is
+      * claimed - SET NX for `claim_ttl_s` before the email is rendered,
+                  and kept for `sent_ttl_s` once the email is stored in
+                  the send queue (`commit`);
+      * sent    - set by the send queue in the same transaction that
+                  removes the job (`settle`), for `sent_ttl_s`.
+    Claims whose email was not queued (handler error, no recipient, failed
+    flush) are deleted by `commit`, and the send queue deletes the key of
+    an email that failed for good, so a later replay can send it. A
+    consumer that dies between claiming and queueing blocks those
+    notifications until `claim_ttl_s` passes.
+
+    Claims are per thread, like the send queue's buffer: `claim_many`
+    takes a batch's keys in one round trip, `claim` then answers from it,
+    and `commit` settles the batch in one more.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        prefix: str = "notif",
+        claim_ttl_s: float = 300.0,
+        sent_ttl_s: float = 7 * 24 * 3600.0,
+    ):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.claim_ttl_s = claim_ttl_s
+        self.sent_ttl_s = sent_ttl_s
+        self._local = threading.local()
+        self.stats = {
+            "claimed": 0,
+            "duplicates": 0,
+            "released": 0,
+            "claim_errors": 0,
+        }
+
+    def key(self, notification_type: str, entity_id: Any) -> str:
+        return f"{self.prefix}:{notification_type}:{entity_id}"
+
+    # ----- per-thread state -----
+    def _state(self):
+        if not hasattr(self._local, "claims"):
+            self._local.claims = {}  # prefetched claim results
+            self._local.held = set()  # claimed by us, not yet committed
+            self._local.queued = set()
+        return self._local
+
+    # ----- claiming -----
+    def claim_many(self, keys: Iterable[str]):
+        """Claim a batch's keys in one pipeline; `claim` answers from the results"""
+        state = self._state()
+        wanted = [k for k in dict.fromkeys(keys) if k not in state.claims]
+        if not wanted:
+            return
+        ttl = max(int(self.claim_ttl_s), 1)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in wanted:
+            pipe.set(key, "claimed", nx=True, ex=ttl)
+        try:
+            results = pipe.execute()
+        except Exception as e:
+            # Left to `claim`, which fails open
+            logger.error(f"❌ Could not claim {len(wanted)} notifications: {e}")
+            self.stats["claim_errors"] += 1
+            return
+        for key, claimed in zip(wanted, results):
+            state.claims[key] = bool(claimed)
+            if claimed:
+                state.held.add(key)
+
+    def claim(self, key: str) -> bool:
+        """True if the caller should send this notification.
+
+        Fails open: if Redis is unavailable the notification is sent.
+        """
+        state = self._state()
+        claimed = state.claims.pop(key, None)
+        if claimed is None:
+            try:
+                claimed = bool(
+                    self.redis_client.set(
+                        key, "claimed", nx=True, ex=max(int(self.claim_ttl_s), 1)
+                    )
+                )
+            except Exception as e:
+                logger.error(f"❌ Could not claim {key}: {e}")
+                self.stats["claim_errors"] += 1
+                return True
+            if claimed:
+                state.held.add(key)
+        self.stats["claimed" if claimed else "duplicates"] += 1
+        return claimed
+
+    def mark_queued(self, key: str):
+        """The email for a claimed key was put on the send queue (or sent)"""
+        self._state().queued.add(key)
+
+    def commit(self, flushed: bool):
+        """End of a batch: keep the claims whose email was stored, drop the rest"""
+        state = self._state()
+        held, queued = state.held, (state.queued if flushed else set())
+        self._local.claims, self._local.held, self._local.queued = {}, set(), set()
+        release = held - queued
+        keep = held & queued
+        if not (release or keep):
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        if release:
+            pipe.delete(*release)
+        for key in keep:
+            # EXPIRE rather than SET: a sender may have settled it already
+            pipe.expire(key, max(int(self.sent_ttl_s), 1))
+        try:
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"❌ Could not commit {len(held)} notification claims: {e}")
+            self.stats["claim_errors"] += 1
+            return
+        self.stats["released"] += len(release)
+
+    # ----- after sending -----
+    def settle(self, pipe, job: Dict[str, Any], success: bool):
+        """Queue the final state of a job's key on the send worker's pipeline"""
+        key: Optional[str] = job.get("idempotency_key")
+        if not key:
+            return
+        if success:
+            pipe.set(key, "sent", ex=max(int(self.sent_ttl_s), 1))
+        else:
+            pipe.delete(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "claim_ttl_s": self.claim_ttl_s}
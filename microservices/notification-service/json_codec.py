@@ -0,0 +1,119 @@
+# microservices/notification-service/json_codec.py
+# Shared with the other consumer service; keep both copies identical
+# (checked by analytics-service/tests/test_shared_modules.py)
+import json
+import logging
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib parser
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# How much of a bad payload makes it into the logs
+PREVIEW_BYTES = 200
+
+
+class RateLimitedLog:
+    """Logs at most `burst` messages per `interval_s`, then a suppressed count"""
+
+    def __init__(self, log: logging.Logger, burst: int = 10, interval_s: float = 60.0):
+        self.log = log
+        self.burst = burst
+        self.interval_s = interval_s
+        self.window_start = time.monotonic()
+        self.emitted = 0
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, level: int, message: str):
+        with self._lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.interval_s:
+                if self.suppressed:
+                    self.log.warning(
+                        f"⚠️ Suppressed {self.suppressed} similar messages "
+                        f"in the last {self.interval_s:.0f}s"
+                    )
+                self.window_start = now
+                self.emitted = 0
+                self.suppressed = 0
+            if self.emitted >= self.burst:
+                self.suppressed += 1
+                return
+            self.emitted += 1
+        self.log.log(level, message)
+
+
+class UndecodableMessage:
+    """Returned in place of a payload that is not JSON, so it can be dead-lettered"""
+
+    __slots__ = ("raw", "error")
+
+    def __init__(self, raw: bytes, error: str):
+        self.raw = raw
+        self.error = error
+
+    def __bool__(self) -> bool:
+        return False
+
+
+decode_errors = RateLimitedLog(logger)
+stats = {"decoded": 0, "recovered": 0, "failed": 0}
+
+
+def _as_bytes(data) -> bytes:
+    if isinstance(data, str):
+        return data.encode("utf-8", errors="replace")
+    try:
+        return bytes(data)
+    except Exception:
+        return repr(data).encode()
+
+
+def _loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _lenient_loads(raw):
+    """Slow path for payloads the strict parser rejected"""
+    data = raw
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8", errors="replace")
+    text = data.strip()
+    if not text:
+        decode_errors(logging.WARNING, "⚠️ Received empty message")
+        return None
+    # Producers have been seen wrapping the document in single quotes
+    if len(text) > 1 and text[0] == text[-1] == "'":
+        text = text[1:-1]
+    try:
+        value = json.loads(text)
+    except ValueError as e:
+        stats["failed"] += 1
+        decode_errors(
+            logging.ERROR,
+            f"❌ JSON decode error: {e}; payload {text[:PREVIEW_BYTES]!r}",
+        )
+        return UndecodableMessage(_as_bytes(raw), f"JSON decode error: {e}")
+    stats["recovered"] += 1
+    return value
+
+
+def safe_json_deserializer(data):
+    """Kafka value deserializer: parse bytes directly, clean up only on error"""
+    if data is None or isinstance(data, dict):
+        return data
+    try:
+        value = _loads(data)
+    except ValueError:
+        return _lenient_loads(data)
+    except Exception as e:
+        stats["failed"] += 1
+        decode_errors(logging.ERROR, f"❌ Unexpected error in JSON deserializer: {e}")
+        return UndecodableMessage(_as_bytes(data), f"Deserializer error: {e}")
+    stats["decoded"] += 1
+    return value
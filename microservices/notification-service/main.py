@@ -2,21 +2,34 @@
 import asyncio
 import json
 import logging
-import smtplib
 import threading
+import time
 from datetime import datetime
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
+from jinja2 import TemplateNotFound
+from pydantic import BaseModel
 import redis
 from kafka import KafkaConsumer
 import os
 from contextlib import asynccontextmanager
-from jinja2 import Template
-import ssl
+
+import instrumentation
+from campaigns import CampaignSender
+from dedupe import EventDeduplicator, event_identity
+from digest import LowStockDigest
+from directory import UserDirectory
+from idempotency import NotificationGuard
+from dlq import DeadLetterQueue, ReplayJob, get_replay_status, read_dead_letters
+from json_codec import UndecodableMessage, safe_json_deserializer
+from outbox import SendQueue, email_job
+from ratelimit import TokenBucket
+from rendering import TEMPLATE_DIR, create_environment
+from smtp_pool import SMTPConnectionPool
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +49,57 @@ SMTP_USERNAME = os.getenv("SMTP_USERNAME", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USERNAME)
 FROM_NAME = os.getenv("FROM_NAME", "E-Commerce Store")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+# Persistent SMTP sessions: NOOP after KEEPALIVE quiet seconds, closed after
+# MAX_IDLE seconds without a message or after MAX_MESSAGES messages
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(
+    os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100")
+)
+SMTP_KEEPALIVE_SECONDS = float(os.getenv("SMTP_KEEPALIVE_SECONDS", "30"))
+SMTP_MAX_IDLE_SECONDS = float(os.getenv("SMTP_MAX_IDLE_SECONDS", "240"))
+# Send queue between the consumer and SMTP: the consumer waits (up to BLOCK
+# seconds per batch) while the queue holds MAX_DEPTH emails
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", str(SMTP_POOL_SIZE)))
+SEND_QUEUE_MAX_DEPTH = int(os.getenv("SEND_QUEUE_MAX_DEPTH", "10000"))
+SEND_QUEUE_BLOCK_SECONDS = float(os.getenv("SEND_QUEUE_BLOCK_SECONDS", "60"))
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "3"))
+# Failed sends are retried after BASE seconds, doubling up to MAX
+SEND_RETRY_BASE_SECONDS = float(os.getenv("SEND_RETRY_BASE_SECONDS", "30"))
+SEND_RETRY_MAX_SECONDS = float(os.getenv("SEND_RETRY_MAX_SECONDS", "900"))
+# SMTP relay quota shared by all replicas (0 = unlimited); emails over it
+# wait in the delay queue, order confirmations ahead of welcome emails
+SMTP_RATE_LIMIT_PER_MINUTE = float(os.getenv("SMTP_RATE_LIMIT_PER_MINUTE", "60"))
+SMTP_RATE_LIMIT_BURST = int(os.getenv("SMTP_RATE_LIMIT_BURST", "10"))
+
+# Email templates: TEMPLATE_AUTO_RELOAD picks up edits without a restart (dev);
+# compiled templates are cached on disk ("off" disables, "" = temp dir)
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", TEMPLATE_DIR)
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "false").lower() == "true"
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR", "")
+
+# User email directory: batched lookups of unknown ids go to the backend's
+# internal API, authenticated with the shared INTERNAL_API_TOKEN
+BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8001")
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+USER_DIRECTORY_LRU_SIZE = int(os.getenv("USER_DIRECTORY_LRU_SIZE", "10000"))
+
+# Low stock alerts: one digest per interval; reported products stay quiet for
+# the cooldown unless they run out of stock
+LOW_STOCK_DIGEST_INTERVAL_SECONDS = float(
+    os.getenv("LOW_STOCK_DIGEST_INTERVAL_SECONDS", "300")
+)
+LOW_STOCK_COOLDOWN_SECONDS = float(os.getenv("LOW_STOCK_COOLDOWN_SECONDS", "3600"))
+
+# Bulk campaigns: recipients are queued CHUNK_SIZE at a time, keeping at most
+# MAX_BACKLOG campaign emails waiting; by default a campaign gets half the
+# SMTP rate limit, leaving the rest for order confirmations and alerts
+CAMPAIGN_CHUNK_SIZE = int(os.getenv("CAMPAIGN_CHUNK_SIZE", "500"))
+CAMPAIGN_MAX_BACKLOG = int(os.getenv("CAMPAIGN_MAX_BACKLOG", "1000"))
+CAMPAIGN_RATE_PER_MINUTE = float(
+    os.getenv("CAMPAIGN_RATE_PER_MINUTE", str(SMTP_RATE_LIMIT_PER_MINUTE / 2))
+)
 
 # Admin Configuration
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "npanchayan.gate@gmail.com")  # Fixed admin email
@@ -43,27 +107,25 @@ ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "npanchayan.gate@gmail.com")  # Fixed adm
 # Topics to consume
 KAFKA_TOPICS = ["orders", "users", "products", "payments"]
 
+# Consumer batching and event dedupe ("set" or "bloom" store)
+CONSUMER_BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", "50"))
+DEDUPE_BACKEND = os.getenv("DEDUPE_BACKEND", "set")
+DEDUPE_WINDOW_MINUTES = int(os.getenv("DEDUPE_WINDOW_MINUTES", "60"))
+# One email per order / user: claims on notif:{type}:{id} expire after CLAIM
+# seconds unless the email was queued, then are kept for SENT seconds
+NOTIFY_CLAIM_TTL_SECONDS = float(os.getenv("NOTIFY_CLAIM_TTL_SECONDS", "300"))
+NOTIFY_SENT_TTL_SECONDS = float(os.getenv("NOTIFY_SENT_TTL_SECONDS", "604800"))
+
+# Dead-letter replay defaults (CLI: python dlq.py, API: POST /dlq/replay)
+DLQ_REPLAY_RATE = float(os.getenv("DLQ_REPLAY_RATE", "20"))
+DLQ_REPLAY_CONCURRENCY = int(os.getenv("DLQ_REPLAY_CONCURRENCY", "4"))
+DLQ_MAX_ATTEMPTS = int(os.getenv("DLQ_MAX_ATTEMPTS", "5"))
+
 # Global variables
 redis_client: Optional[redis.Redis] = None
 kafka_consumer: Optional[KafkaConsumer] = None
 consumer_thread: Optional[threading.Thread] = None
-
-
-def safe_json_deserializer(data):
-    """Safe JSON deserializer"""
-    try:
-        if data is None:
-            return None
-        if isinstance(data, dict):
-            return data
-        if isinstance(data, bytes):
-            data = data.decode("utf-8")
-        if not data or not data.strip():
-            return None
-        return json.loads(data.strip())
-    except Exception as e:
-        logger.error(f"❌ JSON decode error: {e}")
-        return None
+replay_job: Optional[ReplayJob] = None
 
 
 class EmailService:
@@ -75,41 +137,52 @@ class EmailService:
         self.from_email = FROM_EMAIL
         self.from_name = FROM_NAME
         self.enabled = bool(self.username and self.password)
+        self.pool = SMTPConnectionPool(
+            self.smtp_server,
+            self.smtp_port,
+            self.username,
+            self.password,
+            size=SMTP_POOL_SIZE,
+            max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION,
+            keepalive_s=SMTP_KEEPALIVE_SECONDS,
+            max_idle_s=SMTP_MAX_IDLE_SECONDS,
+            timeout=SMTP_TIMEOUT_SECONDS,
+            starttls=SMTP_STARTTLS,
+        )
 
         if not self.enabled:
             logger.warning("⚠️ Email service disabled - missing SMTP credentials")
         else:
             logger.info(f"✅ Email service configured - {self.from_email}")
 
+    def build_message(
+        self, to_email: str, subject: str, html_body: str, text_body: str = None
+    ) -> MIMEMultipart:
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = f"{self.from_name} <{self.from_email}>"
+        msg["To"] = to_email
+
+        # Add text and HTML parts
+        if text_body:
+            text_part = MIMEText(text_body, "plain")
+            msg.attach(text_part)
+
+        html_part = MIMEText(html_body, "html")
+        msg.attach(html_part)
+        return msg
+
     def send_email(
         self, to_email: str, subject: str, html_body: str, text_body: str = None
     ) -> bool:
-        """Send email using SMTP"""
+        """Send email over a pooled SMTP session"""
         if not self.enabled:
             logger.warning(f"📧 Email disabled - would send to {to_email}: {subject}")
             return False
 
         try:
-            # Create message
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = f"{self.from_name} <{self.from_email}>"
-            msg["To"] = to_email
-
-            # Add text and HTML parts
-            if text_body:
-                text_part = MIMEText(text_body, "plain")
-                msg.attach(text_part)
-
-            html_part = MIMEText(html_body, "html")
-            msg.attach(html_part)
-
-            # Send email
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.username, self.password)
-                server.send_message(msg)
+            msg = self.build_message(to_email, subject, html_body, text_body)
+            self.pool.send_message(msg)
 
             logger.info(f"✅ Email sent to {to_email}: {subject}")
             return True
@@ -120,250 +193,89 @@ class EmailService:
 
 
 class NotificationTemplates:
-    """Email templates for different notification types"""
+    """Email templates for different notification types (see templates/)"""
+
+    env = create_environment(
+        TEMPLATE_DIR, TEMPLATE_AUTO_RELOAD, TEMPLATE_BYTECODE_CACHE_DIR
+    )
+
+    @classmethod
+    def render(cls, name: str, **context) -> str:
+        return cls.env.get_template(name).render(**context)
 
-    @staticmethod
-    def order_confirmation(order_data: Dict[str, Any]) -> Dict[str, str]:
+    @classmethod
+    def order_confirmation(cls, order_data: Dict[str, Any]) -> Dict[str, str]:
         """Order confirmation email template"""
         order_id = order_data.get("order_id", "N/A")
-        total = order_data.get("total", 0)
-        items = order_data.get("items", [])
-        user_email = order_data.get("user_email", "customer")
-
-        html_template = Template(
-            """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: #4f46e5; color: white; padding: 20px; text-align: center; }
-                .content { padding: 20px; background: #f9f9f9; }
-                .order-summary { background: white; padding: 15px; margin: 15px 0; border-radius: 5px; }
-                .item { padding: 10px; border-bottom: 1px solid #eee; }
-                .total { font-weight: bold; font-size: 18px; color: #4f46e5; }
-                .footer { text-align: center; padding: 20px; font-size: 12px; color: #666; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🎉 Order Confirmed!</h1>
-                    <p>Thank you for your order, {{ user_email }}!</p>
-                </div>
-                <div class="content">
-                    <h2>Order #{{ order_id }}</h2>
-                    <p>Your order has been successfully placed and is being processed.</p>
-                    
-                    <div class="order-summary">
-                        <h3>Order Summary:</h3>
-                        {% for item in items %}
-                        <div class="item">
-                            <strong>{{ item.product_name }}</strong><br>
-                            Quantity: {{ item.quantity }} × ${{ "%.2f"|format(item.price) }} = ${{ "%.2f"|format(item.quantity * item.price) }}
-                        </div>
-                        {% endfor %}
-                        <div class="total">
-                            Total: ${{ "%.2f"|format(total) }}
-                        </div>
-                    </div>
-                    
-                    <p>We'll send you another email when your order ships!</p>
-                </div>
-                <div class="footer">
-                    <p>Your Online Store - Thank you for shopping with us!</p>
-                    <p>If you have any questions, reply to this email or contact our support team.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        )
-
-        text_template = Template(
-            """
-        🎉 ORDER CONFIRMED!
-        
-        Thank you for your order, {{ user_email }}!
-        
-        Order #{{ order_id }}
-        
-        Order Summary:
-        {% for item in items %}
-        - {{ item.product_name }} ({{ item.quantity }}x) - ${{ "%.2f"|format(item.quantity * item.price) }}
-        {% endfor %}
-        
-        Total: ${{ "%.2f"|format(total) }}
-        
-        We'll notify you when your order ships!
-        
-        Your Online Store Team
-        """
-        )
 
         return {
             "subject": f"Order Confirmation #{order_id} - Your Online Store",
-            "html": html_template.render(**order_data),
-            "text": text_template.render(**order_data),
+            "html": cls.render("order_confirmation.html", **order_data),
+            "text": cls.render("order_confirmation.txt", **order_data),
         }
 
-    @staticmethod
-    def welcome_user(user_data: Dict[str, Any]) -> Dict[str, str]:
-        """Welcome email template"""
-        email = user_data.get("email", "")
-
-        html_template = Template(
-            """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: #10b981; color: white; padding: 20px; text-align: center; }
-                .content { padding: 20px; background: #f9f9f9; }
-                .cta { background: #10b981; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; display: inline-block; margin: 15px 0; }
-                .footer { text-align: center; padding: 20px; font-size: 12px; color: #666; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🎊 Welcome to Our Store!</h1>
-                    <p>Your account has been created successfully</p>
-                </div>
-                <div class="content">
-                    <h2>Hello {{ email }}!</h2>
-                    <p>Welcome to our online store - your new favorite shopping destination!</p>
-                    
-                    <p>Here's what you can do now:</p>
-                    <ul>
-                        <li>🛍️ Browse our amazing product collection</li>
-                        <li>💰 Enjoy exclusive member discounts</li>
-                        <li>📦 Track your orders in real-time</li>
-                        <li>❤️ Save your favorite items</li>
-                    </ul>
-                    
-                    <a href="http://localhost:3000/products" class="cta">Start Shopping Now!</a>
-                    
-                    <p>Happy shopping!</p>
-                </div>
-                <div class="footer">
-                    <p>Your Online Store Team</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        )
-
-        text_template = Template(
-            """
-        🎊 WELCOME TO OUR STORE!
-        
-        Hello {{ email }}!
-        
-        Your account has been created successfully. Welcome to our online store!
-        
-        What you can do now:
-        - Browse our amazing products
-        - Enjoy exclusive member discounts  
-        - Track your orders in real-time
-        - Save your favorite items
-        
-        Start shopping: http://localhost:3000/products
-        
-        Happy shopping!
-        Your Online Store Team
-        """
-        )
+    @classmethod
+    def campaign(
+        cls, template: str, subject: str, context: Dict[str, Any]
+    ) -> Dict[str, str]:
+        """Bulk campaign email (templates/campaign_*.html and .txt)"""
+        return {
+            "subject": subject,
+            "html": cls.render(f"{template}.html", **context),
+            "text": cls.render(f"{template}.txt", **context),
+        }
 
+    @classmethod
+    def welcome_user(cls, user_data: Dict[str, Any]) -> Dict[str, str]:
+        """Welcome email template"""
         return {
             "subject": "Welcome to Our Store! 🎊",
-            "html": html_template.render(**user_data),
-            "text": text_template.render(**user_data),
+            "html": cls.render("welcome_user.html", **user_data),
+            "text": cls.render("welcome_user.txt", **user_data),
         }
 
-    @staticmethod
-    def low_stock_alert(product_data: Dict[str, Any]) -> Dict[str, str]:
+    @classmethod
+    def low_stock_alert(cls, product_data: Dict[str, Any]) -> Dict[str, str]:
         """Enhanced low stock alert template"""
         product_name = product_data.get("name", "Unknown Product")
         stock = product_data.get("stock", 0)
-        product_id = product_data.get("product_id", "N/A")
-        threshold = product_data.get("threshold", 5)
         event_type = product_data.get("event_type", "unknown")
-        price = product_data.get("price", 0)
-        
+
         # Determine trigger message
         trigger_msg = "automatically detected after an order" if event_type == "low_stock_detected" else "detected during manual update"
-        
-        html_template = Template("""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: #f59e0b; color: white; padding: 20px; text-align: center; }
-                .content { padding: 20px; background: #fef3c7; }
-                .alert { background: #dc2626; color: white; padding: 15px; text-align: center; border-radius: 5px; margin: 15px 0; }
-                .details { background: white; padding: 15px; border-radius: 5px; margin: 10px 0; }
-                .footer { text-align: center; padding: 20px; font-size: 12px; color: #666; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>⚠️ Low Stock Alert</h1>
-                    <p>Automatic Inventory Monitoring</p>
-                </div>
-                <div class="content">
-                    <div class="alert">
-                        <h2>URGENT: Stock Running Low!</h2>
-                        <p>{{ trigger_msg }}</p>
-                    </div>
-                    
-                    <div class="details">
-                        <h3>📦 Product Details:</h3>
-                        <p><strong>Name:</strong> {{ product_name }}</p>
-                        <p><strong>Product ID:</strong> {{ product_id }}</p>
-                        <p><strong>Current Stock:</strong> {{ stock }} units</p>
-                        <p><strong>Alert Threshold:</strong> {{ threshold }} units</p>
-                        <p><strong>Price:</strong> ${{ "%.2f"|format(price) }}</p>
-                        <p><strong>Status:</strong> {% if stock == 0 %}OUT OF STOCK{% else %}LOW STOCK{% endif %}</p>
-                    </div>
-                    
-                    <p><strong>Action Required:</strong> Restock this product soon to avoid lost sales.</p>
-                    
-                    <p><strong>Recommendations:</strong></p>
-                    <ul>
-                        <li>Order new inventory immediately</li>
-                        <li>Consider increasing stock threshold for popular items</li>
-                        <li>Review sales velocity for better forecasting</li>
-                    </ul>
-                </div>
-                <div class="footer">
-                    <p>Store Inventory Management System</p>
-                    <p>Alert triggered: {{ timestamp }}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """)
-        
+
+        context = {
+            "product_name": product_name,
+            "product_id": product_data.get("product_id", "N/A"),
+            "stock": stock,
+            "threshold": product_data.get("threshold", 5),
+            "price": product_data.get("price", 0),
+            "trigger_msg": trigger_msg,
+            "timestamp": product_data.get("timestamp", ""),
+        }
         return {
             "subject": f"⚠️ Low Stock Alert: {product_name} ({stock} units left)",
-            "html": html_template.render(
-                product_name=product_name, 
-                product_id=product_id, 
-                stock=stock,
-                threshold=threshold,
-                price=price,
-                trigger_msg=trigger_msg,
-                timestamp=product_data.get("timestamp", "")
+            "html": cls.render("low_stock_alert.html", **context),
+            "text": cls.render("low_stock_alert.txt", **context),
+        }
+
+    @classmethod
+    def low_stock_digest(
+        cls, products: List[Dict[str, Any]], cooldown_s: float
+    ) -> Dict[str, str]:
+        """Several low stock alerts in one email"""
+        context = {
+            "products": products,
+            "out_of_stock": sum(1 for p in products if not p.get("stock")),
+            "cooldown_minutes": int(cooldown_s // 60),
+            "timestamp": datetime.now().isoformat(),
+        }
+        return {
+            "subject": (
+                f"⚠️ Low Stock Digest: {len(products)} products need restocking"
             ),
-            "text": f"LOW STOCK ALERT\n\nProduct: {product_name}\nID: {product_id}\nStock: {stock} units (threshold: {threshold})\nPrice: ${price:.2f}\n\nRestock immediately!\n\nTriggered: {trigger_msg}"
+            "html": cls.render("low_stock_digest.html", **context),
+            "text": cls.render("low_stock_digest.txt", **context),
         }
 
 
@@ -379,6 +291,63 @@ class NotificationService:
 
         self.email_service = EmailService()
         self.templates = NotificationTemplates()
+        self.dedupe = EventDeduplicator(
+            self.redis_client,
+            "notifications:dedupe",
+            window_s=DEDUPE_WINDOW_MINUTES * 60,
+            backend=DEDUPE_BACKEND,
+        )
+        self.guard = NotificationGuard(
+            self.redis_client,
+            "notif",
+            claim_ttl_s=NOTIFY_CLAIM_TTL_SECONDS,
+            sent_ttl_s=NOTIFY_SENT_TTL_SECONDS,
+        )
+        self.dlq = DeadLetterQueue(KAFKA_SERVERS, CONSUMER_GROUP)
+        self.low_stock = LowStockDigest(
+            self.redis_client,
+            "notifications:lowstock",
+            send=self.send_low_stock_digest,
+            interval_s=LOW_STOCK_DIGEST_INTERVAL_SECONDS,
+            cooldown_s=LOW_STOCK_COOLDOWN_SECONDS,
+        )
+        self.directory = UserDirectory(
+            self.redis_client,
+            "users:emails",
+            backend_url=BACKEND_URL,
+            token=INTERNAL_API_TOKEN,
+            lru_size=USER_DIRECTORY_LRU_SIZE,
+        )
+        self.outbox = SendQueue(
+            self.redis_client,
+            "notifications:outbox",
+            deliver=self.deliver_email,
+            on_done=self.record_delivery,
+            workers=SEND_WORKERS,
+            max_depth=SEND_QUEUE_MAX_DEPTH,
+            max_attempts=SEND_MAX_ATTEMPTS,
+            block_s=SEND_QUEUE_BLOCK_SECONDS,
+            limiters={
+                "smtp": TokenBucket(
+                    self.redis_client,
+                    "notifications:ratelimit:smtp",
+                    per_minute=SMTP_RATE_LIMIT_PER_MINUTE,
+                    burst=SMTP_RATE_LIMIT_BURST,
+                )
+            },
+            retry_base_s=SEND_RETRY_BASE_SECONDS,
+            retry_max_s=SEND_RETRY_MAX_SECONDS,
+            settle=self.settle_email,
+        )
+        self.campaigns = CampaignSender(
+            self.redis_client,
+            "notifications:campaigns",
+            self.outbox,
+            self.directory,
+            render=self.templates.campaign,
+            chunk_size=CAMPAIGN_CHUNK_SIZE,
+            max_backlog=CAMPAIGN_MAX_BACKLOG,
+        )
 
         # Metrics
         self.metrics_keys = {
@@ -425,36 +394,96 @@ class NotificationService:
         except Exception as e:
             logger.error(f"❌ Error logging notification: {e}")
 
-    def get_user_email_from_backend(self, user_id: str) -> str:
-        """Get user email from backend API or database"""
-        try:
-            # In a real implementation, you would:
-            # 1. Query your database directly, or
-            # 2. Make an API call to your backend to get user details
+    def notification_key(self, event: Dict[str, Any]) -> Optional[str]:
+        """Idempotency key of the email an event leads to, if it leads to one"""
+        event_type = event.get("event")
+        if event_type == "order_created" and event.get("order_id"):
+            return self.guard.key("order_confirmation", event["order_id"])
+        if event_type == "user_registered":
+            user = event.get("user_id") or event.get("email")
+            if user:
+                return self.guard.key("welcome_email", user)
+        return None
+
+    def claim_notification(self, event: Dict[str, Any]) -> bool:
+        """False if this event's email was already sent or is being sent"""
+        key = self.notification_key(event)
+        if key is None or self.guard.claim(key):
+            return True
+        logger.info(f"♻️ Skipping {key}: already sent")
+        return False
+
+    def enqueue_email(
+        self,
+        notification_type: str,
+        to_email: str,
+        template_data: Dict[str, str],
+        idempotency_key: Optional[str] = None,
+    ):
+        """Hand a rendered email to the send queue (stored on the next flush)"""
+        if not self.email_service.enabled:
+            # Nothing would drain the queue; log and count it as before
+            success = self.email_service.send_email(
+                to_email, template_data["subject"], template_data["html"]
+            )
+            self.log_notification(notification_type, success, to_email)
+            # Unsent, the claim is released at commit so a replay can send it
+            if success and idempotency_key:
+                self.guard.mark_queued(idempotency_key)
+            return
+        self.outbox.put(
+            email_job(
+                notification_type,
+                to_email,
+                template_data,
+                idempotency_key=idempotency_key,
+            )
+        )
+        if idempotency_key:
+            self.guard.mark_queued(idempotency_key)
+        logger.info(f"📬 Queued {notification_type} email to {to_email}")
+
+    def deliver_email(self, job: Dict[str, Any]) -> bool:
+        return self.email_service.send_email(
+            to_email=job["to"],
+            subject=job["subject"],
+            html_body=job["html"],
+            text_body=job["text"],
+        )
+
+    def settle_email(self, pipe, job: Dict[str, Any], success: bool):
+        self.guard.settle(pipe, job, success)
+        self.campaigns.settle(pipe, job, success)
+
+    def record_delivery(self, job: Dict[str, Any], success: bool):
+        """Final outcome of a queued email, after any retries"""
+        # Campaign emails are counted on their campaign instead
+        if not job.get("campaign_id"):
+            self.log_notification(job["type"], success, job["to"])
+        if not success:
+            logger.error(
+                f"❌ Giving up on {job['type']} email to {job['to']} "
+                f"after {job['attempts']} attempts"
+            )
 
-            # For now, we'll use a simple Redis cache approach
-            # In production, replace this with actual database query
-            user_email = self.redis_client.get(f"user:email:{user_id}")
+    def send_low_stock_digest(self, products: List[Dict[str, Any]]) -> bool:
+        """Queue the admin email for a digest; True once it is stored"""
+        if len(products) == 1:
+            template_data = self.templates.low_stock_alert(products[0])
+        else:
+            template_data = self.templates.low_stock_digest(
+                products, LOW_STOCK_COOLDOWN_SECONDS
+            )
+        self.enqueue_email("low_stock_digest", ADMIN_EMAIL, template_data)
+        return self.outbox.flush()
 
+    def get_user_email_from_backend(self, user_id: str) -> str:
+        """Get user email from the user directory (backend lookup on a miss)"""
+        try:
+            user_email = self.directory.get(user_id)
             if user_email:
                 return user_email
 
-            # Fallback: Try to get from recent registration events
-            recent_users = self.redis_client.lrange("users:recent_registrations", 0, 50)
-            for user_data_str in recent_users:
-                try:
-                    user_data = json.loads(user_data_str)
-                    if user_data.get("user_id") == user_id:
-                        email = user_data.get("email")
-                        if email:
-                            # Cache for future use
-                            self.redis_client.setex(
-                                f"user:email:{user_id}", 3600, email
-                            )
-                            return email
-                except:
-                    continue
-
             # If we can't find the user email, return None
             logger.warning(f"⚠️ Could not find email for user_id: {user_id}")
             return None
@@ -469,6 +498,9 @@ class NotificationService:
             event_type = event.get("event", "")
 
             if event_type == "order_created":
+                if not self.claim_notification(event):
+                    return
+
                 # Get user ID and find their email
                 user_id = event.get("user_id")
                 user_email = None
@@ -486,23 +518,12 @@ class NotificationService:
                     order_data["user_email"] = user_email
 
                     template_data = self.templates.order_confirmation(order_data)
-                    success = self.email_service.send_email(
-                        to_email=user_email,
-                        subject=template_data["subject"],
-                        html_body=template_data["html"],
-                        text_body=template_data["text"],
+                    self.enqueue_email(
+                        "order_confirmation",
+                        user_email,
+                        template_data,
+                        self.notification_key(event),
                     )
-
-                    self.log_notification("order_confirmation", success, user_email)
-
-                    if success:
-                        logger.info(
-                            f"✅ Order confirmation sent to {user_email} for order {event.get('order_id')}"
-                        )
-                    else:
-                        logger.error(
-                            f"❌ Failed to send order confirmation to {user_email}"
-                        )
                 else:
                     logger.warning(
                         f"⚠️ No email found for user_id {user_id} - cannot send order confirmation"
@@ -510,6 +531,7 @@ class NotificationService:
 
         except Exception as e:
             logger.error(f"❌ Error processing order event: {e}")
+            raise
 
     def process_user_event(self, event: Dict[str, Any]):
         """Process user-related events"""
@@ -521,41 +543,25 @@ class NotificationService:
                 user_id = event.get("user_id")
 
                 if email:
-                    # Cache user email for future order notifications
+                    # Remember the email for future order notifications
                     if user_id:
-                        self.redis_client.setex(
-                            f"user:email:{user_id}", 86400, email
-                        )  # Cache for 24 hours
-
-                    # Store in recent registrations for lookup
-                    user_data = {
-                        "user_id": user_id,
-                        "email": email,
-                        "timestamp": datetime.now().isoformat(),
-                    }
-                    self.redis_client.lpush(
-                        "users:recent_registrations", json.dumps(user_data)
-                    )
-                    self.redis_client.ltrim(
-                        "users:recent_registrations", 0, 100
-                    )  # Keep last 100
+                        self.directory.remember(user_id, email)
+
+                    if not self.claim_notification(event):
+                        return
 
                     # Send welcome email
                     template_data = self.templates.welcome_user(event)
-                    success = self.email_service.send_email(
-                        to_email=email,
-                        subject=template_data["subject"],
-                        html_body=template_data["html"],
-                        text_body=template_data["text"],
+                    self.enqueue_email(
+                        "welcome_email",
+                        email,
+                        template_data,
+                        self.notification_key(event),
                     )
 
-                    self.log_notification("welcome_email", success, email)
-
-                    if success:
-                        logger.info(f"✅ Welcome email sent to {email}")
-
         except Exception as e:
             logger.error(f"❌ Error processing user event: {e}")
+            raise
 
 
     def process_product_event(self, event: Dict[str, Any]):
@@ -563,55 +569,32 @@ class NotificationService:
         try:
             event_type = event.get("event", "")
 
-            # Handle both manual product updates and automatic low stock detection
-            if event_type in ["product_updated", "low_stock_detected"]:
+            # The backend sends low_stock_detected only when stock crosses a
+            # product's threshold (or sells out); product_updated carries no
+            # threshold, so alerting on it would bypass that edge trigger
+            if event_type == "low_stock_detected":
                 stock = event.get("stock", 0)
                 threshold = event.get("threshold", 5)
-
-                # Send alert if stock is at or below threshold
-                if stock <= threshold:
-                    product_name = event.get("name", "Unknown Product")
-
-                    # Enhanced alert data
-                    alert_data = {
-                        "product_id": event.get("product_id", "N/A"),
-                        "name": product_name,
-                        "stock": stock,
-                        "threshold": threshold,
-                        "event_type": event_type,
-                        "description": event.get("description", ""),
-                        "price": event.get("price", 0),
-                        "timestamp": event.get("timestamp", datetime.now().isoformat()),
-                    }
-
-                    template_data = self.templates.low_stock_alert(alert_data)
-                    success = self.email_service.send_email(
-                        to_email=ADMIN_EMAIL,
-                        subject=template_data["subject"],
-                        html_body=template_data["html"],
-                        text_body=template_data["text"],
-                    )
-
-                    alert_type = (
-                        "auto_low_stock_alert"
-                        if event_type == "low_stock_detected"
-                        else "manual_low_stock_alert"
+                product_name = event.get("name", "Unknown Product")
+
+                # Enhanced alert data
+                alert_data = {
+                    "product_id": event.get("product_id", "N/A"),
+                    "name": product_name,
+                    "stock": stock,
+                    "threshold": threshold,
+                    "event_type": event_type,
+                    "description": event.get("description", ""),
+                    "price": event.get("price", 0),
+                    "timestamp": event.get("timestamp", datetime.now().isoformat()),
+                }
+
+                if self.low_stock.record(alert_data):
+                    logger.info(
+                        f"📝 Low stock alert for {product_name} queued for digest"
                     )
-                    self.log_notification(alert_type, success, ADMIN_EMAIL)
-
-                    if success:
-                        trigger = (
-                            "after order"
-                            if event_type == "low_stock_detected"
-                            else "manual update"
-                        )
-                        logger.info(
-                            f"✅ Low stock alert sent to {ADMIN_EMAIL} for {product_name} ({trigger})"
-                        )
-                    else:
-                        logger.error(
-                            f"❌ Failed to send low stock alert for {product_name}"
-                        )
+                else:
+                    logger.info(f"🔕 Low stock alert for {product_name} in cooldown")
 
             elif event_type == "products_viewed":
                 products_count = event.get("products_count", 0)
@@ -622,6 +605,7 @@ class NotificationService:
 
         except Exception as e:
             logger.error(f"❌ Error processing product event: {e}")
+            raise
 
     def get_metrics_summary(self) -> Dict[str, Any]:
         """Get notification metrics"""
@@ -651,6 +635,14 @@ class NotificationService:
                 "email_service_enabled": self.email_service.enabled,
                 "admin_email": ADMIN_EMAIL,
                 "from_email": FROM_EMAIL,
+                "dedupe": self.dedupe.get_stats(),
+                "dead_letters": self.dlq.get_stats(),
+                "smtp_pool": self.email_service.pool.get_stats(),
+                "send_queue": self.outbox.get_stats(),
+                "user_directory": self.directory.get_stats(),
+                "low_stock_digest": self.low_stock.get_stats(),
+                "idempotency": self.guard.get_stats(),
+                "campaigns": self.campaigns.get_stats(),
             }
 
         except Exception as e:
@@ -662,12 +654,194 @@ class NotificationService:
 notification_service = NotificationService()
 
 
+def route_event(topic: str, event: Dict[str, Any]):
+    """Dispatch a decoded event to its notification handler; errors propagate"""
+    event_type = event.get("event", "unknown")
+    logger.info(f"📧 Processing notification for: {topic} -> {event_type}")
+
+    # Route events
+    if any(word in topic.lower() for word in ["order"]) or any(
+        word in event_type.lower() for word in ["order", "checkout"]
+    ):
+        notification_service.process_order_event(event)
+    elif any(word in topic.lower() for word in ["user"]) or any(
+        word in event_type.lower() for word in ["user", "register"]
+    ):
+        notification_service.process_user_event(event)
+    elif any(word in topic.lower() for word in ["product"]) or any(
+        word in event_type.lower() for word in ["product"]
+    ):
+        notification_service.process_product_event(event)
+
+    # Log event processed
+    notification_service.redis_client.hincrby(
+        notification_service.metrics_keys["events_processed"],
+        f"{topic}:{event_type}",
+        1,
+    )
+
+
+def handle_message(message) -> bool:
+    """Handle one Kafka message, never raising.
+
+    Returns False if the message failed and was sent to the dead-letter topic.
+    """
+    try:
+        event = message.value
+        if isinstance(event, UndecodableMessage):
+            instrumentation.observe_failure(message.topic)
+            notification_service.dlq.publish(message, ValueError(event.error))
+            return False
+        if not event or not isinstance(event, dict):
+            return True
+        started = time.perf_counter()
+        try:
+            route_event(message.topic, event)
+        except Exception:
+            instrumentation.observe_event(
+                message.topic, event, time.perf_counter() - started, False, message
+            )
+            raise
+        instrumentation.observe_event(
+            message.topic, event, time.perf_counter() - started, True, message
+        )
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Error processing message: {e}")
+        try:
+            notification_service.dlq.publish(message, e)
+        except Exception as dlq_error:
+            logger.error(f"❌ Could not dead-letter message: {dlq_error}")
+        return False
+
+
+def prefetch_user_emails(messages):
+    """Resolve the batch's order customers in one directory lookup"""
+    user_ids = [
+        m.value.get("user_id")
+        for m in messages
+        if isinstance(m.value, dict)
+        and m.value.get("event") == "order_created"
+        and not (m.value.get("customer_email") or m.value.get("user_email"))
+    ]
+    if not user_ids:
+        return
+    try:
+        notification_service.directory.get_many(user_ids)
+    except Exception as e:
+        logger.error(f"❌ Could not prefetch user emails: {e}")
+
+
+def claim_notifications(messages):
+    """Claim the batch's order confirmations and welcome emails in one round trip"""
+    keys = [
+        notification_service.notification_key(m.value)
+        for m in messages
+        if isinstance(m.value, dict)
+    ]
+    notification_service.guard.claim_many(k for k in keys if k)
+
+
+def process_batch(messages):
+    """Handle a polled batch, skipping events that were already handled.
+
+    Ids are checked in one Redis round trip and marked in one more once the
+    batch is done, before its offsets are committed; a crash can at most
+    replay the current batch. The emails' idempotency keys are claimed and
+    committed with one round trip each as well.
+    """
+    dedupe = notification_service.dedupe
+    event_ids = [
+        event_identity(m.value, m.topic, m.partition, m.offset) for m in messages
+    ]
+    seen = dedupe.seen(event_ids)
+    prefetch_user_emails(messages)
+    claim_notifications([m for m, s in zip(messages, seen) if not s])
+    handled = set()
+    flushed = False
+    try:
+        for message, event_id, duplicate in zip(messages, event_ids, seen):
+            if duplicate or event_id in handled:
+                instrumentation.observe_duplicates(message.topic)
+                logger.info(f"♻️ Skipping duplicate event {event_id}")
+                continue
+            if handle_message(message):
+                handled.add(event_id)
+        # Emails must be queued before their events count as handled
+        flushed = notification_service.outbox.flush()
+    finally:
+        notification_service.guard.commit(flushed)
+    if not flushed:
+        raise RuntimeError("Send queue unavailable")
+    try:
+        dedupe.mark(handled)
+    except Exception as e:
+        logger.error(f"❌ Could not record handled events: {e}")
+
+
+def replay_envelope(envelope: Dict[str, Any]):
+    flushed = False
+    try:
+        route_event(envelope["source"]["topic"], envelope["event"])
+        flushed = notification_service.outbox.flush()
+    finally:
+        notification_service.guard.commit(flushed)
+    if not flushed:
+        raise RuntimeError("Send queue unavailable")
+
+
+def create_replay_job(rate: float, concurrency: int) -> ReplayJob:
+    return ReplayJob(
+        notification_service.redis_client,
+        "notifications:dlq",
+        notification_service.dlq,
+        notification_service.dedupe,
+        handler=replay_envelope,
+        on_chunk=notification_service.dedupe.mark,
+        rate=rate,
+        concurrency=concurrency,
+        max_attempts=DLQ_MAX_ATTEMPTS,
+    )
+
+
+def replay_dead_letters(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    partitions: Optional[list] = None,
+    rate: float = DLQ_REPLAY_RATE,
+    concurrency: int = DLQ_REPLAY_CONCURRENCY,
+    job: Optional[ReplayJob] = None,
+) -> Dict[str, Any]:
+    """Replay a range of the notification dead-letter topic (used by CLI and API)"""
+    job = job or create_replay_job(rate, concurrency)
+    if not job.acquire():
+        raise RuntimeError("Another dead-letter replay is already running")
+    try:
+        return job.run(
+            read_dead_letters(
+                KAFKA_SERVERS,
+                notification_service.dlq.topic,
+                since=since,
+                until=until,
+                start_offset=start_offset,
+                end_offset=end_offset,
+                partitions=partitions,
+            )
+        )
+    finally:
+        job.release()
+
+
 def kafka_consumer_worker():
     """Background worker to consume Kafka messages"""
     global kafka_consumer
 
     retry_count = 0
     max_retries = 5
+    lag = instrumentation.LagTracker()
 
     while retry_count < max_retries:
         try:
@@ -675,64 +849,38 @@ def kafka_consumer_worker():
                 f"🔄 Starting notification consumer (attempt {retry_count + 1})"
             )
 
+            # Offsets are committed after each batch is handled and recorded
             kafka_consumer = KafkaConsumer(
                 *KAFKA_TOPICS,
                 bootstrap_servers=KAFKA_SERVERS,
                 group_id=CONSUMER_GROUP,
                 value_deserializer=safe_json_deserializer,
                 auto_offset_reset="earliest",
-                enable_auto_commit=True,
-                auto_commit_interval_ms=1000,
+                enable_auto_commit=False,
+                max_poll_records=CONSUMER_BATCH_SIZE,
             )
 
             logger.info("✅ Notification consumer started!")
             retry_count = 0
 
-            for message in kafka_consumer:
-                try:
-                    topic = message.topic
-                    event = message.value
-
-                    if not event or not isinstance(event, dict):
-                        continue
-
-                    event_type = event.get("event", "unknown")
-                    logger.info(
-                        f"📧 Processing notification for: {topic} -> {event_type}"
-                    )
-
-                    # Route events
-                    if any(word in topic.lower() for word in ["order"]) or any(
-                        word in event_type.lower() for word in ["order", "checkout"]
-                    ):
-                        notification_service.process_order_event(event)
-                    elif any(word in topic.lower() for word in ["user"]) or any(
-                        word in event_type.lower() for word in ["user", "register"]
-                    ):
-                        notification_service.process_user_event(event)
-                    elif any(word in topic.lower() for word in ["product"]) or any(
-                        word in event_type.lower() for word in ["product"]
-                    ):
-                        notification_service.process_product_event(event)
-
-                    # Log event processed
-                    notification_service.redis_client.hincrby(
-                        notification_service.metrics_keys["events_processed"],
-                        f"{topic}:{event_type}",
-                        1,
-                    )
-
-                except Exception as e:
-                    logger.error(f"❌ Error processing message: {e}")
+            while True:
+                batches = kafka_consumer.poll(timeout_ms=1000)
+                messages = [m for batch in batches.values() for m in batch]
+                lag.maybe_update(kafka_consumer)
+                if not messages:
                     continue
+                instrumentation.BATCH_SIZE.observe(len(messages))
+                process_batch(messages)
+                # Dead letters must be durable before their offsets are committed
+                if not notification_service.dlq.flush():
+                    raise RuntimeError("Dead-letter topic unavailable")
+                kafka_consumer.commit()
 
         except Exception as e:
             retry_count += 1
             logger.error(f"❌ Consumer error (attempt {retry_count}): {e}")
 
             if retry_count < max_retries:
-                import time
-
                 wait_time = min(2**retry_count, 30)
                 logger.info(f"⏳ Retrying in {wait_time} seconds...")
                 time.sleep(wait_time)
@@ -742,7 +890,8 @@ def kafka_consumer_worker():
         finally:
             if kafka_consumer:
                 try:
-                    kafka_consumer.close()
+                    kafka_consumer.close(autocommit=False)
+                    lag.clear()
                 except:
                     pass
 
@@ -757,6 +906,11 @@ async def lifespan(app: FastAPI):
     logger.info(f"📤 From email: {FROM_EMAIL}")
 
     try:
+        if notification_service.email_service.enabled:
+            notification_service.email_service.pool.start()
+            notification_service.outbox.start()
+            notification_service.low_stock.start()
+            notification_service.campaigns.start()
         consumer_thread = threading.Thread(target=kafka_consumer_worker, daemon=True)
         consumer_thread.start()
         logger.info("✅ Notification Service started")
@@ -767,6 +921,10 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("🛑 Shutting down Notification Service...")
+    notification_service.campaigns.stop()
+    notification_service.low_stock.stop()
+    notification_service.outbox.stop()
+    notification_service.email_service.pool.close()
 
 
 # FastAPI application
@@ -831,6 +989,13 @@ def get_metrics():
     return notification_service.get_metrics_summary()
 
 
+@app.get("/metrics/prometheus")
+def get_prometheus_metrics():
+    """Consumer lag, batch sizes and event latencies in Prometheus text format"""
+    body, content_type = instrumentation.render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.post("/send/test")
 async def send_test_notification(
     background_tasks: BackgroundTasks, email: str = "navusa314@gmail.com"
@@ -864,5 +1029,154 @@ async def send_test_notification(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/dlq/replay", status_code=202)
+def start_dlq_replay(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    partition: Optional[int] = None,
+    rate: float = DLQ_REPLAY_RATE,
+    concurrency: int = DLQ_REPLAY_CONCURRENCY,
+):
+    """Replay a range of dead-lettered events in the background"""
+    global replay_job
+
+    try:
+        bounds = {
+            name: datetime.fromisoformat(value)
+            for name, value in (("since", since), ("until", until))
+            if value
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if rate <= 0 or not 1 <= concurrency <= 32:
+        raise HTTPException(status_code=400, detail="Invalid rate or concurrency")
+
+    job = create_replay_job(rate, concurrency)
+    if not job.acquire():
+        raise HTTPException(status_code=409, detail="A replay is already running")
+    replay_job = job
+
+    def run():
+        try:
+            replay_dead_letters(
+                start_offset=start_offset,
+                end_offset=end_offset,
+                partitions=[partition] if partition is not None else None,
+                job=job,
+                **bounds,
+            )
+        except Exception as e:
+            logger.error(f"❌ Dead-letter replay failed: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
+    return {
+        "job_id": job.job_id,
+        "topic": notification_service.dlq.topic,
+        "state": "starting",
+    }
+
+
+@app.get("/dlq/replay")
+def get_dlq_replay():
+    status = get_replay_status(notification_service.redis_client, "notifications:dlq")
+    if replay_job is not None and replay_job.job_id == status.get("job_id"):
+        status["live"] = dict(replay_job.stats)
+    return status
+
+
+@app.post("/dlq/replay/stop")
+def stop_dlq_replay():
+    if replay_job is None:
+        raise HTTPException(status_code=404, detail="No replay started here")
+    replay_job.stop_event.set()
+    return {"job_id": replay_job.job_id, "state": "stopping"}
+
+
+class CampaignRequest(BaseModel):
+    name: str
+    subject: str
+    template: str = "campaign_announcement"
+    context: Dict[str, Any] = {}
+    source: str = "directory"
+    rate_per_minute: float = CAMPAIGN_RATE_PER_MINUTE
+    start: bool = True
+
+
+def get_campaign_or_404(campaign_id: str) -> Dict[str, Any]:
+    campaign = notification_service.campaigns.get(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+
+@app.post("/campaigns", status_code=202)
+def create_campaign(request: CampaignRequest):
+    """Create a bulk campaign to every known user and (by default) start it"""
+    if not notification_service.email_service.enabled:
+        raise HTTPException(status_code=503, detail="Email service disabled")
+    if not request.template.startswith("campaign_"):
+        raise HTTPException(status_code=400, detail="Not a campaign template")
+    if request.rate_per_minute < 0:
+        raise HTTPException(status_code=400, detail="Invalid rate")
+    try:
+        # Fails early on a missing template or a context it cannot render
+        notification_service.templates.campaign(
+            request.template, request.subject, {**request.context, "email": ""}
+        )
+        campaign = notification_service.campaigns.create(
+            request.name,
+            request.subject,
+            request.template,
+            request.context,
+            source=request.source,
+            rate_per_minute=request.rate_per_minute,
+        )
+    except TemplateNotFound as e:
+        raise HTTPException(status_code=400, detail=f"Unknown template: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.start:
+        notification_service.campaigns.launch(campaign["id"])
+    return get_campaign_or_404(campaign["id"])
+
+
+@app.get("/campaigns")
+def list_campaigns(limit: int = 50):
+    return {"campaigns": notification_service.campaigns.list(limit)}
+
+
+@app.get("/campaigns/{campaign_id}")
+def get_campaign(campaign_id: str):
+    return get_campaign_or_404(campaign_id)
+
+
+@app.post("/campaigns/{campaign_id}/pause")
+def pause_campaign(campaign_id: str):
+    campaign = get_campaign_or_404(campaign_id)
+    if not notification_service.campaigns.pause(campaign_id):
+        raise HTTPException(status_code=409, detail=f"Campaign is {campaign['state']}")
+    return get_campaign_or_404(campaign_id)
+
+
+@app.post("/campaigns/{campaign_id}/resume", status_code=202)
+def resume_campaign(campaign_id: str):
+    get_campaign_or_404(campaign_id)
+    if not notification_service.campaigns.launch(campaign_id):
+        raise HTTPException(
+            status_code=409, detail="Campaign is finished or still running"
+        )
+    return get_campaign_or_404(campaign_id)
+
+
+@app.post("/campaigns/{campaign_id}/cancel")
+def cancel_campaign(campaign_id: str):
+    campaign = get_campaign_or_404(campaign_id)
+    if not notification_service.campaigns.cancel(campaign_id):
+        raise HTTPException(status_code=409, detail=f"Campaign is {campaign['state']}")
+    return get_campaign_or_404(campaign_id)
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8003, log_level="info")
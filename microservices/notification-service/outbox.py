@@ -0,0 +1,421 @@
+# microservices/notification-service/outbox.py
+import json
+import logging
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = Gauge(
+    "notification_send_queue_depth",
+    "Emails rendered and waiting in the send queue",
+    multiprocess_mode="max",
+)
+QUEUE_WAIT = Histogram(
+    "notification_send_queue_wait_seconds",
+    "Time from enqueue to the start of the first send attempt",
+    ["type"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+SEND_LATENCY = Histogram(
+    "notification_send_duration_seconds",
+    "Time to hand one email to the SMTP server",
+    ["type", "outcome"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+SEND_OUTCOMES = Counter(
+    "notification_sends_total",
+    "Send attempts by outcome (sent, retried, deferred, failed)",
+    ["type", "outcome"],
+)
+
+
+# Send order, lower first: order confirmations, then admin alerts, then
+# welcome emails, then campaigns. Types not listed go with the admin alerts.
+PRIORITY_NAMES = ("high", "normal", "low", "bulk")
+PRIORITIES = {
+    "order_confirmation": 0,
+    "low_stock_alert": 1,
+    "low_stock_digest": 1,
+    "welcome_email": 2,
+    "campaign": 3,
+}
+DEFAULT_PRIORITY = 1
+
+# KEYS: delayed zset, processing list, ready lists by priority.
+# ARGV: now, max jobs to promote.
+# Moves due jobs from the delay queue to the front of their ready list,
+# then takes the next job of the highest non-empty priority.
+TAKE_SCRIPT = """
+local due = redis.call(
+    'ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2])
+)
+local lowest = #KEYS - 3
+for i = #due, 1, -1 do
+    local ok, job = pcall(cjson.decode, due[i])
+    local priority = ok and tonumber(job['priority']) or lowest
+    priority = math.max(0, math.min(lowest, priority))
+    redis.call('RPUSH', KEYS[3 + priority], due[i])
+    redis.call('ZREM', KEYS[1], due[i])
+end
+for i = 3, #KEYS do
+    local job = redis.call('LMOVE', KEYS[i], KEYS[2], 'RIGHT', 'LEFT')
+    if job then
+        return job
+    end
+end
+return false
+"""
+
+# KEYS: processing list, delayed zset. Hands every job back, due at once.
+RECOVER_SCRIPT = """
+local jobs = redis.call('LRANGE', KEYS[1], 0, -1)
+for _, job in ipairs(jobs) do
+    redis.call('ZADD', KEYS[2], 0, job)
+end
+redis.call('DEL', KEYS[1])
+return #jobs
+"""
+
+
+def email_job(
+    notification_type: str,
+    to_email: str,
+    template_data: Dict[str, str],
+    transport: str = "smtp",
+    idempotency_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    """A rendered email as it is stored in the send queue"""
+    return {
+        "id": uuid.uuid4().hex,
+        "type": notification_type,
+        "priority": PRIORITIES.get(notification_type, DEFAULT_PRIORITY),
+        "transport": transport,
+        "to": to_email,
+        "subject": template_data["subject"],
+        "html": template_data["html"],
+        "text": template_data.get("text"),
+        "enqueued_at": time.time(),
+        "attempts": 0,
+        "idempotency_key": idempotency_key,
+    }
+
+
+class SendQueue:
+    """Durable, bounded, prioritised email send queue in Redis, drained by threads.
+
+    The consumer renders emails and `put`s them; `flush()` writes them to
+    the queue in one round trip and must succeed before the events are
+    marked handled and their offsets committed, so an event is never both
+    committed and unsent. Jobs are buffered per thread, and a failed flush
+    drops them: the caller handles the events again, which renders them
+    again. A slow SMTP server then only grows the queue; once it holds
+    `max_depth` jobs, `flush()` waits for room (up to `block_s`) so the
+    consumer slows down instead of the queue growing without bound.
+
+    Ready jobs are kept in one list per priority (see PRIORITIES) and a
+    sender always takes the oldest job of the highest priority waiting.
+    Jobs that cannot go out yet wait in a sorted set scored by when they
+    are due, and are moved to the front of their list once due: those over
+    their transport's rate limit (`limiters`, e.g. the relay's per-minute
+    quota), which does not use up an attempt, and failed sends, retried
+    after `retry_base_s` doubling per attempt up to `retry_max_s` until
+    they have been attempted `max_attempts` times. `settle`, if given, is
+    called with the job's final outcome and the pipeline that removes it,
+    so its writes commit together with the removal.
+
+    Each sender thread moves a job into its own processing list and removes
+    it once the send finished, so a job survives a crash mid-send.
+    Processing lists belong to a process (a random id per `SendQueue`)
+    whose heartbeat key is refreshed every `lease_s / 3`; lists of
+    processes whose heartbeat expired are handed back to the delay queue,
+    due at once.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        prefix: str,
+        deliver: Callable[[Dict[str, Any]], bool],
+        on_done: Optional[Callable[[Dict[str, Any], bool], None]] = None,
+        workers: int = 4,
+        max_depth: int = 10000,
+        max_attempts: int = 3,
+        block_s: float = 60.0,
+        lease_s: float = 60.0,
+        limiters: Optional[Dict[str, TokenBucket]] = None,
+        retry_base_s: float = 30.0,
+        retry_max_s: float = 900.0,
+        poll_s: float = 0.25,
+        settle: Optional[Callable[[Any, Dict[str, Any], bool], None]] = None,
+    ):
+        self.redis_client = redis_client
+        self.queue_keys = [f"{prefix}:queue:{name}" for name in PRIORITY_NAMES]
+        self.delayed_key = f"{prefix}:delayed"
+        self.processing_prefix = f"{prefix}:processing"
+        self.owner_prefix = f"{prefix}:owner"
+        self.deliver = deliver
+        self.on_done = on_done
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.block_s = block_s
+        self.lease_s = lease_s
+        self.limiters = limiters or {}
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self.poll_s = poll_s
+        self.settle = settle
+        # Unique per process: a restarted container keeps its hostname and pid
+        self.owner = f"{socket.gethostname()}:{uuid.uuid4().hex[:12]}"
+        self._take = redis_client.register_script(TAKE_SCRIPT)
+        self._recover = redis_client.register_script(RECOVER_SCRIPT)
+
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.stats = {
+            "enqueued": 0,
+            "sent": 0,
+            "retried": 0,
+            "deferred": 0,
+            "failed": 0,
+            "recovered": 0,
+            "enqueue_errors": 0,
+            "backpressure_waits": 0,
+        }
+
+    # ----- enqueueing -----
+    def _buffer(self) -> List[Tuple[int, str]]:
+        if not hasattr(self._local, "jobs"):
+            self._local.jobs = []
+        return self._local.jobs
+
+    def put(self, job: Dict[str, Any]):
+        priority = job.get("priority", DEFAULT_PRIORITY)
+        priority = min(max(int(priority), 0), len(self.queue_keys) - 1)
+        self._buffer().append((priority, json.dumps(job)))
+
+    def depths(self) -> Dict[str, int]:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in self.queue_keys:
+            pipe.llen(key)
+        pipe.zcard(self.delayed_key)
+        counts = pipe.execute()
+        return {**dict(zip(PRIORITY_NAMES, counts)), "delayed": counts[-1]}
+
+    def depth(self) -> int:
+        depth = sum(self.depths().values())
+        QUEUE_DEPTH.set(depth)
+        return depth
+
+    def _wait_for_room(self, incoming: int) -> bool:
+        deadline = time.monotonic() + self.block_s
+        while self.depth() + incoming > self.max_depth:
+            if time.monotonic() >= deadline:
+                return False
+            self.stats["backpressure_waits"] += 1
+            time.sleep(0.5)
+        return True
+
+    def flush(self, on_commit: Optional[Callable[[Any], None]] = None) -> bool:
+        """Write this thread's buffered jobs to Redis; False if they were dropped.
+
+        `on_commit` is called with the transaction that stores the jobs, to
+        add writes (e.g. a checkpoint) that must commit with them.
+        """
+        pending, self._local.jobs = self._buffer(), []
+        if not pending and on_commit is None:
+            return True
+        try:
+            # A single oversized batch is let through rather than never fitting
+            if not self._wait_for_room(min(len(pending), self.max_depth)):
+                raise RuntimeError(f"send queue full ({self.max_depth} emails)")
+            # LPUSH + take from the right: oldest first
+            pipe = self.redis_client.pipeline()
+            for priority, raw in pending:
+                pipe.lpush(self.queue_keys[priority], raw)
+            if on_commit:
+                on_commit(pipe)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"❌ Could not enqueue {len(pending)} emails: {e}")
+            self.stats["enqueue_errors"] += len(pending)
+            return False
+        self.stats["enqueued"] += len(pending)
+        QUEUE_DEPTH.inc(len(pending))
+        return True
+
+    # ----- sending -----
+    def _processing_key(self, index: int) -> str:
+        return f"{self.processing_prefix}:{self.owner}:{index}"
+
+    def retry_delay(self, attempts: int) -> float:
+        """Backoff before attempt `attempts + 1`, with jitter so retries spread"""
+        delay = min(self.retry_base_s * 2 ** max(attempts - 1, 0), self.retry_max_s)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _rate_limit(self, job: Dict[str, Any]) -> float:
+        """Seconds until the job's transport may send again; 0 takes a token"""
+        limiter = self.limiters.get(job.get("transport", "smtp"))
+        if limiter is None:
+            return 0.0
+        try:
+            return limiter.take()
+        except Exception as e:
+            # Better to risk the relay's limit than to stop sending
+            logger.error(f"❌ Rate limit check failed: {e}")
+            return 0.0
+
+    def _send(self, job: Dict[str, Any], pipe) -> Optional[float]:
+        """Attempt one job; returns the delay before a retry if it should be retried"""
+        label = job.get("type", "unknown")
+        if not job["attempts"]:
+            QUEUE_WAIT.labels(label).observe(max(time.time() - job["enqueued_at"], 0))
+        job["attempts"] += 1
+        started = time.perf_counter()
+        try:
+            success = bool(self.deliver(job))
+        except Exception as e:
+            logger.error(f"❌ Send of {job['id']} failed: {e}")
+            success = False
+        SEND_LATENCY.labels(label, "sent" if success else "failed").observe(
+            time.perf_counter() - started
+        )
+
+        if not success and job["attempts"] < self.max_attempts:
+            SEND_OUTCOMES.labels(label, "retried").inc()
+            self.stats["retried"] += 1
+            return self.retry_delay(job["attempts"])
+        outcome = "sent" if success else "failed"
+        SEND_OUTCOMES.labels(label, outcome).inc()
+        self.stats[outcome] += 1
+        if self.settle:
+            self.settle(pipe, job, success)
+        if self.on_done:
+            try:
+                self.on_done(job, success)
+            except Exception as e:
+                logger.error(f"❌ Error recording send of {job['id']}: {e}")
+        return None
+
+    def _worker(self, index: int):
+        processing = self._processing_key(index)
+        while not self._stop.is_set():
+            try:
+                raw = self._take(
+                    keys=[self.delayed_key, processing, *self.queue_keys],
+                    args=[time.time(), 100],
+                )
+                if raw is None:
+                    self._stop.wait(self.poll_s)
+                    continue
+                job = json.loads(raw)
+                pipe = self.redis_client.pipeline()
+                wait = self._rate_limit(job)
+                if wait:
+                    # Unchanged, so it still counts as not yet attempted
+                    SEND_OUTCOMES.labels(job.get("type", "unknown"), "deferred").inc()
+                    self.stats["deferred"] += 1
+                    pipe.zadd(self.delayed_key, {raw: time.time() + wait})
+                else:
+                    delay = self._send(job, pipe)
+                    if delay is not None:
+                        due = time.time() + delay
+                        pipe.zadd(self.delayed_key, {json.dumps(job): due})
+                pipe.lrem(processing, 1, raw)
+                pipe.execute()
+                if wait:
+                    # The bucket is empty; don't cycle jobs through the delay queue
+                    self._stop.wait(min(wait, 1.0))
+            except Exception as e:
+                logger.error(f"❌ Send worker {index} error: {e}")
+                self._stop.wait(1.0)
+
+    # ----- ownership and recovery -----
+    def _heartbeat(self):
+        self.redis_client.set(
+            f"{self.owner_prefix}:{self.owner}", "1", ex=max(int(self.lease_s), 1)
+        )
+
+    def recover(self) -> int:
+        """Requeue jobs held by processes whose heartbeat has expired"""
+        recovered = 0
+        for key in self.redis_client.scan_iter(f"{self.processing_prefix}:*"):
+            owner = key[len(self.processing_prefix) + 1 :].rsplit(":", 1)[0]
+            if owner == self.owner or self.redis_client.exists(
+                f"{self.owner_prefix}:{owner}"
+            ):
+                continue
+            # Score 0: recovered jobs are the next of their priority to be sent
+            recovered += self._recover(keys=[key, self.delayed_key])
+        if recovered:
+            logger.info(f"♻️ Requeued {recovered} emails from stopped senders")
+            self.stats["recovered"] += recovered
+        return recovered
+
+    def _monitor(self):
+        while True:
+            try:
+                self._heartbeat()
+                self.recover()
+                self.depth()
+            except Exception as e:
+                logger.error(f"❌ Send queue heartbeat failed: {e}")
+            if self._stop.wait(self.lease_s / 3):
+                break
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._heartbeat()
+        # Lists left by an earlier run of this process are another owner's,
+        # recovered once that run's heartbeat expires
+        self._threads = [
+            threading.Thread(target=self._monitor, name="send-monitor", daemon=True)
+        ] + [
+            threading.Thread(
+                target=self._worker, args=(i,), name=f"send-worker-{i}", daemon=True
+            )
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"✅ Send queue started with {self.workers} workers")
+
+    def stop(self, timeout: float = 10.0):
+        """Let in-flight sends finish; queued jobs stay in Redis"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        try:
+            self.redis_client.delete(f"{self.owner_prefix}:{self.owner}")
+        except Exception:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        try:
+            depths = self.depths()
+        except Exception:
+            depths = None
+        return {
+            **self.stats,
+            "depth": sum(depths.values()) if depths is not None else None,
+            "depths": depths,
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "rate_limits": {
+                transport: limiter.get_stats()
+                for transport, limiter in self.limiters.items()
+            },
+        }
@@ -0,0 +1,62 @@
+# microservices/notification-service/ratelimit.py
+import logging
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] bucket hash; ARGV rate (tokens/s), burst, cost.
+# Returns "0" when the tokens were taken, else the seconds until they would
+# be (as a string: Lua numbers are truncated to integers in replies).
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """Send rate limit for one transport, shared by every replica.
+
+    The bucket holds up to `burst` tokens and refills at `per_minute` per
+    minute; state is one Redis hash updated by a Lua script with the Redis
+    server's clock, so replicas draw from the same bucket. A `per_minute`
+    of 0 disables the limit.
+    """
+
+    def __init__(self, redis_client, key: str, per_minute: float, burst: int = 1):
+        self.redis_client = redis_client
+        self.key = key
+        self.per_minute = per_minute
+        self.burst = max(burst, 1)
+        self._take = redis_client.register_script(TAKE_SCRIPT)
+        self.stats = {"granted": 0, "limited": 0}
+
+    def take(self, cost: int = 1) -> float:
+        """Take `cost` tokens; 0.0 if granted, else seconds until they would be"""
+        if self.per_minute <= 0:
+            return 0.0
+        wait = float(
+            self._take(
+                keys=[self.key], args=[self.per_minute / 60.0, self.burst, cost]
+            )
+        )
+        self.stats["granted" if wait == 0 else "limited"] += 1
+        return wait
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "per_minute": self.per_minute, "burst": self.burst}
@@ -0,0 +1,36 @@
+# microservices/notification-service/rendering.py
+import os
+from typing import Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+
+def create_environment(
+    template_dir: str = TEMPLATE_DIR,
+    auto_reload: bool = False,
+    bytecode_cache_dir: Optional[str] = None,
+    cache_size: int = 100,
+) -> Environment:
+    """Jinja environment for the email templates.
+
+    Templates are compiled once and kept in the environment's cache; with
+    `auto_reload` (development) every lookup checks the file's mtime and
+    recompiles edited templates. Compiled bytecode is also written to
+    `bytecode_cache_dir` (the system temp directory if empty, "off" to
+    disable), so a restarted process skips parsing and compiling.
+    """
+    bytecode_cache = None
+    if bytecode_cache_dir != "off":
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir or None)
+    return Environment(
+        loader=FileSystemLoader(template_dir),
+        bytecode_cache=bytecode_cache,
+        auto_reload=auto_reload,
+        cache_size=cache_size,
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
@@ -0,0 +1,234 @@
+# microservices/notification-service/smtp_pool.py
+import logging
+import smtplib
+import ssl
+import threading
+import time
+from email.message import Message
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# The server rejected the message; the session stays usable unless the reply
+# was 421, on which smtplib closes it
+MESSAGE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+
+class SMTPSession:
+    """One authenticated SMTP connection and its bookkeeping"""
+
+    def __init__(self, client: smtplib.SMTP):
+        self.client = client
+        self.last_sent = time.monotonic()
+        self.last_used = self.last_sent  # including NOOPs
+        self.messages = 0
+
+
+class SMTPConnectionPool:
+    """Pool of persistent, authenticated SMTP sessions.
+
+    Opening a session costs a TCP connect, EHLO, STARTTLS (a TLS handshake
+    and a second EHLO) and AUTH, several round trips before the first
+    message. Sessions are kept open and handed out to one sender at a time:
+      * the keepalive thread NOOPs sessions quiet for `keepalive_s` so the
+        server does not time them out (most do after 5-10 minutes), and a
+        session quiet for that long is probed again before reuse;
+      * sessions that sent nothing for `max_idle_s` are closed;
+      * a session is retired with QUIT after `max_messages` messages, as
+        many providers cap messages per connection;
+      * a session that fails is discarded. A send is retried once on a fresh
+        session if a reused one turns out to be disconnected (a server drops
+        an idle session before reading the next MAIL command) or the server
+        answered 421 (closing, e.g. at its per-connection cap). Neither
+        accepts the message; only a timeout waiting for the reply to DATA
+        looks the same and could deliver it twice.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str = "",
+        password: str = "",
+        size: int = 4,
+        max_messages: int = 100,
+        keepalive_s: float = 30.0,
+        max_idle_s: float = 240.0,
+        timeout: float = 30.0,
+        starttls: bool = True,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.max_messages = max_messages
+        self.keepalive_s = keepalive_s
+        self.max_idle_s = max_idle_s
+        self.timeout = timeout
+        self.starttls = starttls
+        # Built once: loading the CA bundle is a large share of a handshake
+        self.ssl_context = ssl.create_default_context() if starttls else None
+
+        self._idle: List[SMTPSession] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._keepalive_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {
+            "opened": 0,
+            "reused": 0,
+            "retired": 0,
+            "discarded": 0,
+            "reconnects": 0,
+            "noops": 0,
+            "sent": 0,
+            "send_errors": 0,
+        }
+
+    # ----- sessions -----
+    def _open(self) -> SMTPSession:
+        client = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                client.starttls(context=self.ssl_context)
+            if self.username:
+                client.login(self.username, self.password)
+        except BaseException:
+            self._close(client, quit=False)
+            raise
+        self.stats["opened"] += 1
+        return SMTPSession(client)
+
+    @staticmethod
+    def _close(client: smtplib.SMTP, quit: bool = True):
+        try:
+            if quit:
+                client.quit()
+            else:
+                client.close()
+        except Exception:
+            client.close()
+
+    def _alive(self, session: SMTPSession) -> bool:
+        try:
+            code, _ = session.client.noop()
+        except OSError:
+            return False
+        self.stats["noops"] += 1
+        session.last_used = time.monotonic()
+        return code == 250
+
+    def _checkout(self) -> SMTPSession:
+        while True:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                return self._open()
+            now = time.monotonic()
+            if now - session.last_sent > self.max_idle_s:
+                self._retire(session)
+            elif now - session.last_used > self.keepalive_s and not self._alive(
+                session
+            ):
+                self._discard(session)
+            else:
+                self.stats["reused"] += 1
+                return session
+
+    def _checkin(self, session: SMTPSession):
+        if session.messages >= self.max_messages or self._stop.is_set():
+            self._retire(session)
+            return
+        with self._lock:
+            self._idle.append(session)
+
+    def _retire(self, session: SMTPSession):
+        self.stats["retired"] += 1
+        self._close(session.client)
+
+    def _discard(self, session: SMTPSession):
+        self.stats["discarded"] += 1
+        self._close(session.client, quit=False)
+
+    # ----- sending -----
+    def send_message(self, msg: Message) -> Dict[str, Any]:
+        """Send one message; returns the refused recipients, like smtplib"""
+        for attempt in range(2):
+            with self._slots:
+                # Other idle sessions are probably as stale as the one that failed
+                session = self._checkout() if attempt == 0 else self._open()
+                reused = session.messages > 0
+                try:
+                    refused = session.client.send_message(msg)
+                except OSError as e:
+                    # smtplib closes the socket on disconnects and 421 replies
+                    closed = session.client.sock is None
+                    rejected = isinstance(e, MESSAGE_ERRORS)
+                    if rejected and not closed:
+                        self._checkin(session)
+                    else:
+                        self._discard(session)
+                        if attempt == 0 and closed and (reused or rejected):
+                            self.stats["reconnects"] += 1
+                            continue
+                    self.stats["send_errors"] += 1
+                    raise
+                except Exception:
+                    # e.g. UnicodeEncodeError on a bad address or header; the
+                    # session may be mid-transaction, so it is not reused
+                    self._discard(session)
+                    self.stats["send_errors"] += 1
+                    raise
+                session.messages += 1
+                session.last_sent = session.last_used = time.monotonic()
+                self.stats["sent"] += 1
+                self._checkin(session)
+                return refused
+
+    # ----- keepalive -----
+    def keepalive(self):
+        """NOOP sessions quiet past keepalive_s; close those unused past max_idle_s"""
+        now = time.monotonic()
+        with self._lock:
+            due = [s for s in self._idle if now - s.last_used > self.keepalive_s]
+            self._idle = [s for s in self._idle if s not in due]
+        for session in due:
+            if now - session.last_sent > self.max_idle_s:
+                self._retire(session)
+            elif self._alive(session):
+                with self._lock:
+                    self._idle.append(session)
+            else:
+                self._discard(session)
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(max(self.keepalive_s / 2, 1.0)):
+            try:
+                self.keepalive()
+            except Exception as e:
+                logger.error(f"❌ SMTP keepalive failed: {e}")
+
+    def start(self):
+        if self._keepalive_thread is None:
+            self._keepalive_thread = threading.Thread(
+                target=self._keepalive_loop, name="smtp-keepalive", daemon=True
+            )
+            self._keepalive_thread.start()
+
+    def close(self):
+        """Stop the keepalive thread and QUIT idle sessions (busy ones on return)"""
+        self._stop.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            self._retire(session)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            idle = len(self._idle)
+        return {**self.stats, "idle": idle, "size": self.size}
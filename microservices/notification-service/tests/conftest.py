@@ -0,0 +1,45 @@
+# microservices/notification-service/tests/conftest.py
+import importlib
+import os
+import sys
+import time
+from unittest import mock
+
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def redis_client():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    yield client
+    client.flushall()
+
+
+@pytest.fixture
+def service():
+    """The service's NotificationService, on fakeredis, with email disabled"""
+    server = fakeredis.FakeServer()
+
+    def from_url(url, **kwargs):
+        return fakeredis.FakeRedis(
+            server=server, decode_responses=kwargs.get("decode_responses", False)
+        )
+
+    with mock.patch.dict(os.environ, {"SMTP_USERNAME": "", "BACKEND_URL": ""}):
+        with mock.patch("redis.from_url", from_url):
+            main = importlib.import_module("main")
+            main.notification_service = main.NotificationService()
+    yield main.notification_service
+    main.notification_service.redis_client.flushall()
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,171 @@
+# microservices/notification-service/tests/test_campaigns.py
+import json
+
+import pytest
+
+from campaigns import CampaignSender
+from conftest import wait_for
+from outbox import SendQueue
+
+
+class FakeDirectory:
+    """Backend users paged by id; `on_page` runs before each page is yielded"""
+
+    key = "test:users:emails"
+
+    def __init__(self, count: int):
+        self.users = {str(i): f"user{i}@example.com" for i in range(1, count + 1)}
+        self.requests = []
+        self.on_page = None
+
+    def pages(self, after_id=0, page_size=5000):
+        self.requests.append(after_id)
+        ids = [i for i in map(int, self.users) if i > after_id]
+        while ids:
+            page, ids = ids[:page_size], ids[page_size:]
+            if self.on_page:
+                self.on_page()
+            yield {str(i): self.users[str(i)] for i in page}, page[-1] if ids else None
+
+
+def render(template, subject, context):
+    return {"subject": subject, "html": context["email"], "text": ""}
+
+
+@pytest.fixture
+def outbox(redis_client):
+    return SendQueue(redis_client, "test:outbox", bool)
+
+
+@pytest.fixture
+def directory():
+    return FakeDirectory(5)
+
+
+@pytest.fixture
+def sender(redis_client, outbox, directory):
+    sender = CampaignSender(
+        redis_client, "test:campaigns", outbox, directory, render, chunk_size=2
+    )
+    yield sender
+    sender.stop()
+
+
+def create(sender):
+    campaign = sender.create(
+        "Sale", "Big sale", "campaign_announcement", {}, source="backend"
+    )
+    return campaign["id"]
+
+
+def run(sender, campaign_id):
+    assert sender.launch(campaign_id)
+    assert wait_for(lambda: not sender.get_stats()["running_here"])
+    return sender.get(campaign_id)
+
+
+def queued_emails(redis_client, outbox):
+    bulk = redis_client.lrange(outbox.queue_keys[3], 0, -1)
+    return sorted(json.loads(raw)["to"] for raw in bulk)
+
+
+def test_campaign_queues_every_recipient_in_chunks(
+    sender, directory, redis_client, outbox
+):
+    campaign = run(sender, create(sender))
+    assert campaign["state"] == "done"
+    assert campaign["queued"] == 5
+    assert campaign["cursor"] == ""
+    assert campaign["running_on"] is None
+    assert queued_emails(redis_client, outbox) == sorted(directory.users.values())
+
+
+def test_paused_campaign_resumes_after_the_last_checkpoint(
+    sender, directory, redis_client, outbox
+):
+    campaign_id = create(sender)
+    pages = []
+
+    def pause_after_first_chunk():
+        pages.append(1)
+        if len(pages) == 2:
+            sender.pause(campaign_id)
+
+    directory.on_page = pause_after_first_chunk
+    campaign = run(sender, campaign_id)
+    assert campaign["state"] == "paused"
+    assert campaign["queued"] == 2
+    assert campaign["cursor"] == "2"
+
+    directory.on_page = None
+    campaign = run(sender, campaign_id)
+    assert campaign["state"] == "done"
+    assert campaign["queued"] == 5
+    assert directory.requests == [0, 2]
+    assert queued_emails(redis_client, outbox) == sorted(directory.users.values())
+
+
+def test_restarted_process_resumes_interrupted_campaign(
+    sender, directory, redis_client, outbox
+):
+    """A restarted container keeps its hostname and pid but not its owner id"""
+    campaign_id = create(sender)
+    # The previous run queued the first chunk, then the process died
+    redis_client.hset(
+        sender.key(campaign_id), mapping={"state": "running", "cursor": 2}
+    )
+    redis_client.set(sender.lock_key(campaign_id), "web-1:dead", ex=60)
+
+    assert not sender._refresh_lock(campaign_id)
+    assert sender.resume_interrupted() == 0
+    # The dead run's lock expires
+    redis_client.delete(sender.lock_key(campaign_id))
+    assert sender.resume_interrupted() == 1
+    assert wait_for(lambda: sender.get(campaign_id)["state"] == "done")
+    assert directory.requests == [2]
+    assert queued_emails(redis_client, outbox) == [
+        f"user{i}@example.com" for i in (3, 4, 5)
+    ]
+
+
+def test_each_sender_has_its_own_owner(redis_client, outbox, directory):
+    first = CampaignSender(redis_client, "test:campaigns", outbox, directory, render)
+    second = CampaignSender(redis_client, "test:campaigns", outbox, directory, render)
+    assert first.owner != second.owner
+
+
+def test_cancelled_campaign_cannot_be_launched(sender, redis_client, outbox):
+    campaign_id = create(sender)
+    assert sender.cancel(campaign_id)
+    assert not sender.launch(campaign_id)
+    assert not sender.pause(campaign_id)
+    assert sender.get(campaign_id)["state"] == "cancelled"
+    assert outbox.depth() == 0
+
+
+def test_finished_campaign_cannot_be_paused_or_cancelled(sender):
+    campaign_id = create(sender)
+    run(sender, campaign_id)
+    assert not sender.pause(campaign_id)
+    assert not sender.cancel(campaign_id)
+    assert not sender.launch(campaign_id)
+
+
+def test_unknown_campaign(sender):
+    assert sender.get("missing") is None
+    with pytest.raises(KeyError):
+        sender.pause("missing")
+    with pytest.raises(KeyError):
+        sender.launch("missing")
+
+
+def test_settle_counts_outcomes(sender, redis_client):
+    campaign_id = create(sender)
+    pipe = redis_client.pipeline()
+    sender.settle(pipe, {"campaign_id": campaign_id}, True)
+    sender.settle(pipe, {"campaign_id": campaign_id}, True)
+    sender.settle(pipe, {"campaign_id": campaign_id}, False)
+    sender.settle(pipe, {"type": "order_confirmation"}, True)
+    pipe.execute()
+    campaign = sender.get(campaign_id)
+    assert (campaign["sent"], campaign["failed"]) == (2, 1)
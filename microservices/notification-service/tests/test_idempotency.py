@@ -0,0 +1,101 @@
+# microservices/notification-service/tests/test_idempotency.py
+import pytest
+
+from idempotency import NotificationGuard
+
+KEY = "notif:order_confirmation:o1"
+
+
+class BrokenPipeline:
+    def set(self, *args, **kwargs):
+        pass
+
+    def execute(self):
+        raise ConnectionError("redis down")
+
+
+class BrokenRedis:
+    """Commands fail like they do with the server down"""
+
+    def set(self, *args, **kwargs):
+        raise ConnectionError("redis down")
+
+    def pipeline(self, transaction=True):
+        return BrokenPipeline()
+
+
+@pytest.fixture
+def guard(redis_client):
+    return NotificationGuard(redis_client, "notif", claim_ttl_s=300, sent_ttl_s=3600)
+
+
+def test_key_names_the_notification(guard):
+    assert guard.key("order_confirmation", "o1") == KEY
+
+
+def test_second_claim_is_a_duplicate(guard, redis_client):
+    assert guard.claim(KEY)
+    other = NotificationGuard(redis_client, "notif")
+    assert not other.claim(KEY)
+    assert guard.stats["claimed"] == 1 and other.stats["duplicates"] == 1
+    assert 0 < redis_client.ttl(KEY) <= 300
+
+
+def test_claim_answers_from_claim_many(guard, redis_client):
+    redis_client.set("notif:welcome_email:2", "sent")
+    guard.claim_many([KEY, "notif:welcome_email:2", KEY])
+    redis_client.delete(KEY)  # claim must not ask Redis again
+    assert guard.claim(KEY)
+    assert not guard.claim("notif:welcome_email:2")
+
+
+def test_claim_fails_open_without_redis():
+    guard = NotificationGuard(BrokenRedis(), "notif")
+    guard.claim_many([KEY])
+    assert guard.claim(KEY)
+    assert guard.stats["claim_errors"] == 2
+
+
+def test_commit_keeps_queued_claims_and_releases_the_rest(guard, redis_client):
+    unsent = "notif:order_confirmation:o2"
+    guard.claim_many([KEY, unsent])
+    assert guard.claim(KEY) and guard.claim(unsent)
+    guard.mark_queued(KEY)
+
+    guard.commit(flushed=True)
+    assert redis_client.get(KEY) == "claimed"
+    assert redis_client.ttl(KEY) > 300
+    assert redis_client.get(unsent) is None
+    assert guard.stats["released"] == 1
+
+
+def test_commit_after_failed_flush_releases_everything(guard, redis_client):
+    assert guard.claim(KEY)
+    guard.mark_queued(KEY)
+    guard.commit(flushed=False)
+    assert redis_client.get(KEY) is None
+    # The next batch starts clean
+    assert guard.claim(KEY)
+
+
+def test_commit_does_not_overwrite_a_settled_key(guard, redis_client):
+    assert guard.claim(KEY)
+    guard.mark_queued(KEY)
+    # A sender finished the email before the consumer committed
+    redis_client.set(KEY, "sent")
+    guard.commit(flushed=True)
+    assert redis_client.get(KEY) == "sent"
+
+
+def test_settle_marks_sent_or_releases(guard, redis_client):
+    failed = "notif:order_confirmation:o2"
+    redis_client.set(KEY, "claimed")
+    redis_client.set(failed, "claimed")
+    pipe = redis_client.pipeline()
+    guard.settle(pipe, {"idempotency_key": KEY}, True)
+    guard.settle(pipe, {"idempotency_key": failed}, False)
+    guard.settle(pipe, {"idempotency_key": None}, True)
+    pipe.execute()
+    assert redis_client.get(KEY) == "sent"
+    assert 300 < redis_client.ttl(KEY) <= 3600
+    assert redis_client.get(failed) is None
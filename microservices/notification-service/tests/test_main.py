@@ -0,0 +1,26 @@
+# microservices/notification-service/tests/test_main.py
+
+
+def low_stock_pending(service):
+    return service.redis_client.hlen(service.low_stock.pending_key)
+
+
+def test_low_stock_detected_queues_an_alert(service):
+    service.process_product_event(
+        {
+            "event": "low_stock_detected",
+            "product_id": "7",
+            "name": "Widget",
+            "stock": 4,
+            "threshold": 5,
+        }
+    )
+    assert low_stock_pending(service) == 1
+
+
+def test_product_update_below_threshold_sends_nothing(service):
+    """The backend decides when stock crosses a threshold; edits never alert"""
+    service.process_product_event(
+        {"event": "product_updated", "product_id": "7", "name": "Widget", "stock": 2}
+    )
+    assert low_stock_pending(service) == 0
@@ -0,0 +1,190 @@
+# microservices/notification-service/tests/test_outbox.py
+import json
+
+import pytest
+
+from conftest import wait_for
+from outbox import SendQueue, email_job
+
+TEMPLATE = {"subject": "Hello", "html": "<p>Hello</p>", "text": "Hello"}
+
+
+class FixedLimiter:
+    """Stands in for a TokenBucket: the first `limited` takes must wait"""
+
+    def __init__(self, limited: int, wait: float = 60.0):
+        self.limited = limited
+        self.wait = wait
+
+    def take(self) -> float:
+        if self.limited:
+            self.limited -= 1
+            return self.wait
+        return 0.0
+
+    def get_stats(self):
+        return {}
+
+
+def make_queue(redis_client, deliver, **kwargs):
+    kwargs = {"workers": 1, "poll_s": 0.01, "retry_base_s": 0.01, **kwargs}
+    return SendQueue(redis_client, "test:outbox", deliver, **kwargs)
+
+
+@pytest.fixture
+def delivered():
+    return []
+
+
+def test_flush_stores_buffered_jobs_by_priority(redis_client, delivered):
+    queue = make_queue(redis_client, delivered.append)
+    queue.put(email_job("welcome_email", "a@example.com", TEMPLATE))
+    queue.put(email_job("order_confirmation", "b@example.com", TEMPLATE))
+    queue.put(email_job("campaign", "c@example.com", TEMPLATE))
+    assert queue.depth() == 0
+
+    assert queue.flush()
+    assert queue.depths() == {"high": 1, "normal": 0, "low": 1, "bulk": 1, "delayed": 0}
+    assert queue.stats["enqueued"] == 3
+    # The buffer was emptied by the flush
+    assert queue.flush() and queue.depth() == 3
+
+
+def test_flush_commits_on_commit_writes_with_the_jobs(redis_client, delivered):
+    queue = make_queue(redis_client, delivered.append)
+    queue.put(email_job("campaign", "a@example.com", TEMPLATE))
+    assert queue.flush(on_commit=lambda pipe: pipe.set("test:checkpoint", "1"))
+    assert redis_client.get("test:checkpoint") == "1"
+    assert queue.depth() == 1
+
+
+def test_flush_drops_jobs_when_the_queue_stays_full(redis_client, delivered):
+    queue = make_queue(redis_client, delivered.append, max_depth=1, block_s=0)
+    queue.put(email_job("welcome_email", "a@example.com", TEMPLATE))
+    assert queue.flush()
+    queue.put(email_job("welcome_email", "b@example.com", TEMPLATE))
+    assert not queue.flush()
+    assert queue.stats["enqueue_errors"] == 1
+    assert queue.depth() == 1
+
+
+def test_workers_take_the_highest_priority_first(redis_client, delivered):
+    queue = make_queue(redis_client, lambda job: delivered.append(job["type"]) or True)
+    for notification_type in ("campaign", "welcome_email", "order_confirmation"):
+        queue.put(email_job(notification_type, "a@example.com", TEMPLATE))
+    assert queue.flush()
+
+    queue.start()
+    try:
+        assert wait_for(lambda: queue.stats["sent"] == 3)
+    finally:
+        queue.stop()
+    assert delivered == ["order_confirmation", "welcome_email", "campaign"]
+    assert queue.depth() == 0
+    assert redis_client.keys("test:outbox:processing:*") == []
+
+
+def test_failed_send_is_retried_then_settled(redis_client):
+    outcomes, settled = [], []
+    attempts = []
+
+    def deliver(job):
+        attempts.append(job["attempts"])
+        return len(attempts) > 1
+
+    queue = make_queue(
+        redis_client,
+        deliver,
+        on_done=lambda job, success: outcomes.append(success),
+        settle=lambda pipe, job, success: settled.append((job["to"], success)),
+    )
+    queue.put(email_job("order_confirmation", "a@example.com", TEMPLATE))
+    assert queue.flush()
+    queue.start()
+    try:
+        assert wait_for(lambda: queue.stats["sent"] == 1)
+    finally:
+        queue.stop()
+    assert attempts == [1, 2]
+    assert queue.stats["retried"] == 1
+    assert outcomes == [True]
+    assert settled == [("a@example.com", True)]
+
+
+def test_send_fails_for_good_after_max_attempts(redis_client):
+    outcomes = []
+
+    def deliver(job):
+        raise OSError("connection refused")
+
+    queue = make_queue(
+        redis_client,
+        deliver,
+        max_attempts=2,
+        on_done=lambda job, success: outcomes.append((job["attempts"], success)),
+    )
+    queue.put(email_job("welcome_email", "a@example.com", TEMPLATE))
+    assert queue.flush()
+    queue.start()
+    try:
+        assert wait_for(lambda: queue.stats["failed"] == 1)
+    finally:
+        queue.stop()
+    assert outcomes == [(2, False)]
+    assert queue.depth() == 0
+
+
+def test_rate_limited_job_is_deferred_without_an_attempt(redis_client, delivered):
+    queue = make_queue(
+        redis_client, delivered.append, limiters={"smtp": FixedLimiter(1)}
+    )
+    queue.put(email_job("welcome_email", "a@example.com", TEMPLATE))
+    assert queue.flush()
+    queue.start()
+    try:
+        assert wait_for(lambda: queue.stats["deferred"] == 1)
+    finally:
+        queue.stop()
+    assert delivered == []
+    [raw] = redis_client.zrange(queue.delayed_key, 0, -1)
+    assert json.loads(raw)["attempts"] == 0
+
+
+def test_retry_delay_backs_off_up_to_the_maximum(redis_client):
+    queue = SendQueue(
+        redis_client, "test:outbox", bool, retry_base_s=10, retry_max_s=60
+    )
+    assert 5 <= queue.retry_delay(1) <= 10
+    assert 10 <= queue.retry_delay(2) <= 20
+    assert 30 <= queue.retry_delay(10) <= 60
+
+
+def test_recover_requeues_jobs_of_expired_owners_only(redis_client):
+    queue = make_queue(redis_client, bool)
+    job = json.dumps(email_job("order_confirmation", "a@example.com", TEMPLATE))
+    redis_client.lpush("test:outbox:processing:web-1:dead:0", job)
+    redis_client.lpush("test:outbox:processing:web-1:alive:0", job)
+    redis_client.set("test:outbox:owner:web-1:alive", "1")
+
+    assert queue.recover() == 1
+    assert redis_client.zrange(queue.delayed_key, 0, -1, withscores=True) == [
+        (job, 0.0)
+    ]
+    assert not redis_client.exists("test:outbox:processing:web-1:dead:0")
+    assert redis_client.llen("test:outbox:processing:web-1:alive:0") == 1
+
+
+def test_restarted_process_recovers_jobs_of_its_previous_run(redis_client):
+    """A restarted container keeps its hostname and pid but not its owner id"""
+    before = make_queue(redis_client, bool)
+    before._heartbeat()
+    job = json.dumps(email_job("order_confirmation", "a@example.com", TEMPLATE))
+    redis_client.lpush(before._processing_key(0), job)
+
+    after = make_queue(redis_client, bool)
+    assert after.owner != before.owner
+    assert after.recover() == 0
+    # The old run's heartbeat expires
+    redis_client.delete(f"{before.owner_prefix}:{before.owner}")
+    assert after.recover() == 1
+    assert redis_client.zcard(after.delayed_key) == 1